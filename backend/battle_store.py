@@ -0,0 +1,152 @@
+from array import array
+from typing import Dict, Iterator, List, NamedTuple, Sequence
+
+
+class Battle(NamedTuple):
+    prompt: str
+    model1: int
+    model2: int
+    score1: float
+    score2: float
+    response1: str
+    response2: str
+    explanation: str
+
+
+class BattleStore:
+    """対戦結果を整数IDの列として保持するストア
+
+    プロンプトと応答のテキストは一度だけ保存し、対戦はそのIDとモデル番号・スコアを array の列に
+    追記する。応答は（プロンプト, モデル）ごとに1つなので、長いテキストをハッシュせずに
+    プロンプトごとのモデル番号 -> テキストIDの表で引く。説明は対戦ごとに異なるが、一覧評価の
+    対戦は同じ説明を続けて共有する。プロンプトごとの対戦IDの索引を持つので、プロンプト単位の
+    集計は全対戦の走査を繰り返さずに済む。索引もPythonのintのリストではなく array で持つ。
+    書き出し済みのプロンプトは release でテキストを手放せる（対戦の整数・スコアの列は残る）。
+    """
+
+    def __init__(self, model_names: Sequence[str]):
+        self.model_names = list(model_names)
+        self.prompts: List[str] = []
+        self._prompt_ids: Dict[str, int] = {}
+        self.texts: List[str] = []  # 応答と説明
+        self._response_ids: List[array] = []  # プロンプトID -> モデル番号ごとのテキストID（未登録は-1）
+        self._last_explanation = -1
+        self._last_explanation_prompt = -1
+        self.by_prompt: List[array] = []  # プロンプトID -> 対戦ID
+
+        self.prompt_id = array("i")
+        self.model1 = array("i")
+        self.model2 = array("i")
+        self.score1 = array("f")
+        self.score2 = array("f")
+        self.response1 = array("i")
+        self.response2 = array("i")
+        self.explanation = array("i")
+
+    def __len__(self) -> int:
+        return len(self.prompt_id)
+
+    def intern_prompt(self, prompt: str) -> int:
+        prompt_id = self._prompt_ids.get(prompt)
+        if prompt_id is None:
+            prompt_id = self._prompt_ids[prompt] = len(self.prompts)
+            self.prompts.append(prompt)
+            self._response_ids.append(array("i", [-1]) * len(self.model_names))
+            self.by_prompt.append(array("i"))
+        return prompt_id
+
+    def _add_text(self, text: str) -> int:
+        self.texts.append(text)
+        return len(self.texts) - 1
+
+    def intern_response(self, prompt_id: int, model: int, response: str) -> int:
+        # 同じプロンプトへの同じモデルの応答は1つ（最初に記録したものを使う）
+        response_ids = self._response_ids[prompt_id]
+        if response_ids[model] < 0:
+            response_ids[model] = self._add_text(response)
+        return response_ids[model]
+
+    def _intern_explanation(self, prompt_id: int, explanation: str) -> int:
+        # 共有は同じプロンプトの中だけ（release でプロンプトごとにテキストを手放せるように）
+        last = self._last_explanation
+        if last < 0 or self._last_explanation_prompt != prompt_id or \
+                self.texts[last] is not explanation and self.texts[last] != explanation:
+            last = self._last_explanation = self._add_text(explanation)
+            self._last_explanation_prompt = prompt_id
+        return last
+
+    def add(self, prompt: str, model1: int, model2: int, score1: float, score2: float,
+            response1: str, response2: str, explanation: str) -> int:
+        battle_id = len(self.prompt_id)
+        prompt_id = self.intern_prompt(prompt)
+        self.prompt_id.append(prompt_id)
+        self.model1.append(model1)
+        self.model2.append(model2)
+        self.score1.append(score1)
+        self.score2.append(score2)
+        self.response1.append(self.intern_response(prompt_id, model1, response1))
+        self.response2.append(self.intern_response(prompt_id, model2, response2))
+        self.explanation.append(self._intern_explanation(prompt_id, explanation))
+        self.by_prompt[prompt_id].append(battle_id)
+        return battle_id
+
+    def release(self, prompt: str) -> None:
+        """プロンプトと、その応答・説明のテキストを手放す
+
+        対戦の整数・スコアの列（レーティングの計算に使う）は残る。手放した対戦を battle で読むと
+        テキストは None になり、同じプロンプトを再び add すると新しいプロンプトとして扱う。
+        """
+        prompt_id = self._prompt_ids.pop(prompt, None)
+        if prompt_id is None:
+            return
+        texts = self.texts
+        for battle_id in self.by_prompt[prompt_id]:
+            texts[self.response1[battle_id]] = None
+            texts[self.response2[battle_id]] = None
+            texts[self.explanation[battle_id]] = None
+        if self._last_explanation_prompt == prompt_id:
+            self._last_explanation = -1
+        self.prompts[prompt_id] = None
+        self._response_ids[prompt_id] = array("i")
+        self.by_prompt[prompt_id] = array("i")
+
+    def battle(self, battle_id: int) -> Battle:
+        texts = self.texts
+        return Battle(self.prompts[self.prompt_id[battle_id]], self.model1[battle_id], self.model2[battle_id],
+                      self.score1[battle_id], self.score2[battle_id], texts[self.response1[battle_id]],
+                      texts[self.response2[battle_id]], texts[self.explanation[battle_id]])
+
+    def __iter__(self) -> Iterator[Battle]:
+        return (self.battle(battle_id) for battle_id in range(len(self)))
+
+    def battles_for(self, prompt: str) -> Sequence[int]:
+        prompt_id = self._prompt_ids.get(prompt)
+        return () if prompt_id is None else self.by_prompt[prompt_id]
+
+    def ranked_models(self, prompt_id: int) -> List[Dict]:
+        """プロンプトの対戦から各モデルの平均スコアを求め、降順に並べる"""
+        totals: Dict[int, float] = {}
+        counts: Dict[int, int] = {}
+        responses: Dict[int, int] = {}
+        for battle_id in self.by_prompt[prompt_id]:
+            for model, score, response in ((self.model1[battle_id], self.score1[battle_id], self.response1[battle_id]),
+                                           (self.model2[battle_id], self.score2[battle_id], self.response2[battle_id])):
+                totals[model] = totals.get(model, 0.0) + score
+                counts[model] = counts.get(model, 0) + 1
+                responses[model] = response
+
+        ranked = [{
+            "model_name": self.model_names[model],
+            "avg_score": totals[model] / counts[model],
+            "response": self.texts[responses[model]]
+        } for model in sorted(totals)]
+        ranked.sort(key=lambda entry: entry["avg_score"], reverse=True)
+        return ranked
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "battles": len(self),
+            "prompts": len(self._prompt_ids),
+            "unique_texts": sum(1 for text in self.texts if text is not None),
+            "text_chars": sum(len(text) for text in self.texts if text is not None)
+        }
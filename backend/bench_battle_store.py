@@ -0,0 +1,81 @@
+"""Benchmark training-data generation: legacy tuple list rescanned per prompt vs. BattleStore.
+
+Usage: python bench_battle_store.py [prompts] [models]
+"""
+import sys
+import time
+import tracemalloc
+
+from battle_store import BattleStore
+
+
+class FakeModel:
+    def __init__(self, name: str):
+        self.name = name
+
+
+def make_battles(prompts: int, models: int):
+    # As in the arena, each model's response to a prompt is one string object shared by its
+    # battles; every verdict has its own explanation
+    for p in range(prompts):
+        prompt = f"prompt {p} " + "x" * 200
+        responses = [f"response {i} to {p} " + "y" * 800 for i in range(models)]
+        for i in range(models):
+            for j in range(i + 1, models):
+                yield (prompt, i, j, float((p + i) % 10), float((p + j) % 10),
+                       responses[i], responses[j], f"explanation {p} {i} {j} " + "z" * 300)
+
+
+def legacy_training_data(battle_results, models):
+    training_data = []
+    for prompt in set(result[-1] for result in battle_results):
+        prompt_results = [result for result in battle_results if result[-1] == prompt]
+        model_scores = {model.name: {'scores': [], 'response': ''} for model in models}
+        for model1, model2, score1, score2, response1, response2, _, _ in prompt_results:
+            model_scores[model1.name]['scores'].append(score1)
+            model_scores[model1.name]['response'] = response1
+            model_scores[model2.name]['scores'].append(score2)
+            model_scores[model2.name]['response'] = response2
+        ranked = [{'model_name': name, 'avg_score': sum(d['scores']) / len(d['scores']), 'response': d['response']}
+                  for name, d in model_scores.items() if d['scores']]
+        ranked.sort(key=lambda x: x['avg_score'], reverse=True)
+        training_data.append({'prompt': prompt, 'ranked_models': ranked})
+    return training_data
+
+
+def main():
+    prompts = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_models = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    models = [FakeModel(f"model {i}") for i in range(n_models)]
+
+    # Text is held once either way, so compare what each layout adds on top of it
+    tracemalloc.start()
+    battles = list(make_battles(prompts, n_models))
+    text_memory = tracemalloc.get_traced_memory()[0]
+    legacy = [(models[i], models[j], s1, s2, r1, r2, e, p) for p, i, j, s1, s2, r1, r2, e in battles]
+    legacy_memory = tracemalloc.get_traced_memory()[0] - text_memory
+    store = BattleStore([model.name for model in models])
+    for battle in battles:
+        store.add(*battle)
+    store_memory = tracemalloc.get_traced_memory()[0] - text_memory - legacy_memory
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    expected = legacy_training_data(legacy, models)
+    legacy_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = [{'prompt': prompt, 'ranked_models': store.ranked_models(prompt_id)}
+              for prompt_id, prompt in enumerate(store.prompts)]
+    store_time = time.perf_counter() - started
+
+    key = lambda item: item['prompt']
+    assert sorted(expected, key=key) == sorted(actual, key=key)
+    print(f"{len(store):,} battles, {prompts:,} prompts, {n_models} models")
+    print(f"{'':14}   training data   memory beyond text")
+    print(f"legacy tuples : {legacy_time:13.3f}s  {legacy_memory / 2**20:15.1f} MiB")
+    print(f"battle store  : {store_time:13.3f}s  {store_memory / 2**20:15.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Compare ranking quality against judge calls: exhaustive pairs vs adaptive matchmaking.
+
+The judge is simulated from known Bradley-Terry strengths, so the fitted ranking can be
+scored against the true one (Kendall tau) after every checkpoint of judge calls.
+
+Usage: python bench_matchmaking.py [models] [prompts] [seeds]
+"""
+import sys
+from typing import Dict, List
+
+import numpy as np
+
+from bradley_terry import BattleCells, _aggregate, fit_strengths
+from matchmaking import Matchmaker
+
+
+def kendall_tau(a: np.ndarray, b: np.ndarray) -> float:
+    upper = np.triu_indices(len(a), k=1)
+    sign_a = np.sign(a[:, None] - a[None, :])[upper]
+    sign_b = np.sign(b[:, None] - b[None, :])[upper]
+    return float((sign_a * sign_b).sum() / len(sign_a))
+
+
+class SimulatedJudge:
+    def __init__(self, true_ratings: np.ndarray, rng: np.random.Generator, tie_rate: float = 0.1):
+        self.true_ratings = true_ratings
+        self.rng = rng
+        self.tie_rate = tie_rate
+
+    def __call__(self, i: int, j: int):
+        if self.rng.random() < self.tie_rate:
+            return 6, 6
+        p = 1.0 / (1.0 + 10.0 ** ((self.true_ratings[j] - self.true_ratings[i]) / 400.0))
+        return (8, 5) if self.rng.random() < p else (5, 8)
+
+
+def fitted_tau(battles: List, n_models: int, true_ratings: np.ndarray) -> float:
+    model1, model2, score1, score2 = (np.array(column) for column in zip(*battles))
+    cells = BattleCells.from_battles(model1, model2, score1, score2, n_models)
+    return kendall_tau(fit_strengths(*_aggregate(cells, cells.counts)), true_ratings)
+
+
+def run(strategy: str, n_models: int, prompts: int, checkpoints: List[int], seed: int,
+        pairs_per_prompt: int = None) -> Dict[int, float]:
+    rng = np.random.default_rng(seed)
+    true_ratings = np.random.default_rng(1234).normal(1000, 80, n_models)
+    judge = SimulatedJudge(true_ratings, rng)
+    matchmaker = Matchmaker(n_models, pairs_per_prompt=pairs_per_prompt) if strategy == "adaptive" else None
+    all_pairs = [(i, j) for i in range(n_models) for j in range(i + 1, n_models)]
+
+    battles, results = [], {}
+    pending = sorted(checkpoints)
+    for _ in range(prompts):
+        pairs = matchmaker.select_pairs() if matchmaker else all_pairs
+        if not pairs:
+            break
+        for i, j in pairs:
+            score1, score2 = judge(i, j)
+            battles.append((i, j, score1, score2))
+            if matchmaker:
+                matchmaker.record(i, j, score1 / (score1 + score2))
+            while pending and len(battles) >= pending[0]:
+                results[pending.pop(0)] = fitted_tau(battles, n_models, true_ratings)
+        if not pending:
+            break
+    return results
+
+
+def main():
+    n_models = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    prompts = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    seeds = range(int(sys.argv[3]) if len(sys.argv) > 3 else 30)
+    pairs = n_models * (n_models - 1) // 2
+    checkpoints = [pairs * k for k in (1, 2, 4, 8, 16, 32)]
+
+    strategies = [("exhaustive", None), ("adaptive", n_models - 1), ("adaptive", n_models // 2)]
+    print(f"{n_models} models ({pairs} judge calls per prompt when exhaustive), "
+          f"Kendall tau vs. true ranking, mean of {len(seeds)} seeds")
+    header = f"{'judge calls':>12} | " + " | ".join(
+        f"{name + (f' k={k}' if k else ''):>16}" for name, k in strategies)
+    print(header)
+    print("-" * len(header))
+    table = {}
+    for name, k in strategies:
+        runs = [run(name, n_models, prompts * pairs, checkpoints, seed, k) for seed in seeds]
+        table[(name, k)] = {c: np.mean([r[c] for r in runs if c in r]) if any(c in r for r in runs) else None
+                            for c in checkpoints}
+    for checkpoint in checkpoints:
+        cells = []
+        for key in strategies:
+            value = table[key][checkpoint]
+            cells.append(f"{value:>16.3f}" if value is not None else f"{'settled':>16}")
+        print(f"{checkpoint:>12,} | " + " | ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark the MinHash/LSH near-duplicate filter on synthetic prompts.
+
+Each base prompt gets a few variants with small edits (case, punctuation, a word swapped or
+appended). Reports throughput and, against exact pairwise Jaccard on a sample, how many variants
+were dropped and how many distinct prompts were wrongly merged.
+
+Usage: python bench_near_dedupe.py [base_prompts] [variants_per_prompt] [threshold]
+"""
+import random
+import sys
+import time
+
+from near_dedupe import NearDuplicateFilter, normalize
+
+WORDS = ("solve explain prove derive compute estimate compare why how what which number prime "
+         "triangle circle probability function integral matrix graph sequence train speed water "
+         "price profit ratio angle area volume distance minimum maximum average sum product").split()
+
+
+def make_prompts(bases: int, variants: int, rng: random.Random):
+    prompts, groups = [], []
+    for group in range(bases):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(20, 60))]
+        base = " ".join(words) + f" ({group})"
+        prompts.append(base)
+        groups.append(group)
+        for _ in range(variants):
+            edited = list(words)
+            edit = rng.randrange(3)
+            if edit == 0:
+                edited[rng.randrange(len(edited))] = rng.choice(WORDS)
+            elif edit == 1:
+                edited.append(rng.choice(WORDS))
+            text = " ".join(edited) + f" ({group})"
+            prompts.append(text.upper() + "?" if edit == 2 else text)
+            groups.append(group)
+    order = list(range(len(prompts)))
+    rng.shuffle(order)
+    return [prompts[i] for i in order], [groups[i] for i in order]
+
+
+def jaccard(a: str, b: str, k: int) -> float:
+    a, b = normalize(a), normalize(b)
+    sa = {a[i:i + k] for i in range(max(1, len(a) - k + 1))}
+    sb = {b[i:i + k] for i in range(max(1, len(b) - k + 1))}
+    return len(sa & sb) / len(sa | sb)
+
+
+def main():
+    bases = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    variants = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    threshold = float(sys.argv[3]) if len(sys.argv) > 3 else 0.8
+    rng = random.Random(0)
+    prompts, groups = make_prompts(bases, variants, rng)
+    dedupe = NearDuplicateFilter(threshold=threshold)
+
+    started = time.perf_counter()
+    representatives = dedupe.representatives(prompts)
+    elapsed = time.perf_counter() - started
+    kept = int((representatives == range(len(prompts))).sum())
+    print(f"{len(prompts):,} prompts ({bases:,} bases x {variants + 1}), threshold {threshold}, "
+          f"{dedupe.bands} bands x {dedupe.rows} rows")
+    print(f"filter        : {elapsed:.2f}s ({len(prompts) / elapsed:,.0f} prompts/s), kept {kept:,}")
+
+    # Ground truth on a sample: pairs of variants whose exact Jaccard is above the threshold
+    # should be merged, and prompts from different bases should not
+    sample = rng.sample(range(len(prompts)), min(len(prompts), 3000))
+    by_group = {}
+    for i, group in enumerate(groups):
+        by_group.setdefault(group, []).append(i)
+    similar = merged = 0
+    for i in sample:
+        for j in by_group[groups[i]]:
+            if j > i and jaccard(prompts[i], prompts[j], dedupe.shingle_size) >= threshold:
+                similar += 1
+                merged += representatives[i] == representatives[j]
+    false_merges = sum(representatives[i] == representatives[j] and groups[i] != groups[j]
+                       for i, j in zip(sample, sample[1:]))
+    print(f"recall        : {merged}/{similar} sampled pairs above the threshold merged")
+    print(f"false merges  : {false_merges}/{len(sample) - 1} random cross-base pairs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark the incremental Elo engine against replaying every battle on each update.
+
+Usage: python bench_rating_engine.py [battles] [models] [chunk]
+"""
+import sys
+import time
+
+import numpy as np
+
+from rating_engine import RATING_MODE_BATCH, RATING_MODE_SEQUENTIAL, EloEngine
+
+
+def make_battles(battles: int, models: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    model1 = rng.integers(0, models, battles, dtype=np.int32)
+    model2 = (model1 + rng.integers(1, models, battles, dtype=np.int32)) % models
+    strength = np.linspace(4, 8, models)
+    score1 = np.clip(np.rint(rng.normal(strength[model1], 1.5)), 1, 10).astype(np.float32)
+    score2 = np.clip(np.rint(rng.normal(strength[model2], 1.5)), 1, 10).astype(np.float32)
+    return model1, model2, score1, score2
+
+
+def replay_all(model1, model2, score1, score2, models: int, chunk: int) -> float:
+    # The previous behaviour: every update walks the full battle list from the start
+    started = time.perf_counter()
+    ratings = [1000.0] * models
+    for end in range(chunk, len(model1) + 1, chunk):
+        for i, j, s1, s2 in zip(model1[:end].tolist(), model2[:end].tolist(),
+                                score1[:end].tolist(), score2[:end].tolist()):
+            expected = 1 / (1 + 10 ** ((ratings[j] - ratings[i]) / 400))
+            delta = 32 * (s1 / (s1 + s2) - expected)
+            ratings[i] += delta
+            ratings[j] -= delta
+    return time.perf_counter() - started
+
+
+def incremental(model1, model2, score1, score2, models: int, chunk: int, mode: str) -> float:
+    engine = EloEngine([f"model_{i}" for i in range(models)])
+    started = time.perf_counter()
+    for start in range(0, len(model1), chunk):
+        end = start + chunk
+        engine.add_battles(model1[start:end], model2[start:end], score1[start:end], score2[start:end])
+        engine.update(mode)
+        engine.snapshot()
+    elapsed = time.perf_counter() - started
+    assert engine.applied == len(model1)
+    return elapsed
+
+
+def main():
+    battles = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    models = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    chunk = int(sys.argv[3]) if len(sys.argv) > 3 else 1_000
+    data = make_battles(battles, models)
+    print(f"{battles:,} battles, {models} models, update every {chunk:,} battles")
+
+    for mode in (RATING_MODE_SEQUENTIAL, RATING_MODE_BATCH):
+        elapsed = incremental(*data, models, chunk, mode)
+        print(f"  incremental ({mode:>10}): {elapsed:8.3f}s  ({battles / elapsed:,.0f} battles/s)")
+
+    # Replaying is quadratic in the number of updates, so time it on a prefix and extrapolate
+    sample = min(battles, 50 * chunk)
+    elapsed = replay_all(*(array[:sample] for array in data), models, chunk)
+    updates, sample_updates = battles // chunk, sample // chunk
+    estimate = elapsed * (updates * (updates + 1)) / (sample_updates * (sample_updates + 1))
+    print(f"  replay all battles     : {elapsed:8.3f}s for {sample:,} battles "
+          f"(~{estimate:,.0f}s extrapolated to {battles:,})")
+
+
+if __name__ == "__main__":
+    main()
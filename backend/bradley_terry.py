@@ -0,0 +1,168 @@
+"""Bradley–Terry leaderboard with bootstrap confidence intervals.
+
+Usage: python bradley_terry.py battles.npz [rounds] [workers]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+from dataclasses import dataclass
+
+import numpy as np
+
+SCALE = 400.0  # Elo互換のスケール（10倍の強さの比 = 400点差）
+BASE_RATING = 1000.0
+
+
+@dataclass
+class BattleCells:
+    """対戦を（モデルの組, 勝ち分）ごとに集計したもの
+
+    対戦の復元抽出によるブートストラップは、セルの出現数の多項分布サンプリングと同じなので、
+    対戦数ではなくセル数に比例するコストで再標本化できる。
+    """
+    model1: np.ndarray
+    model2: np.ndarray
+    share: np.ndarray  # model1 の勝ち分（0〜1、引き分けは0.5）
+    counts: np.ndarray
+    n_models: int
+
+    @property
+    def battles(self) -> int:
+        return int(self.counts.sum())
+
+    @classmethod
+    def from_battles(cls, model1: np.ndarray, model2: np.ndarray, score1: np.ndarray,
+                     score2: np.ndarray, n_models: int) -> "BattleCells":
+        score1 = np.asarray(score1, dtype=np.float64)
+        total = score1 + score2
+        share = np.divide(score1, total, out=np.full_like(score1, 0.5), where=total > 0)
+        keys = np.stack([np.asarray(model1, dtype=np.int64), np.asarray(model2, dtype=np.int64), share], axis=1)
+        cells, counts = np.unique(keys, axis=0, return_counts=True)
+        return cls(cells[:, 0].astype(np.int32), cells[:, 1].astype(np.int32), cells[:, 2],
+                   counts.astype(np.float64), n_models)
+
+
+def _aggregate(cells: BattleCells, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # wins[i, j]: i が j から得た勝ち分の合計, games[i, j]: i と j の対戦数（対称）
+    n = cells.n_models
+    flat = cells.model1.astype(np.int64) * n + cells.model2
+    flat_t = cells.model2.astype(np.int64) * n + cells.model1
+    wins = (np.bincount(flat, weights=counts * cells.share, minlength=n * n)
+            + np.bincount(flat_t, weights=counts * (1.0 - cells.share), minlength=n * n)).reshape(n, n)
+    games = (np.bincount(flat, weights=counts, minlength=n * n)
+             + np.bincount(flat_t, weights=counts, minlength=n * n)).reshape(n, n)
+    return wins, games
+
+
+def fit_strengths(wins: np.ndarray, games: np.ndarray, prior: float = 0.1,
+                  max_iter: int = 1000, tol: float = 1e-9) -> np.ndarray:
+    """MMアルゴリズム（Hunter 2004）で強さ p を推定し、Elo互換のレーティングで返す
+
+    prior は各組に加える仮想の引き分け数で、全勝・全敗のモデルでも有限の値にする。
+    """
+    n = len(wins)
+    off_diagonal = 1.0 - np.eye(n)
+    wins = wins + prior * off_diagonal
+    games = games + 2.0 * prior * off_diagonal
+    total_wins = wins.sum(axis=1)
+    strength = np.ones(n)
+    for _ in range(max_iter):
+        denominator = (games / (strength[:, None] + strength[None, :])).sum(axis=1)
+        updated = total_wins / denominator
+        updated /= np.exp(np.log(updated).mean())
+        if np.max(np.abs(np.log(updated) - np.log(strength))) < tol:
+            strength = updated
+            break
+        strength = updated
+    return BASE_RATING + SCALE * np.log10(strength)
+
+
+def _bootstrap_chunk(cells: BattleCells, rounds: int, seed: Sequence[int], prior: float) -> np.ndarray:
+    rng = np.random.default_rng(np.random.SeedSequence(seed))
+    total = cells.battles
+    probabilities = cells.counts / total
+    ratings = np.empty((rounds, cells.n_models))
+    for r in range(rounds):
+        wins, games = _aggregate(cells, rng.multinomial(total, probabilities).astype(np.float64))
+        ratings[r] = fit_strengths(wins, games, prior)
+    return ratings
+
+
+def bootstrap(cells: BattleCells, rounds: int = 1000, workers: Optional[int] = None,
+              seed: int = 0, prior: float = 0.1) -> np.ndarray:
+    """ブートストラップの各ラウンドのレーティング (rounds x models) をプロセスプールで計算する"""
+    workers = workers or os.cpu_count() or 1
+    chunks = [len(part) for part in np.array_split(np.arange(rounds), workers) if len(part)]
+    seeds = [(seed, index) for index in range(len(chunks))]
+    if len(chunks) == 1:
+        return _bootstrap_chunk(cells, chunks[0], seeds[0], prior)
+    with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+        results = pool.map(_bootstrap_chunk, [cells] * len(chunks), chunks, seeds, [prior] * len(chunks))
+        return np.concatenate(list(results))
+
+
+def leaderboard(model_names: Sequence[str], model1: np.ndarray, model2: np.ndarray,
+                score1: np.ndarray, score2: np.ndarray, rounds: int = 1000,
+                workers: Optional[int] = None, confidence: float = 0.95,
+                seed: int = 0, prior: float = 0.1) -> List[Dict]:
+    cells = BattleCells.from_battles(model1, model2, score1, score2, len(model_names))
+    ratings = fit_strengths(*_aggregate(cells, cells.counts), prior=prior)
+    games = _aggregate(cells, cells.counts)[1].sum(axis=1)
+
+    lower = upper = None
+    # 対戦がなければ再標本化できないので、区間なしのレーティング（全員が基準値）を返す
+    if rounds > 0 and cells.battles > 0:
+        samples = bootstrap(cells, rounds, workers, seed, prior)
+        tail = (1.0 - confidence) / 2.0 * 100.0
+        lower, upper = np.percentile(samples, [tail, 100.0 - tail], axis=0)
+
+    board = []
+    for i in np.argsort(-ratings):
+        entry = {"model_name": model_names[i], "rating": float(ratings[i]), "battles": int(games[i])}
+        if lower is not None:
+            entry["ci_lower"] = float(lower[i])
+            entry["ci_upper"] = float(upper[i])
+        board.append(entry)
+    return board
+
+
+def format_entry(entry: Dict) -> str:
+    interval = f" [{entry['ci_lower']:.2f}, {entry['ci_upper']:.2f}]" if "ci_lower" in entry else ""
+    return f"{entry['model_name']}: {entry['rating']:.2f}{interval}"
+
+
+def save_battles(path: str, model_names: Sequence[str], model1: np.ndarray, model2: np.ndarray,
+                 score1: np.ndarray, score2: np.ndarray) -> None:
+    np.savez_compressed(path, model_names=np.array(list(model_names)),
+                        model1=model1, model2=model2, score1=score1, score2=score2)
+
+
+def load_battles(path: str) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # ArenaLearning.save_battles() が書き出す形式
+    data = np.load(path, allow_pickle=False)
+    return ([str(name) for name in data["model_names"]],
+            data["model1"], data["model2"], data["score1"], data["score2"])
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else "battles.npz"
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    model_names, model1, model2, score1, score2 = load_battles(path)
+
+    started = time.perf_counter()
+    board = leaderboard(model_names, model1, model2, score1, score2, rounds=rounds, workers=workers)
+    elapsed = time.perf_counter() - started
+
+    print(f"Bradley-Terry leaderboard ({len(model1):,} battles, {rounds} bootstrap rounds, {elapsed:.2f}s)")
+    for rank, entry in enumerate(board, 1):
+        interval = ""
+        if "ci_lower" in entry:
+            interval = f"  95% CI [{entry['ci_lower']:.1f}, {entry['ci_upper']:.1f}]"
+        print(f"{rank:>3}. {entry['model_name']:<30} {entry['rating']:8.1f}{interval}  ({entry['battles']:,} battles)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import asyncio
+import uuid
+from typing import Any, Dict, List, Optional
+
+from debate_manager import DebateManager
+from ws_stream import StreamSender
+
+
+SLOW_POLICY_RESYNC = "resync"  # drop the backlog, then catch up with a snapshot
+SLOW_POLICY_DROP = "drop"  # drop token frames while behind, no catch-up
+
+
+class Subscriber:
+    """1人の観戦者。送信はその接続のStreamSenderに任せ、遅い場合はトークンを読み飛ばす"""
+
+    def __init__(self, broadcast: "DebateBroadcast", sender: StreamSender,
+                 max_lag_chars: int = 32768, policy: str = SLOW_POLICY_RESYNC):
+        self.broadcast = broadcast
+        self.sender = sender
+        self.max_lag_chars = max_lag_chars
+        self.policy = policy
+        self.lagging = False
+        self.skips = 0
+
+    def offer(self, event: Dict[str, Any]):
+        sender = self.sender
+        if event["type"] == "token_stream":
+            if self.lagging:
+                if sender.queued_frames:
+                    sender.stats.dropped_tokens += 1
+                    return
+                # 追いついたのでスナップショットで現在位置に同期する
+                self.lagging = False
+                if self.policy == SLOW_POLICY_RESYNC:
+                    sender.push(self.broadcast.snapshot())
+                    return
+            if sender.backlog_chars > self.max_lag_chars:
+                sender.discard_tokens()
+                self.lagging = True
+                self.skips += 1
+                sender.stats.dropped_tokens += 1
+                return
+        elif event["type"] == "debate_ended":
+            event = dict(event, stream_stats=sender.get_stats())
+        sender.push(event)
+
+
+class DebateBroadcast:
+    """1つのディベート（プロデューサー）を複数の購読者に配信する"""
+
+    def __init__(self, debate_id: str, manager: DebateManager, stop_when_empty: bool = True):
+        self.debate_id = debate_id
+        self.manager = manager
+        self.stop_when_empty = stop_when_empty
+        self.subscribers: List[Subscriber] = []
+        self.task: Optional[asyncio.Task] = None
+        self.finished = asyncio.Event()
+        # 進行中のターンのエージェント（内容は manager.current_transcript が保持する）
+        self._current_agent: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def started_event(self) -> Dict[str, Any]:
+        manager = self.manager
+        return {
+            "type": "debate_started",
+            "debate_id": self.debate_id,
+            "topic": manager.topic,
+            "agents": {
+                "combatant_a": manager.combatant_a.model_id,
+                "combatant_b": manager.combatant_b.model_id,
+                "judge": manager.judge.model_id
+            }
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        snapshot = self.started_event()
+        snapshot["type"] = "debate_snapshot"
+        snapshot["summary"] = self.manager.get_debate_summary()
+        transcript = self.manager.current_transcript
+        snapshot["current"] = {
+            "agent": self._current_agent,
+            "content": transcript.text if transcript is not None else ""
+        } if self._current_agent else None
+        snapshot["spectators"] = len(self.subscribers)
+        return snapshot
+
+    def publish(self, event: Dict[str, Any]):
+        event_type = event["type"]
+        if event_type == "turn_start":
+            self._current_agent = event["agent"]
+        elif event_type == "turn_end":
+            self._current_agent = None
+        for subscriber in self.subscribers:
+            subscriber.offer(event)
+
+    def subscribe(self, sender: StreamSender, **options) -> Subscriber:
+        subscriber = Subscriber(self, sender, **options)
+        self.subscribers.append(subscriber)
+        # 途中参加者にはまず完了済みのターンと進行中のターンを送る
+        sender.push(self.snapshot())
+        return subscriber
+
+    async def unsubscribe(self, subscriber: Subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+        if not self.subscribers and self.stop_when_empty:
+            await self.stop()
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        try:
+            await self.manager.start_debate()
+            self.publish(self.started_event())
+            async for event in self.manager.run_debate_stream():
+                self.publish(event)
+            self.publish({
+                "type": "debate_ended",
+                "debate_id": self.debate_id,
+                "summary": self.manager.get_debate_summary()
+            })
+        except asyncio.CancelledError:
+            self.manager.stop_debate()
+            self.publish({"type": "debate_stopped", "debate_id": self.debate_id})
+            raise
+        except Exception as e:
+            self.manager.debate_state = "error"
+            self.publish({"type": "error", "message": str(e)})
+        finally:
+            self.finished.set()
+
+
+class DebateHub:
+    """ディベートIDごとのブロードキャストを管理する"""
+
+    def __init__(self, linger: float = 300.0):
+        # 終了後もこの秒数は途中参加（結果の閲覧）を受け付ける
+        self.linger = linger
+        self.debates: Dict[str, DebateBroadcast] = {}
+
+    def create(self, manager: DebateManager, debate_id: Optional[str] = None,
+               stop_when_empty: bool = True) -> DebateBroadcast:
+        debate_id = debate_id or f"debate_{uuid.uuid4().hex[:12]}"
+        broadcast = DebateBroadcast(debate_id, manager, stop_when_empty=stop_when_empty)
+        self.debates[debate_id] = broadcast
+        broadcast.start()
+        broadcast.task.add_done_callback(lambda _: self._schedule_removal(debate_id))
+        return broadcast
+
+    def get(self, debate_id: str) -> Optional[DebateBroadcast]:
+        return self.debates.get(debate_id)
+
+    def _schedule_removal(self, debate_id: str):
+        loop = asyncio.get_running_loop()
+        loop.call_later(self.linger, self.debates.pop, debate_id, None)
+
+    async def close(self):
+        for broadcast in list(self.debates.values()):
+            await broadcast.stop()
+        self.debates.clear()
+
+    def list_debates(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "debate_id": debate_id,
+                "topic": broadcast.manager.topic,
+                "state": broadcast.manager.debate_state,
+                "running": broadcast.running,
+                "spectators": len(broadcast.subscribers),
+                "turns": len(broadcast.manager.debate_history)
+            }
+            for debate_id, broadcast in self.debates.items()
+        ]
@@ -1,12 +1,18 @@
 import asyncio
+import re
 import aiohttp
 from typing import Dict, List, Optional, Tuple, AsyncGenerator
 from dataclasses import dataclass
 from enum import Enum
-import json
-import time
 from datetime import datetime
 
+from ollama_stream import ChatStream, GenerationStats, OllamaStreamError
+from transcript import TranscriptBuffer
+from history import ConversationHistory, Summarizer, compact_texts, estimate_tokens
+from model_residency import ModelResidency, TurnPlan
+from request_scheduler import PRIORITY_INTERACTIVE, RequestScheduler
+from verdicts import DEBATE_VERDICT_SCHEMA, JudgeStats, parse_debate_verdict
+
 
 class AgentRole(Enum):
     COMBATANT_A = "combatant_a"
@@ -14,6 +20,57 @@ class AgentRole(Enum):
     JUDGE = "judge"
 
 
+# 3 rounds of A/B exchanges followed by the judge's verdict
+DEBATE_ORDER = [
+    AgentRole.COMBATANT_A,
+    AgentRole.COMBATANT_B,
+    AgentRole.COMBATANT_A,
+    AgentRole.COMBATANT_B,
+    AgentRole.COMBATANT_A,
+    AgentRole.COMBATANT_B,
+    AgentRole.JUDGE
+]
+
+# Agent labels used in WebSocket messages
+AGENT_NAMES = {
+    AgentRole.COMBATANT_A: "A",
+    AgentRole.COMBATANT_B: "B",
+    AgentRole.JUDGE: "judge"
+}
+
+
+PROMPT_MODE_STABLE = "stable"
+PROMPT_MODE_LEGACY = "legacy"
+
+# How long Ollama keeps a model (and its prompt cache) loaded after a request
+DEFAULT_KEEP_ALIVE = "30m"
+
+# Tokens kept free in num_ctx besides the reply (num_predict) when deriving a history budget
+HISTORY_CONTEXT_MARGIN = 256
+
+
+def history_budget_from_options(options: Dict[str, any], num_predict: int) -> Optional[int]:
+    # Without an explicit num_ctx we don't know the window, so history is left uncapped
+    num_ctx = options.get("num_ctx")
+    if not num_ctx:
+        return None
+    budget = int(num_ctx) - int(options.get("num_predict", num_predict)) - HISTORY_CONTEXT_MARGIN
+    return max(budget, 0)
+
+
+def build_chat_payload(model_id: str, messages: List[Dict[str, str]], defaults: Dict[str, any],
+                       options: Dict[str, any], keep_alive: Optional[str]) -> Dict[str, any]:
+    payload = {
+        "model": model_id,
+        "messages": messages,
+        "stream": True,
+        "options": {**defaults, **options}
+    }
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    return payload
+
+
 @dataclass
 class DebateMetrics:
     ttft: Optional[float] = None  # Time to first token
@@ -21,6 +78,20 @@ class DebateMetrics:
     total_tokens: int = 0
     start_time: Optional[float] = None
     end_time: Optional[float] = None
+    generation: Optional[GenerationStats] = None  # Ollama's final "done" frame
+    history_tokens: int = 0  # Estimated history tokens sent with this request
+    history_tokens_saved: int = 0  # Estimated tokens removed by compaction for this request
+    load_time: Optional[float] = None  # Model load time in this turn (cold start), subtracted from ttft when the turn ends
+    queue_wait: float = 0.0  # Time spent waiting for a scheduler slot before the request was sent
+    
+    def prompt_eval_summary(self) -> Dict[str, any]:
+        # Prompt (prefill) cost reported by Ollama; a cache hit shows up as fewer evaluated tokens
+        generation = self.generation
+        return {
+            "prompt_eval_count": generation.prompt_eval_count if generation else None,
+            "prompt_eval_duration": generation.prompt_eval_duration if generation else None,
+            "load_duration": generation.load_duration if generation else None
+        }
 
 
 @dataclass
@@ -29,18 +100,44 @@ class DebateTurn:
     content: str
     metrics: DebateMetrics
     timestamp: datetime
+    transcript: Optional[TranscriptBuffer] = None  # Token timeline for replay
 
 
 class DebateAgent:
     def __init__(self, name: str, model_id: str, endpoint: str = "http://localhost:11434/api/chat", 
-                 api_key: Optional[str] = None, persona: Optional[str] = None):
+                 api_key: Optional[str] = None, persona: Optional[str] = None,
+                 session: Optional[aiohttp.ClientSession] = None,
+                 prompt_mode: str = PROMPT_MODE_STABLE, keep_alive: Optional[str] = DEFAULT_KEEP_ALIVE,
+                 options: Optional[Dict[str, any]] = None, history_budget: Optional[int] = None,
+                 summarizer: Optional[Summarizer] = None, scheduler: Optional[RequestScheduler] = None):
         self.name = name
         self.model_id = model_id
         self.endpoint = endpoint
         self.api_key = api_key
         self.persona = persona
+        self.session = session
+        # "stable": persona/topic/instructions live in a fixed system prefix and each turn only
+        # appends the opponent's latest text, so Ollama can reuse the cached prompt prefix.
+        # "legacy": the full prompt is rebuilt into a new user message every turn.
+        self.prompt_mode = prompt_mode
+        self.keep_alive = keep_alive
+        # Extra Ollama options (e.g. num_ctx, num_keep). Keep num_ctx constant across turns,
+        # changing it forces a model reload and discards the prompt cache.
+        self.options = options or {}
+        self.system_prompt: Optional[str] = None
+        # Shared request scheduler; the manager assigns the flow so debates are queued fairly
+        self.scheduler = scheduler
+        self.flow = "default"
         self.elo_score = 1000
-        self.conversation_history: List[Dict[str, str]] = []
+        # Older turns are compacted (summarized, or trimmed extractively) once the history
+        # exceeds the budget; the most recent exchanges are always sent verbatim.
+        if history_budget is None:
+            history_budget = history_budget_from_options(self.options, 3000)
+        self.history = ConversationHistory(token_budget=history_budget, summarizer=summarizer)
+    
+    @property
+    def conversation_history(self) -> List[Dict[str, str]]:
+        return self.history.messages
         
     def get_headers(self) -> Dict[str, str]:
         headers = {"Content-Type": "application/json"}
@@ -48,10 +145,40 @@ class DebateAgent:
             headers["Authorization"] = f"Bearer {self.api_key}"
         return headers
     
+    def build_system_prompt(self, topic: str) -> str:
+        # ディベート中は変化しない接頭辞（ペルソナ・トピック・指示）
+        is_japanese = any(ord(char) > 0x3000 for char in topic)
+        
+        if is_japanese:
+            return f"""あなたは次のトピックについてディベートに参加しています: "{topic}"
+
+{self.persona if self.persona else ""}
+
+明確で、論理的で、説得力のある議論を展開してください。
+相手の発言が示されたら、相手のポイントに直接対処し、あなた自身の視点を提示してください。
+毎回2-3段落で応答してください。"""
+        return f"""You are participating in a debate on the topic: "{topic}"
+
+{self.persona if self.persona else ""}
+
+Be clear, logical, and persuasive.
+When you are shown your opponent's statement, address their points directly and present your own perspective.
+Make each response 2-3 paragraphs."""
+    
     def build_prompt(self, topic: str, opponent_response: Optional[str] = None, is_opening: bool = False) -> str:
         # 日本語を検出（簡易的な方法）
         is_japanese = any(ord(char) > 0x3000 for char in topic)
         
+        if self.prompt_mode == PROMPT_MODE_STABLE:
+            if self.system_prompt is None:
+                self.system_prompt = self.build_system_prompt(topic)
+            # ターンごとに追加するのは相手の最新の発言のみ
+            if is_opening:
+                return "開始の議論を提供してください。" if is_japanese else "Please provide your opening argument."
+            if is_japanese:
+                return f"相手は次のように言いました:\n{opponent_response}"
+            return f"Your opponent just said:\n{opponent_response}"
+        
         if is_japanese:
             if is_opening:
                 prompt = f"""あなたは次のトピックについてディベートに参加しています: "{topic}"
@@ -91,68 +218,73 @@ Make your response in 2-3 paragraphs."""
         
         return prompt
     
-    async def generate_response_stream(self, session: aiohttp.ClientSession, prompt: str, 
-                                      role: str = "user") -> AsyncGenerator[Tuple[str, DebateMetrics], None]:
+    async def generate_response_stream(self, session: Optional[aiohttp.ClientSession], prompt: str, 
+                                      role: str = "user",
+                                      transcript: Optional[TranscriptBuffer] = None) -> AsyncGenerator[Tuple[str, DebateMetrics], None]:
+        session = session or self.session
         metrics = DebateMetrics()
-        metrics.start_time = time.perf_counter()
-        first_token = True
         
-        messages = self.conversation_history + [{"role": role, "content": prompt}]
+        reserve = estimate_tokens(prompt)
+        if self.prompt_mode == PROMPT_MODE_STABLE and self.system_prompt:
+            reserve += estimate_tokens(self.system_prompt)
+        compaction = await self.history.fit(reserve)
+        metrics.history_tokens = compaction.tokens_after
+        metrics.history_tokens_saved = compaction.tokens_saved
+        
+        messages = self.history.messages + [{"role": role, "content": prompt}]
+        if self.prompt_mode == PROMPT_MODE_STABLE and self.system_prompt:
+            messages = [{"role": "system", "content": self.system_prompt}] + messages
         
-        async with session.post(
-            url=self.endpoint,
+        stream = ChatStream(
+            session,
+            self.endpoint,
+            build_chat_payload(self.model_id, messages, {"temperature": 0.7, "num_predict": 3000},
+                               self.options, self.keep_alive),
             headers=self.get_headers(),
-            json={
-                "model": self.model_id,
-                "messages": messages,
-                "stream": True,
-                "options": {
-                    "temperature": 0.7,
-                    "num_predict": 3000
-                }
-            }
-        ) as response:
-            full_content = ""
-            async for line in response.content:
-                if line:
-                    line_str = line.decode('utf-8').strip()
-                    # Ollama streams JSON directly without "data: " prefix
-                    try:
-                        data = json.loads(line_str)
-                        # Ollama API format - each message contains a single token
-                        if 'message' in data and not data.get('done', False):
-                            message = data['message']
-                            if 'content' in message:
-                                token = message['content']
-                                
-                                if token:
-                                    if first_token:
-                                        metrics.ttft = time.perf_counter() - metrics.start_time
-                                        first_token = False
-                                    full_content += token
-                                    metrics.total_tokens += 1
-                                    
-                                    current_time = time.perf_counter()
-                                    elapsed = current_time - metrics.start_time
-                                    if elapsed > 0:
-                                        metrics.tps = metrics.total_tokens / elapsed
-                                    
-                                    yield token, metrics
-                    except json.JSONDecodeError:
-                        continue
-            
-            metrics.end_time = time.perf_counter()
-            self.conversation_history.append({"role": "user", "content": prompt})
-            self.conversation_history.append({"role": "assistant", "content": full_content})
+            metrics=metrics,
+            scheduler=self.scheduler,
+            priority=PRIORITY_INTERACTIVE,
+            flow=self.flow
+        )
+        # Tokens are stored once in the turn transcript and joined only when needed
+        if transcript is None:
+            transcript = TranscriptBuffer(metrics.start_time)
+        async for token in stream:
+            transcript.append(token)
+            yield token, metrics
+        
+        metrics.queue_wait = stream.queue_wait
+        metrics.generation = stream.stats
+        self.history.append("user", prompt)
+        self.history.append("assistant", transcript.text)
 
 
 class JudgeAgent:
     def __init__(self, name: str, model_id: str, endpoint: str = "http://localhost:11434/api/chat",
-                 api_key: Optional[str] = None):
+                 api_key: Optional[str] = None, session: Optional[aiohttp.ClientSession] = None,
+                 keep_alive: Optional[str] = DEFAULT_KEEP_ALIVE, options: Optional[Dict[str, any]] = None,
+                 token_budget: Optional[int] = None, scheduler: Optional[RequestScheduler] = None,
+                 structured_verdict: bool = True, verdict_retries: int = 2):
         self.name = name
         self.model_id = model_id
         self.endpoint = endpoint
         self.api_key = api_key
+        self.session = session
+        self.keep_alive = keep_alive
+        self.options = options or {}
+        # Budget for the transcript embedded in the evaluation prompt; each agent's final
+        # turn stays verbatim and earlier turns are trimmed extractively when it is exceeded.
+        if token_budget is None:
+            token_budget = history_budget_from_options(self.options, 5000)
+        self.token_budget = token_budget
+        self.scheduler = scheduler
+        self.flow = "default"
+        # When the streamed evaluation has no parseable scores, ask once more for a short
+        # schema-constrained JSON verdict (retried at most verdict_retries times)
+        self.structured_verdict = structured_verdict
+        self.verdict_retries = verdict_retries
+        self.last_verdict: Optional[Dict[str, any]] = None
+        self.stats = JudgeStats()
     
     def get_headers(self) -> Dict[str, str]:
         headers = {"Content-Type": "application/json"}
@@ -160,20 +292,26 @@ class JudgeAgent:
             headers["Authorization"] = f"Bearer {self.api_key}"
         return headers
     
-    async def evaluate_debate_stream(self, session: aiohttp.ClientSession, topic: str, 
-                                    debate_history: List[DebateTurn]) -> AsyncGenerator[Tuple[str, DebateMetrics], None]:
+    async def evaluate_debate_stream(self, session: Optional[aiohttp.ClientSession], topic: str, 
+                                    debate_history: List[DebateTurn],
+                                    transcript: Optional[TranscriptBuffer] = None) -> AsyncGenerator[Tuple[str, DebateMetrics], None]:
+        session = session or self.session
         metrics = DebateMetrics()
-        metrics.start_time = time.perf_counter()
-        first_token = True
         
         # 日本語を検出（簡易的な方法）
         is_japanese = any(ord(char) > 0x3000 for char in topic)
         
+        contents = [turn.content for turn in debate_history]
+        if self.token_budget is not None:
+            contents, saved = compact_texts(contents, self.token_budget)
+            metrics.history_tokens_saved = saved
+        metrics.history_tokens = sum(estimate_tokens(content) for content in contents)
+        
         if is_japanese:
             debate_text = f"トピック: {topic}\n\n"
-            for turn in debate_history:
+            for turn, content in zip(debate_history, contents):
                 agent_name = "エージェントA" if turn.agent == AgentRole.COMBATANT_A else "エージェントB"
-                debate_text += f"{agent_name}:\n{turn.content}\n\n"
+                debate_text += f"{agent_name}:\n{content}\n\n"
             
             evaluation_prompt = f"""あなたは2つのエージェント間のディベートを評価する公平な審判です。
 
@@ -195,9 +333,9 @@ class JudgeAgent:
 明確なセクションでレスポンスをフォーマットし、スコアの詳細な理由を提供してください。"""
         else:
             debate_text = f"Topic: {topic}\n\n"
-            for turn in debate_history:
+            for turn, content in zip(debate_history, contents):
                 agent_name = "Agent A" if turn.agent == AgentRole.COMBATANT_A else "Agent B"
-                debate_text += f"{agent_name}:\n{turn.content}\n\n"
+                debate_text += f"{agent_name}:\n{content}\n\n"
             
             evaluation_prompt = f"""You are an impartial judge evaluating a debate between two agents.
 
@@ -218,93 +356,93 @@ Finally, provide your verdict with scores:
 
 Format your response with clear sections and provide detailed reasoning for your scores."""
         
-        async with session.post(
-            url=self.endpoint,
+        stream = ChatStream(
+            session,
+            self.endpoint,
+            build_chat_payload(self.model_id, [{"role": "user", "content": evaluation_prompt}],
+                               {"temperature": 0.3, "num_predict": 5000}, self.options, self.keep_alive),
             headers=self.get_headers(),
-            json={
-                "model": self.model_id,
-                "messages": [{"role": "user", "content": evaluation_prompt}],
-                "stream": True,
-                "options": {
-                    "temperature": 0.3,
-                    "num_predict": 5000
-                }
-            }
-        ) as response:
-            full_content = ""
-            async for line in response.content:
-                if line:
-                    line_str = line.decode('utf-8').strip()
-                    # Ollama streams JSON directly without "data: " prefix
-                    try:
-                        data = json.loads(line_str)
-                        # Ollama API format - each message contains a single token
-                        if 'message' in data and not data.get('done', False):
-                            message = data['message']
-                            if 'content' in message:
-                                token = message['content']
-                                
-                                if token:
-                                    if first_token:
-                                        metrics.ttft = time.perf_counter() - metrics.start_time
-                                        first_token = False
-                                    full_content += token
-                                    metrics.total_tokens += 1
-                                    
-                                    current_time = time.perf_counter()
-                                    elapsed = current_time - metrics.start_time
-                                    if elapsed > 0:
-                                        metrics.tps = metrics.total_tokens / elapsed
-                                    
-                                    yield token, metrics
-                    except json.JSONDecodeError:
-                        continue
-            
-            metrics.end_time = time.perf_counter()
-            
-            # Parse scores from the evaluation
-            self._parse_scores(full_content)
+            metrics=metrics,
+            scheduler=self.scheduler,
+            priority=PRIORITY_INTERACTIVE,
+            flow=self.flow
+        )
+        if transcript is None:
+            transcript = TranscriptBuffer(metrics.start_time)
+        async for token in stream:
+            transcript.append(token)
+            yield token, metrics
+        
+        metrics.queue_wait = stream.queue_wait
+        metrics.generation = stream.stats
+        
+        # Parse scores from the evaluation
+        self.stats.calls += 1
+        verdict = self._parse_scores(transcript.text)
+        if "agent_a_score" in verdict and "agent_b_score" in verdict:
+            self.stats.verdicts += 1
+        else:
+            self.stats.parse_failures += 1
+            if self.structured_verdict:
+                verdict = await self._structured_verdict(session, transcript.text) or verdict
+        self.last_verdict = verdict or None
+    
+    async def _structured_verdict(self, session: aiohttp.ClientSession, evaluation: str) -> Optional[Dict[str, any]]:
+        prompt = ("Here is a judge's evaluation of a debate between Agent A and Agent B.\n\n"
+                  f"{evaluation}\n\n"
+                  "Extract the verdict. Reply with JSON only: "
+                  '{"score_a": <1-10>, "score_b": <1-10>, "winner": "A" | "B" | "tie", "reason": "<one sentence>"}')
+        payload = build_chat_payload(self.model_id, [{"role": "user", "content": prompt}],
+                                     {"temperature": 0.0, "num_predict": 128}, {}, self.keep_alive)
+        payload["format"] = DEBATE_VERDICT_SCHEMA
+        for attempt in range(self.verdict_retries + 1):
+            if attempt:
+                self.stats.retries += 1
+            self.stats.calls += 1
+            stream = ChatStream(session, self.endpoint, payload, headers=self.get_headers(),
+                                scheduler=self.scheduler, priority=PRIORITY_INTERACTIVE, flow=self.flow)
+            try:
+                text = await stream.collect()
+            except (aiohttp.ClientError, OllamaStreamError) as error:
+                # The evaluation has already been streamed, so a failed follow-up only loses the scores
+                self.stats.request_errors += 1
+                print(f"Warning: Verdict request failed (attempt {attempt + 1}/{self.verdict_retries + 1}): {error}")
+                continue
+            verdict = parse_debate_verdict(text)
+            if verdict is not None:
+                self.stats.verdicts += 1
+                return verdict
+            self.stats.parse_failures += 1
+        self.stats.failed += 1
+        return None
     
     def _parse_scores(self, evaluation: str) -> Dict[str, any]:
+        # 英語と日本語の両方のパターンをチェック。見つからない項目は含めない（仮の点数は付けない）
         scores = {}
-        try:
-            # 英語と日本語の両方のパターンをチェック
-            if "Agent A Score:" in evaluation or "エージェントAスコア:" in evaluation:
-                if "Agent A Score:" in evaluation:
-                    score_a_start = evaluation.index("Agent A Score:") + len("Agent A Score:")
-                else:
-                    score_a_start = evaluation.index("エージェントAスコア:") + len("エージェントAスコア:")
-                score_a = int(evaluation[score_a_start:score_a_start+5].strip().split()[0])
-                scores["agent_a_score"] = score_a
-            
-            if "Agent B Score:" in evaluation or "エージェントBスコア:" in evaluation:
-                if "Agent B Score:" in evaluation:
-                    score_b_start = evaluation.index("Agent B Score:") + len("Agent B Score:")
-                else:
-                    score_b_start = evaluation.index("エージェントBスコア:") + len("エージェントBスコア:")
-                score_b = int(evaluation[score_b_start:score_b_start+5].strip().split()[0])
-                scores["agent_b_score"] = score_b
-            
-            if "Winner:" in evaluation or "勝者:" in evaluation:
-                if "Winner:" in evaluation:
-                    winner_start = evaluation.index("Winner:") + len("Winner:")
-                else:
-                    winner_start = evaluation.index("勝者:") + len("勝者:")
-                winner_text = evaluation[winner_start:winner_start+30].strip().lower()
-                if "agent a" in winner_text or "エージェントa" in winner_text:
-                    scores["winner"] = "agent_a"
-                elif "agent b" in winner_text or "エージェントb" in winner_text:
-                    scores["winner"] = "agent_b"
-                else:
-                    scores["winner"] = "tie"
-        except:
-            scores = {"agent_a_score": 5, "agent_b_score": 5, "winner": "tie"}
+        for key, pattern in (("agent_a_score", r"(?:Agent A Score|エージェントAスコア)\s*[:：]\s*\**\s*(\d+)"),
+                             ("agent_b_score", r"(?:Agent B Score|エージェントBスコア)\s*[:：]\s*\**\s*(\d+)")):
+            match = re.search(pattern, evaluation)
+            if match:
+                scores[key] = int(match.group(1))
+        
+        match = re.search(r"(?:Winner|勝者)\s*[:：]\s*\**\s*(.{0,30})", evaluation)
+        if match:
+            winner_text = match.group(1).strip().lower()
+            if "agent a" in winner_text or "エージェントa" in winner_text:
+                scores["winner"] = "agent_a"
+            elif "agent b" in winner_text or "エージェントb" in winner_text:
+                scores["winner"] = "agent_b"
+            else:
+                scores["winner"] = "tie"
         
         return scores
 
 
 class DebateManager:
-    def __init__(self, topic: str, combatant_a: DebateAgent, combatant_b: DebateAgent, judge: JudgeAgent):
+    def __init__(self, topic: str, combatant_a: DebateAgent, combatant_b: DebateAgent, judge: JudgeAgent,
+                 session: Optional[aiohttp.ClientSession] = None,
+                 residency: Optional[ModelResidency] = None,
+                 scheduler: Optional[RequestScheduler] = None):
         self.topic = topic
         self.combatant_a = combatant_a
         self.combatant_b = combatant_b
@@ -313,26 +451,143 @@ class DebateManager:
         self.current_turn = 0
         self.max_turns = 3  # Each agent speaks 3 times
         self.debate_state = "not_started"
-        self.session: Optional[aiohttp.ClientSession] = None
+        self.current_transcript: Optional[TranscriptBuffer] = None
+        self.last_turn_metrics: Optional[DebateMetrics] = None
+        # Injected sessions are owned by the caller (app-wide pool) and never closed here
+        self.session: Optional[aiohttp.ClientSession] = session
+        self._owns_session = False
+        # Preloads the debate's models and plans evictions when they don't all fit in memory
+        self.residency = residency
+        self.turn_plans: List[TurnPlan] = []
+        self._warmup_task: Optional[asyncio.Task] = None
+        self._prefetch_task: Optional[asyncio.Task] = None
+        # All of this debate's requests share one scheduler flow
+        self.flow = f"debate_{id(self):x}"
+        for agent in (combatant_a, combatant_b, judge):
+            if agent.session is None:
+                agent.session = session
+            if agent.scheduler is None:
+                agent.scheduler = scheduler
+            agent.flow = self.flow
+    
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+            self._owns_session = True
+        return self.session
     
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
+        self._ensure_session()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
+        if self.session and self._owns_session:
             await self.session.close()
+            self.session = None
+            self._owns_session = False
     
     async def start_debate(self):
         self.debate_state = "in_progress"
         self.current_turn = 0
+        if self.residency is not None:
+            # Only the first turn's model is loaded up front (the first turn waits for it); the others
+            # are prefetched by the residency plan during the turn before theirs (see _prepare_turn)
+            self._warmup_task = asyncio.create_task(self.residency.warm_up(self.model_sequence()[:1]))
+    
+    def stop_debate(self):
+        if self.debate_state not in ("completed",):
+            self.debate_state = "stopped"
+        for task in (self._warmup_task, self._prefetch_task):
+            if task is not None and not task.done():
+                task.cancel()
+    
+    def model_for(self, agent_role: AgentRole) -> str:
+        if agent_role == AgentRole.JUDGE:
+            return self.judge.model_id
+        agent = self.combatant_a if agent_role == AgentRole.COMBATANT_A else self.combatant_b
+        return agent.model_id
+    
+    def model_sequence(self) -> List[str]:
+        return [self.model_for(agent_role) for agent_role in DEBATE_ORDER]
+    
+    async def _warm_up_models(self) -> Optional[Dict[str, any]]:
+        if self._warmup_task is None:
+            return None
+        warmed = await self._warmup_task
+        self._warmup_task = None
+        self.turn_plans = self.residency.plan(self.model_sequence())
+        return {
+            "type": "models_warmed",
+            "models": {
+                model_id: {
+                    "load_duration": result.load_duration,
+                    "wall_time": result.wall_time,
+                    "error": result.error
+                } for model_id, result in warmed.items()
+            },
+            "planned_loads": sum(1 for plan in self.turn_plans if plan.load or plan.prefetch)
+        }
+    
+    async def _prepare_turn(self, turn_index: int):
+        # Wait for the model prefetched during the previous turn, then apply this turn's plan
+        if self._prefetch_task is not None:
+            await self._prefetch_task
+            self._prefetch_task = None
+        if turn_index < len(self.turn_plans):
+            self._prefetch_task = await self.residency.prepare_turn(self.turn_plans[turn_index])
+    
+    def _record_residency(self, agent_role: AgentRole) -> Optional[Dict[str, any]]:
+        metrics = self.last_turn_metrics
+        if self.residency is None or metrics is None:
+            return None
+        model_id = self.model_for(agent_role)
+        cold = self.residency.record_turn(model_id, metrics.generation)
+        metrics.load_time = metrics.generation.load_duration if cold else 0.0
+        if metrics.ttft is not None:
+            # Ollama only reports the load time in its final frame, so live token metrics still include it
+            metrics.ttft = max(0.0, metrics.ttft - metrics.load_time)
+        return {"model": model_id, "cold": cold, "load_time": metrics.load_time}
+    
+    async def run_debate_stream(self) -> AsyncGenerator[Dict[str, any], None]:
+        warmed = await self._warm_up_models()
+        if warmed is not None:
+            yield warmed
+        for turn_index, agent_role in enumerate(DEBATE_ORDER):
+            agent_name = AGENT_NAMES[agent_role]
+            if self.residency is not None:
+                await self._prepare_turn(turn_index)
+            yield {"type": "turn_start", "agent": agent_name}
+            async for chunk in self.process_turn_stream(agent_role):
+                yield chunk
+            residency = self._record_residency(agent_role)
+            turn_end = {
+                "type": "turn_end",
+                "agent": agent_name,
+                "prompt_eval": self.last_turn_metrics.prompt_eval_summary() if self.last_turn_metrics else None,
+                "history": {
+                    "tokens": self.last_turn_metrics.history_tokens,
+                    "tokens_saved": self.last_turn_metrics.history_tokens_saved
+                } if self.last_turn_metrics else None,
+                "residency": residency
+            }
+            if agent_role == AgentRole.JUDGE:
+                # Parsed scores/winner (None when neither the text nor the JSON fallback yielded any)
+                turn_end["verdict"] = self.judge.last_verdict
+            yield turn_end
+        self.debate_state = "completed"
     
     async def process_turn_stream(self, agent_role: AgentRole) -> AsyncGenerator[Dict[str, any], None]:
-        if not self.session:
-            self.session = aiohttp.ClientSession()
+        self._ensure_session()
+        
+        # The in-progress turn's tokens live only in this buffer (also used for spectator snapshots)
+        transcript = TranscriptBuffer()
+        self.current_transcript = transcript
+        self.last_turn_metrics = None
         
         if agent_role == AgentRole.JUDGE:
-            async for token, metrics in self.judge.evaluate_debate_stream(self.session, self.topic, self.debate_history):
+            async for token, metrics in self.judge.evaluate_debate_stream(self.session, self.topic, self.debate_history,
+                                                                          transcript=transcript):
+                self.last_turn_metrics = metrics
                 yield {
                     "type": "token_stream",
                     "agent": "judge",
@@ -355,12 +610,11 @@ class DebateManager:
             opponent_response = opponent_responses[-1].content if opponent_responses else None
             
             prompt = agent.build_prompt(self.topic, opponent_response, is_opening)
-            full_content = ""
             turn_metrics = DebateMetrics()
             
-            async for token, metrics in agent.generate_response_stream(self.session, prompt):
-                full_content += token
+            async for token, metrics in agent.generate_response_stream(self.session, prompt, transcript=transcript):
                 turn_metrics = metrics
+                self.last_turn_metrics = metrics
                 yield {
                     "type": "token_stream",
                     "agent": "A" if agent_role == AgentRole.COMBATANT_A else "B",
@@ -375,9 +629,10 @@ class DebateManager:
             # Save the turn to history
             self.debate_history.append(DebateTurn(
                 agent=agent_role,
-                content=full_content,
+                content=transcript.text,
                 metrics=turn_metrics,
-                timestamp=datetime.now()
+                timestamp=datetime.now(),
+                transcript=transcript
             ))
             
             self.current_turn += 1
@@ -398,6 +653,12 @@ class DebateManager:
         
         return new_elo_a, new_elo_b
     
+    def get_turn_timeline(self, turn_index: int) -> Dict[str, any]:
+        turn = self.debate_history[turn_index]
+        timeline = turn.transcript.to_dict() if turn.transcript else {"offsets": [], "timestamps": []}
+        timeline["agent"] = turn.agent.value
+        return timeline
+    
     def get_debate_summary(self) -> Dict[str, any]:
         return {
             "topic": self.topic,
@@ -421,7 +682,12 @@ class DebateManager:
                     "metrics": {
                         "ttft": turn.metrics.ttft,
                         "tps": turn.metrics.tps,
-                        "total_tokens": turn.metrics.total_tokens
+                        "total_tokens": turn.metrics.total_tokens,
+                        "history_tokens": turn.metrics.history_tokens,
+                        "history_tokens_saved": turn.metrics.history_tokens_saved,
+                        "load_time": turn.metrics.load_time,
+                        "queue_wait": turn.metrics.queue_wait,
+                        **turn.metrics.prompt_eval_summary()
                     }
                 } for turn in self.debate_history
             ]
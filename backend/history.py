@@ -0,0 +1,178 @@
+import re
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+
+import aiohttp
+
+from ollama_stream import ChatStream, OllamaStreamError
+from request_scheduler import PRIORITY_INTERACTIVE, RequestScheduler
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?。！？])\s*")
+
+
+def estimate_tokens(text: str) -> int:
+    # トークナイザーを使わない概算: CJKは1文字≒1トークン、それ以外は4文字≒1トークン
+    if not text:
+        return 0
+    cjk = sum(1 for char in text if ord(char) > 0x3000)
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def extractive_trim(text: str, max_tokens: int) -> str:
+    """先頭の文を優先しつつ最後の1文も残し、max_tokens 以内に切り詰める"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    sentences = [sentence for sentence in _SENTENCE_END.split(text.strip()) if sentence]
+    if len(sentences) <= 1:
+        # 文に分割できない場合は文字数で切る（概算トークン数から逆算）
+        chars_per_token = len(text) / estimate_tokens(text)
+        return text[:max(1, int(max_tokens * chars_per_token))] + " […]"
+
+    last = sentences[-1]
+    budget = max_tokens - estimate_tokens(last)
+    kept: List[str] = []
+    for sentence in sentences[:-1]:
+        cost = estimate_tokens(sentence)
+        if cost > budget:
+            break
+        kept.append(sentence)
+        budget -= cost
+    if not kept:
+        return extractive_trim(sentences[0], max_tokens)
+    return " ".join(kept) + " […] " + last
+
+
+def compact_texts(texts: List[str], token_budget: int, keep_recent: int = 2,
+                  compacted_tokens: int = 200) -> Tuple[List[str], int]:
+    """直近 keep_recent 件以外を古い順に抽出的に切り詰め、予算内に収める。(結果, 削減トークン数) を返す"""
+    tokens = [estimate_tokens(text) for text in texts]
+    total = sum(tokens)
+    result = list(texts)
+    for index in range(max(0, len(texts) - keep_recent)):
+        if total <= token_budget:
+            break
+        trimmed = extractive_trim(result[index], compacted_tokens)
+        trimmed_tokens = estimate_tokens(trimmed)
+        if trimmed_tokens < tokens[index]:
+            total -= tokens[index] - trimmed_tokens
+            result[index] = trimmed
+    return result, sum(tokens) - total
+
+
+Summarizer = Callable[[str, int], Awaitable[str]]
+
+
+class OllamaSummarizer:
+    """要約モデルで古い発言を圧縮する（失敗時は抽出的な切り詰めにフォールバックする）"""
+
+    def __init__(self, session: aiohttp.ClientSession, model_id: str,
+                 endpoint: str = "http://localhost:11434/api/chat", keep_alive: Optional[str] = None,
+                 scheduler: Optional[RequestScheduler] = None):
+        self.session = session
+        self.model_id = model_id
+        self.endpoint = endpoint
+        self.keep_alive = keep_alive
+        self.scheduler = scheduler
+
+    async def __call__(self, text: str, max_tokens: int) -> str:
+        payload = {
+            "model": self.model_id,
+            "messages": [
+                {"role": "system", "content": "Summarize the user's debate statement. Keep its key claims "
+                                              "and evidence, drop rhetoric. Reply in the statement's language."},
+                {"role": "user", "content": text}
+            ],
+            "stream": True,
+            "options": {"temperature": 0.0, "num_predict": max_tokens}
+        }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        stream = ChatStream(self.session, self.endpoint, payload,
+                            scheduler=self.scheduler, priority=PRIORITY_INTERACTIVE)
+        return (await stream.collect()).strip()
+
+
+@dataclass
+class CompactionResult:
+    tokens_before: int = 0
+    tokens_after: int = 0
+    compacted_messages: int = 0
+    dropped_messages: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+class ConversationHistory:
+    """トークン予算付きの会話履歴。直近のメッセージは原文のまま残し、古いものから圧縮する
+
+    一度圧縮したメッセージは以後変更しないため、圧縮が起きない限りプロンプト接頭辞は安定する。
+    """
+
+    def __init__(self, token_budget: Optional[int] = None, keep_recent: int = 4,
+                 compacted_tokens: int = 120, summarizer: Optional[Summarizer] = None):
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.compacted_tokens = compacted_tokens
+        self.summarizer = summarizer
+        self.messages: List[Dict[str, str]] = []
+        self._tokens: List[int] = []
+        self._compacted: List[bool] = []
+        self.total_saved = 0
+
+    def append(self, role: str, content: str):
+        self.messages.append({"role": role, "content": content})
+        self._tokens.append(estimate_tokens(content))
+        self._compacted.append(False)
+
+    @property
+    def tokens(self) -> int:
+        return sum(self._tokens)
+
+    async def _compact_text(self, text: str) -> str:
+        if self.summarizer is not None:
+            try:
+                summary = await self.summarizer(text, self.compacted_tokens)
+                if summary and estimate_tokens(summary) < estimate_tokens(text):
+                    return summary
+            except (aiohttp.ClientError, OSError, ValueError, OllamaStreamError):
+                pass
+        return extractive_trim(text, self.compacted_tokens)
+
+    async def fit(self, reserve_tokens: int = 0) -> CompactionResult:
+        # 次のリクエストで追加されるプロンプト分（reserve_tokens）を見込んで予算内に収める
+        result = CompactionResult(tokens_before=self.tokens)
+        result.tokens_after = result.tokens_before
+        if self.token_budget is None:
+            return result
+
+        budget = self.token_budget - reserve_tokens
+        current = result.tokens_before
+        protected = max(0, len(self.messages) - self.keep_recent)
+        for index in range(protected):
+            if current <= budget:
+                break
+            if self._compacted[index]:
+                continue
+            compacted = await self._compact_text(self.messages[index]["content"])
+            tokens = estimate_tokens(compacted)
+            self._compacted[index] = True
+            if tokens >= self._tokens[index]:
+                continue
+            self.messages[index] = {"role": self.messages[index]["role"], "content": compacted}
+            current -= self._tokens[index] - tokens
+            self._tokens[index] = tokens
+            result.compacted_messages += 1
+
+        # それでも溢れる場合は古いメッセージを user/assistant の組で捨てる
+        while current > budget and len(self.messages) > self.keep_recent:
+            drop = min(2, len(self.messages) - self.keep_recent)
+            current -= sum(self._tokens[:drop])
+            del self.messages[:drop], self._tokens[:drop], self._compacted[:drop]
+            result.dropped_messages += drop
+
+        result.tokens_after = current
+        self.total_saved += result.tokens_saved
+        return result
@@ -0,0 +1,114 @@
+import asyncio
+import aiohttp
+from typing import Any, Dict, Optional
+from dataclasses import dataclass, asdict
+
+
+@dataclass
+class PoolStats:
+    requests_started: int = 0
+    requests_finished: int = 0
+    requests_failed: int = 0
+    connections_created: int = 0
+    connections_reused: int = 0
+    dns_cache_hits: int = 0
+    dns_cache_misses: int = 0
+
+    @property
+    def reuse_rate(self) -> float:
+        acquired = self.connections_created + self.connections_reused
+        return self.connections_reused / acquired if acquired else 0.0
+
+
+class SharedHTTPClient:
+    """アプリ全体で共有するaiohttpセッション（コネクションプール付き）"""
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 16,
+                 keepalive_timeout: float = 60.0, dns_ttl: int = 300,
+                 total_timeout: Optional[float] = None, connect_timeout: float = 10.0):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        # ストリーミング応答は長時間続くため、全体タイムアウトはデフォルトで無効
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, sock_connect=connect_timeout)
+        self.stats = PoolStats()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = asyncio.Lock()
+
+    def _build_trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        stats = self.stats
+
+        async def on_request_start(session, ctx, params):
+            stats.requests_started += 1
+
+        async def on_request_end(session, ctx, params):
+            stats.requests_finished += 1
+
+        async def on_request_exception(session, ctx, params):
+            stats.requests_failed += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            stats.connections_created += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            stats.connections_reused += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            stats.dns_cache_hits += 1
+
+        async def on_dns_cache_miss(session, ctx, params):
+            stats.dns_cache_misses += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace_config
+
+    async def start(self) -> aiohttp.ClientSession:
+        async with self._lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    keepalive_timeout=self.keepalive_timeout,
+                    use_dns_cache=True,
+                    ttl_dns_cache=self.dns_ttl,
+                )
+                self._session = aiohttp.ClientSession(
+                    connector=connector,
+                    timeout=self.timeout,
+                    trace_configs=[self._build_trace_config()],
+                )
+            return self._session
+
+    async def close(self):
+        async with self._lock:
+            if self._session and not self._session.closed:
+                await self._session.close()
+            self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            raise RuntimeError("SharedHTTPClient is not started")
+        return self._session
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None and not self._session.closed
+
+    def get_stats(self) -> Dict[str, Any]:
+        data = asdict(self.stats)
+        data["reuse_rate"] = self.stats.reuse_rate
+        data["in_flight"] = self.stats.requests_started - self.stats.requests_finished - self.stats.requests_failed
+        data["limit"] = self.limit
+        data["limit_per_host"] = self.limit_per_host
+        data["keepalive_timeout"] = self.keepalive_timeout
+        data["dns_ttl"] = self.dns_ttl
+        return data
@@ -1,11 +1,55 @@
 import asyncio
 import aiohttp
-from typing import List, Dict, Tuple
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Iterable, List, Dict, Optional, Sequence, Set, Sized, Tuple, Union
+import itertools
+import math
+import random
 import re
 import json
+import os
+import sys
 import time
+import numpy as np
 import yaml
-from datasets import load_dataset
+
+from ollama_stream import ChatStream, OllamaStreamError
+from request_scheduler import PRIORITY_BATCH, RequestScheduler
+from response_cache import ResponseCache, VerdictCache
+from rating_engine import RATING_MODE_SEQUENTIAL, EloEngine
+import bradley_terry
+from matchmaking import Matchmaker
+from battle_store import Battle, BattleStore
+from training_writer import TrainingDataWriter
+from prompt_source import PromptSource, aiter_prompts, iter_prompts
+from near_dedupe import NearDuplicateFilter
+from sharding import DEFAULT_SHARD_DIRECTORY, iter_shard, shard_path
+from verdicts import (PAIRWISE_VERDICT_SCHEMA, JudgeStats, VerdictParseError, list_verdict_schema,
+                      parse_list_verdict, parse_pairwise_verdict)
+
+# Part of the verdict cache key; bump when the judge prompt or score format changes
+JUDGE_RUBRIC = "pairwise-v1"
+LIST_JUDGE_RUBRIC = "listwise-v1"
+STRUCTURED_JUDGE_RUBRIC = "pairwise-json-v1"
+STRUCTURED_LIST_JUDGE_RUBRIC = "listwise-json-v1"
+
+# Token cap for a structured verdict (scores plus a reason of at most REASON_MAX_LENGTH characters);
+# listwise verdicts get a few more tokens per response
+STRUCTURED_NUM_PREDICT = 160
+STRUCTURED_NUM_PREDICT_PER_RESPONSE = 4
+
+async def _iterate(prompts: Union[Iterable[str], AsyncIterable[str]]) -> AsyncIterator[str]:
+    if hasattr(prompts, "__aiter__"):
+        async for prompt in prompts:
+            yield prompt
+    else:
+        for prompt in prompts:
+            yield prompt
+
+# Another config (e.g. one pointing at the mock server in mock_ollama.py) can be chosen per run
+CONFIG_PATH = os.environ.get("LLM_ARENA_CONFIG", "arena_config.yaml")
+
+JUDGE_MODE_PAIRWISE = "pairwise"  # One judge call per model pair
+JUDGE_MODE_LISTWISE = "listwise"  # One judge call scores up to list_size responses at once
 
 class Endpoint:
     def __init__(self, url: str, api_key: str = None):
@@ -18,41 +62,113 @@ class Endpoint:
             headers["Authorization"] = f"Bearer {self.api_key}"
         return headers
 
+    @property
+    def is_ollama(self) -> bool:
+        return self.url.rstrip("/").endswith("/api/chat")
+
+    def build_payload(self, model_id: str, messages: List[Dict], options: Dict = None, schema: Dict = None) -> Dict:
+        payload = {"model": model_id, "messages": messages, "stream": True}
+        if options:
+            # Ollama's native API nests sampling options; OpenAI-compatible APIs take them top-level
+            if self.is_ollama:
+                payload["options"] = options
+            else:
+                payload.update(options)
+        if schema is not None:
+            # Constrain decoding to JSON matching the schema
+            if self.is_ollama:
+                payload["format"] = schema
+            else:
+                payload["response_format"] = {"type": "json_schema", "json_schema": {"name": "verdict", "schema": schema}}
+        return payload
+
+    def max_tokens_option(self, limit: int) -> Dict:
+        return {"num_predict": limit} if self.is_ollama else {"max_tokens": limit}
+
 class Model:
-    def __init__(self, name: str, model_id: str, endpoint: Endpoint):
+    def __init__(self, name: str, model_id: str, endpoint: Endpoint, options: Dict = None):
         self.name = name
         self.model_id = model_id
         self.endpoint = endpoint
+        self.options = options or {}  # Generation parameters; part of the response cache key
         self.elo = 1000  # Initial ELO score
         self.responses = {}  # Store responses for each prompt
+        self.scheduler = None  # Set by ArenaLearning; bounds concurrent requests per model/endpoint
+        self.cache = None  # Set by ArenaLearning; persistent ResponseCache shared across runs
 
     async def generate_response(self, session: aiohttp.ClientSession, prompt: str) -> str:
         if prompt not in self.responses:
+            cached = None
+            if self.cache is not None:
+                cached = self.cache.get_response(self.endpoint.url, self.model_id, prompt, self.options)
+            if cached is not None:
+                self.responses[prompt] = cached
+                return cached
+
             print(f"Generating response for {self.name} to prompt: {prompt[:30]}...")
-            async with session.post(
-                url=self.endpoint.url,
+            stream = ChatStream(
+                session,
+                self.endpoint.url,
+                self.endpoint.build_payload(self.model_id, [{"role": "user", "content": prompt}], self.options),
                 headers=self.endpoint.get_headers(),
-                json={
-                    "model": self.model_id,
-                    "messages": [
-                        {"role": "user", "content": prompt}
-                    ],
-                    "stream": False
-                }
-            ) as response:
-                result = await response.json()
-                print(result)
-                self.responses[prompt] = result['choices'][0]['message']['content']
+                scheduler=self.scheduler,
+                priority=PRIORITY_BATCH,
+                flow="arena"
+            )
+            response = await stream.collect()
+            self.responses[prompt] = response
+            if self.cache is not None:
+                self.cache.put_response(self.endpoint.url, self.model_id, prompt, response, self.options)
         return self.responses[prompt]
 
 class JudgeModel:
-    def __init__(self, name: str, model_id: str, endpoint: Endpoint):
+    def __init__(self, name: str, model_id: str, endpoint: Endpoint, structured: bool = False,
+                 max_retries: int = 2, num_predict: int = STRUCTURED_NUM_PREDICT):
         self.name = name
         self.model_id = model_id
         self.endpoint = endpoint
+        self.scheduler = None
+        self.cache = None  # Set by ArenaLearning; VerdictCache shared by (A,B) and (B,A)
+        # Structured mode asks for a short JSON verdict under a schema and a token cap instead of
+        # a free-text explanation; either way unparseable verdicts are retried up to max_retries times
+        self.structured = structured
+        self.max_retries = max_retries
+        self.num_predict = num_predict
+        self.stats = JudgeStats()
 
     async def evaluate(self, session: aiohttp.ClientSession, prompt: str, response1: str, response2: str) -> Tuple[int, int, str]:
-        evaluation_prompt = f"""You are an impartial judge evaluating the quality of responses from two AI models. Your task is to analyze and compare their responses objectively, focusing on various factors such as coherence, factual accuracy, context-awareness, and overall quality.
+        rubric = STRUCTURED_JUDGE_RUBRIC if self.structured else JUDGE_RUBRIC
+        if self.cache is not None:
+            cached = self.cache.get_verdict(self.model_id, prompt, response1, response2, rubric)
+            if cached is not None:
+                self.stats.cached += 1
+                return cached
+
+        if self.structured:
+            evaluation_prompt = f"""You are an impartial judge evaluating the quality of responses from two AI models. Your task is to analyze and compare their responses objectively, focusing on various factors such as coherence, factual accuracy, context-awareness, and overall quality.
+
+Original Prompt: {prompt}
+
+Model A's Response: {response1}
+
+Model B's Response: {response2}
+
+Score each response from 1 to 10 and give a brief reason (one or two sentences).
+Reply with JSON only: {{"score_a": <1-10>, "score_b": <1-10>, "reason": "<brief reason>"}}"""
+            score1, score2, explanation = await self._judge(session, evaluation_prompt, parse_pairwise_verdict,
+                                                            PAIRWISE_VERDICT_SCHEMA, self.num_predict)
+        else:
+            score1, score2, explanation = await self._judge(session, self._text_prompt(prompt, response1, response2),
+                                                            self._parse_text_verdict)
+
+        if self.cache is not None:
+            self.cache.put_verdict(self.model_id, prompt, response1, response2,
+                                   score1, score2, explanation, rubric)
+        return score1, score2, explanation
+
+    @staticmethod
+    def _text_prompt(prompt: str, response1: str, response2: str) -> str:
+        return f"""You are an impartial judge evaluating the quality of responses from two AI models. Your task is to analyze and compare their responses objectively, focusing on various factors such as coherence, factual accuracy, context-awareness, and overall quality.
 
 Original Prompt: {prompt}
 
@@ -76,49 +192,173 @@ Score-A: [score]
 Score-B: [score]
         """
 
-        async with session.post(
-            url=self.endpoint.url,
-            headers=self.endpoint.get_headers(),
-            json={
-                "model": self.model_id,
-                "messages": [
-                    {"role": "user", "content": evaluation_prompt}
-                ],
-                "stream": False
-            }
-        ) as response:
-            result = await response.json()
-            evaluation = result['choices'][0]['message']['content']
-        
+    @staticmethod
+    def _parse_text_verdict(evaluation: str) -> Optional[Tuple[int, int, str]]:
         parts = evaluation.split("Score-A:")
         if len(parts) != 2:
-            raise ValueError("Unable to parse evaluation response")
+            return None
         
         explanation = parts[0].replace("Explanation:", "").strip()
         scores_part = "Score-A:" + parts[1]
         
         score_pattern = r'Score-([AB]):\s*(\d+)'
-        scores = re.findall(score_pattern, scores_part)
-        
-        if len(scores) != 2:
-            print("Warning: Unable to extract scores from evaluation response - trying again")
-            self.evaluate(session, prompt, response1, response2)
-
-        score_dict = dict(scores)
-        score1 = int(score_dict.get('A', 0))
-        score2 = int(score_dict.get('B', 0))
+        score_dict = dict(re.findall(score_pattern, scores_part))
+        if len(score_dict) != 2:
+            return None
 
         if not explanation:
             explanation = "No detailed explanation provided."
+        return int(score_dict['A']), int(score_dict['B']), explanation
 
-        return score1, score2, explanation
+    async def evaluate_list(self, session: aiohttp.ClientSession, prompt: str, responses: Sequence[str]) -> Tuple[List[int], str]:
+        """Score several responses to the same prompt in one judge call.
+
+        Scores come back in the order the responses were given; callers shuffle that order
+        to spread position bias. The instructions and the original prompt come before the
+        responses, so every list for a prompt shares the same prefix and the server's prompt
+        cache only has to evaluate the responses.
+        """
+        rubric = STRUCTURED_LIST_JUDGE_RUBRIC if self.structured else LIST_JUDGE_RUBRIC
+        if self.cache is not None:
+            cached = self.cache.get_list_verdict(self.model_id, prompt, responses, rubric)
+            if cached is not None:
+                self.stats.cached += 1
+                return cached
+
+        size = len(responses)
+        if self.structured:
+            evaluation_prompt = f"""You are an impartial judge evaluating the quality of responses from several AI models. Your task is to analyze and compare their responses objectively, focusing on various factors such as coherence, factual accuracy, context-awareness, and overall quality. The responses are listed in random order; their position carries no meaning.
+
+Score each response from 1 to 10 and give a brief reason (one or two sentences).
+Reply with JSON only: {{"scores": [<score of Response 1>, <score of Response 2>, ...], "reason": "<brief reason>"}}
+
+Original Prompt: {prompt}
+"""
+        else:
+            evaluation_prompt = f"""You are an impartial judge evaluating the quality of responses from several AI models. Your task is to analyze and compare their responses objectively, focusing on various factors such as coherence, factual accuracy, context-awareness, and overall quality. The responses are listed in random order; their position carries no meaning.
+
+Please evaluate the responses and provide:
+1. A detailed explanation of your scoring, focusing on the strengths and weaknesses of each response
+2. A score for each response (1-10), one line per response, numbered as in the list
+
+Format your response as (IT'S VERY IMPORTANT TO FOLLOW THIS FORMAT): 
+Explanation: [your detailed explanation]
+Score-1: [score]
+Score-2: [score]
+...
+
+Original Prompt: {prompt}
+"""
+        for position, response in enumerate(responses, 1):
+            evaluation_prompt += f"\nResponse {position}: {response}\n"
+
+        if self.structured:
+            scores, explanation = await self._judge(
+                session, evaluation_prompt, lambda text: parse_list_verdict(text, size),
+                list_verdict_schema(size), self.num_predict + STRUCTURED_NUM_PREDICT_PER_RESPONSE * size)
+        else:
+            scores, explanation = await self._judge(
+                session, evaluation_prompt, lambda text: self._parse_text_list_verdict(text, size))
+
+        if self.cache is not None:
+            self.cache.put_list_verdict(self.model_id, prompt, responses, scores, explanation, rubric)
+        return scores, explanation
+
+    @staticmethod
+    def _parse_text_list_verdict(evaluation: str, size: int) -> Optional[Tuple[List[int], str]]:
+        score_dict = {int(position): int(score) for position, score in re.findall(r'Score-(\d+):\s*(\d+)', evaluation)}
+        if any(position not in score_dict for position in range(1, size + 1)):
+            return None
+        explanation = evaluation.split("Score-1:")[0].replace("Explanation:", "").strip()
+        if not explanation:
+            explanation = "No detailed explanation provided."
+        return [score_dict[position] for position in range(1, size + 1)], explanation
+
+    async def _judge(self, session: aiohttp.ClientSession, content: str, parse: Callable[[str], Any],
+                     schema: Dict = None, num_predict: int = None) -> Any:
+        # Unparseable verdicts and failed requests are retried (awaited, bounded) instead of
+        # becoming made-up scores
+        attempts = self.max_retries + 1
+        for attempt in range(attempts):
+            if attempt:
+                self.stats.retries += 1
+            self.stats.calls += 1
+            try:
+                text = await self._generate(session, content, schema, num_predict)
+            except (aiohttp.ClientError, OllamaStreamError) as error:
+                self.stats.request_errors += 1
+                print(f"Warning: Judge request failed (attempt {attempt + 1}/{attempts}): {error}")
+                continue
+            verdict = parse(text)
+            if verdict is not None:
+                self.stats.verdicts += 1
+                return verdict
+            self.stats.parse_failures += 1
+            print(f"Warning: Unable to parse judge verdict (attempt {attempt + 1}/{attempts})")
+        self.stats.failed += 1
+        raise VerdictParseError(f"No parseable verdict from {self.name} after {attempts} attempts")
+
+    async def _generate(self, session: aiohttp.ClientSession, content: str, schema: Dict = None,
+                        num_predict: int = None) -> str:
+        options = self.endpoint.max_tokens_option(num_predict) if num_predict else None
+        stream = ChatStream(
+            session,
+            self.endpoint.url,
+            self.endpoint.build_payload(self.model_id, [{"role": "user", "content": content}], options, schema),
+            headers=self.endpoint.get_headers(),
+            scheduler=self.scheduler,
+            priority=PRIORITY_BATCH,
+            flow="arena"
+        )
+        return await stream.collect()
 
 class ArenaLearning:
-    def __init__(self, models: List[Model], judge_model: JudgeModel):
+    def __init__(self, models: List[Model], judge_model: JudgeModel, scheduler: RequestScheduler = None,
+                 response_cache: ResponseCache = None, verdict_cache: VerdictCache = None,
+                 rating_mode: str = RATING_MODE_SEQUENTIAL, judge_mode: str = JUDGE_MODE_PAIRWISE,
+                 list_size: int = 4, seed: int = 0):
+        if len(models) < 2:
+            # Every battle needs two models; with fewer, no prompt would ever complete
+            raise ValueError(f"The arena needs at least 2 models, got {len(models)}")
         self.models = models
         self.judge_model = judge_model
-        self.battle_results = []
-        self.elo_history = {model.name: [model.elo] for model in models}
+        # Listwise judging scores each prompt's responses in shuffled lists of at most list_size;
+        # the shuffle is seeded per prompt so reruns present the same lists (and hit the verdict cache)
+        self.judge_mode = judge_mode
+        self.list_size = list_size
+        self.seed = seed
+        # All generation calls go through the scheduler as batch work, so the gathers below
+        # queue instead of flooding a model (and yield to interactive debates when shared)
+        self.scheduler = scheduler or RequestScheduler()
+        for model in [*models, judge_model]:
+            if model.scheduler is None:
+                model.scheduler = self.scheduler
+        # With a persistent cache, rerunning after adding a model only generates that model's responses
+        self.response_cache = response_cache
+        for model in models:
+            if model.cache is None:
+                model.cache = response_cache
+        # Verdicts are keyed by judge, prompt and both responses, so re-judged pairs are free
+        self.verdict_cache = verdict_cache
+        if judge_model.cache is None:
+            judge_model.cache = verdict_cache
+        # Battles are stored as integer IDs (prompts, models, interned response/explanation text)
+        # with a per-prompt index, so training data is built in one pass over the battles
+        self.battles = BattleStore([model.name for model in models])
+        # Outcomes are also kept as model-index/score arrays so rating updates cost O(new battles)
+        self.model_index = {model.name: i for i, model in enumerate(models)}
+        self.rating_mode = rating_mode
+        self.rating_engine = EloEngine([model.name for model in models],
+                                       initial_ratings=[model.elo for model in models])
+
+    @property
+    def battle_results(self) -> List[Battle]:
+        # Materialized view for callers that want one record per battle; model1/model2 are indices
+        return list(self.battles)
+
+    @property
+    def elo_history(self) -> Dict[str, np.ndarray]:
+        return self.rating_engine.history_by_model()
 
     async def generate_batch_responses(self, session: aiohttp.ClientSession, prompt_batch: List[str]) -> None:
         tasks = []
@@ -137,90 +377,301 @@ class ArenaLearning:
                     tasks.append(self.battle(session, prompt, model1, model2))
         await asyncio.gather(*tasks)
 
-    async def battle(self, session: aiohttp.ClientSession, prompt: str, model1: Model, model2: Model) -> None:
+    async def battle(self, session: aiohttp.ClientSession, prompt: str, model1: Model, model2: Model) -> Tuple[int, int]:
         response1 = model1.responses[prompt]
         response2 = model2.responses[prompt]
         score1, score2, explanation = await self.judge_model.evaluate(session, prompt, response1, response2)
-        self.battle_results.append((model1, model2, score1, score2, response1, response2, explanation, prompt))
+        self._record_battle(prompt, model1, model2, score1, score2, response1, response2, explanation)
+        return score1, score2
+
+    def _record_battle(self, prompt: str, model1: Model, model2: Model, score1: int, score2: int,
+                       response1: str, response2: str, explanation: str) -> None:
+        index1, index2 = self.model_index[model1.name], self.model_index[model2.name]
+        self.battles.add(prompt, index1, index2, score1, score2, response1, response2, explanation)
+        self.rating_engine.add_battle(index1, index2, score1, score2)
+
+    def judge_lists(self, prompt: str, models: Sequence[Model]) -> List[List[Model]]:
+        """Split the models into shuffled lists of near-equal size for listwise judging."""
+        if len(models) < 2:
+            return []
+        order = list(models)
+        random.Random(f"{self.seed}:{prompt}").shuffle(order)
+        count = math.ceil(len(order) / max(2, self.list_size))
+        lists = [order[start::count] for start in range(count)]
+        if len(lists[-1]) < 2:
+            # A one-model list (list_size 2, odd model count) would cost a judge call and record no
+            # battle, so the leftover model is judged against a model from the first list instead
+            lists[-1].append(lists[0][0])
+        return lists
+
+    def judge_calls_per_prompt(self, matchmaker: Optional[Matchmaker] = None) -> int:
+        """Judge calls one prompt costs (ignoring cache hits), e.g. for estimating dedupe savings."""
+        n = len(self.models)
+        if self.judge_mode == JUDGE_MODE_LISTWISE:
+            return len(self.judge_lists("", self.models))
+        if matchmaker is not None:
+            return min(matchmaker.pairs_per_prompt, n * (n - 1) // 2)
+        return n * (n - 1) // 2
+
+    async def judge_list(self, session: aiohttp.ClientSession, prompt: str, models: Sequence[Model]) -> List[int]:
+        responses = [model.responses[prompt] for model in models]
+        scores, explanation = await self.judge_model.evaluate_list(session, prompt, responses)
+        # Scores from one call are on the same scale, so every pair in the list is an implied battle
+        for a, b in itertools.combinations(range(len(models)), 2):
+            if self.model_index[models[a].name] > self.model_index[models[b].name]:
+                a, b = b, a
+            self._record_battle(prompt, models[a], models[b], scores[a], scores[b],
+                                responses[a], responses[b], explanation)
+        return scores
 
     def update_elo_ratings(self) -> None:
-        K = 32  # K-factor for ELO calculation
-
-        for model1, model2, score1, score2, _, _, _, _ in self.battle_results:
-            expected_score1 = 1 / (1 + 10 ** ((model2.elo - model1.elo) / 400))
-            expected_score2 = 1 - expected_score1
-
-            actual_score1 = score1 / (score1 + score2)
-            actual_score2 = 1 - actual_score1
-
-            model1.elo += K * (actual_score1 - expected_score1)
-            model2.elo += K * (actual_score2 - expected_score2)
-
-        # Update ELO history
+        self._apply_new_battles()
+        self.rating_engine.snapshot()
+
+    def _apply_new_battles(self) -> None:
+        # Only battles recorded since the last update are applied, so this can be called repeatedly
+        self.rating_engine.update(self.rating_mode)
+        for model, rating in zip(self.models, self.rating_engine.ratings.tolist()):
+            model.elo = rating
+
+    def battle_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        engine = self.rating_engine
+        n = engine.count
+        return engine.model1[:n], engine.model2[:n], engine.score1[:n], engine.score2[:n]
+
+    def restore_battles(self, records: Iterable[Dict]) -> int:
+        """Reload the battles of records written by an earlier run (see run_arena's record_battles).
+
+        Resumed prompts are not judged again, so without this the ratings, the battle file and the
+        Bradley-Terry input would only cover the prompts judged in this process. Only the rating
+        engine's model/score columns are rebuilt; the prompts and responses stay on disk, like those
+        of prompts written during the run. Returns the number of records without battles.
+        """
+        missing = 0
+        for record in records:
+            if "battles" not in record:
+                missing += 1
+                continue
+            for battle in record["battles"]:
+                if battle["model1"] not in self.model_index or battle["model2"] not in self.model_index:
+                    raise ValueError(f"Resumed battle between unknown models: {battle['model1']}, {battle['model2']}")
+                self.rating_engine.add_battle(self.model_index[battle["model1"]], self.model_index[battle["model2"]],
+                                              battle["score1"], battle["score2"])
+        self.update_elo_ratings()
+        return missing
+
+    def save_battles(self, path: str) -> None:
+        # Order-independent rankings are fitted offline from this file (see bradley_terry.py)
+        bradley_terry.save_battles(path, self.rating_engine.model_names, *self.battle_arrays())
+
+    def bradley_terry_leaderboard(self, rounds: int = 1000, workers: int = None) -> List[Dict]:
+        return bradley_terry.leaderboard(self.rating_engine.model_names, *self.battle_arrays(),
+                                         rounds=rounds, workers=workers)
+
+    def generate_training_data(self, prompts: List[str] = None) -> List[Dict]:
+        # One pass over the battles, prompt by prompt via the store's index (in first-judged order)
+        return [{
+            'prompt': prompt,
+            'ranked_models': self.battles.ranked_models(prompt_id)
+        } for prompt_id, prompt in enumerate(self.battles.prompts) if prompt is not None]
+
+    async def run_arena(self, session: aiohttp.ClientSession, prompts: Union[Iterable[str], AsyncIterable[str]], batch_size: int = 3,
+                        generation_concurrency: int = 8, judge_concurrency: int = 4,
+                        matchmaker: Matchmaker = None, writer: TrainingDataWriter = None,
+                        record_battles: bool = False) -> List[Dict]:
+        """Run all battles as a two-stage pipeline: generation -> judging.
+
+        A battle is queued for the judge as soon as both of its responses exist, and generation
+        keeps going while earlier battles are judged. Each stage runs a fixed number of workers;
+        the battle queue is bounded so generation pauses when judging falls behind.
+        Ratings are updated as battles finish; batch_size only sets how often (in completed
+        prompts) the ELO history is snapshotted and printed.
+
+        With a matchmaker, only the pairs it selects for each prompt are generated and judged,
+        and the run stops early once its judge budget is spent or every pair's order is settled.
+        In listwise mode each of a prompt's judge lists is queued once all of its responses exist.
+
+        With a writer, each prompt's ranked record is written as soon as its last battle is judged,
+        prompts the writer already holds (from a resumed run) or that are still in flight are
+        skipped, and the in-memory training data is not returned. A written prompt's responses are
+        then released, so memory holds only the rating columns of finished prompts. With record_battles, each written record also lists the
+        prompt's battles (model names and scores) so that a resumed run can restore them
+        (restore_battles) and sharded runs can be merged (see sharding.py).
+
+        prompts may be a list or a (possibly async) iterator; it is consumed lazily, as far as
+        the bounded generation queue allows.
+        """
+        listwise = self.judge_mode == JUDGE_MODE_LISTWISE
+        if listwise and matchmaker is not None:
+            raise ValueError("Adaptive matchmaking selects pairs and needs the pairwise judge mode")
+        print("Running arena with pipelined processing...")
+        model_index = {model.name: i for i, model in enumerate(self.models)}
+        battles_per_prompt = len(self.models) * (len(self.models) - 1) // 2
+
+        generation_queue: asyncio.Queue = asyncio.Queue(maxsize=generation_concurrency * 2)
+        battle_queue: asyncio.Queue = asyncio.Queue(maxsize=judge_concurrency * 4)
+        ready: Dict[int, Set[str]] = {}  # prompt index -> models whose response exists
+        planned: Dict[int, Set[Tuple[int, int]]] = {}  # prompt index -> pairs to judge (adaptive mode)
+        lists: Dict[int, List[List[Model]]] = {}  # prompt index -> judge lists (listwise mode)
+        pending_battles: Dict[int, int] = {}  # prompt index -> battles not yet judged
+        active: Set[str] = set()  # prompts in flight (with a writer, repeats of these are skipped)
+        completed_prompts = 0
+        total_prompts = len(prompts) if isinstance(prompts, Sized) else None
+
+        async def feed_generation():
+            index = -1
+            async for prompt in _iterate(prompts):
+                index += 1
+                if writer is not None:
+                    if writer.is_completed(prompt) or prompt in active:
+                        continue
+                    active.add(prompt)
+                models = self.models
+                if matchmaker is not None:
+                    pairs = matchmaker.select_pairs()
+                    if not pairs:
+                        break
+                    planned[index] = set(pairs)
+                    needed = {i for pair in pairs for i in pair}
+                    models = [model for i, model in enumerate(self.models) if i in needed]
+                ready[index] = set()
+                if listwise:
+                    lists[index] = self.judge_lists(prompt, models)
+                    pending_battles[index] = len(lists[index])
+                else:
+                    pending_battles[index] = len(planned[index]) if matchmaker is not None else battles_per_prompt
+                for model in models:
+                    await generation_queue.put((index, prompt, model))
+            for _ in range(generation_concurrency):
+                await generation_queue.put(None)
+
+        async def generate_worker():
+            while True:
+                item = await generation_queue.get()
+                if item is None:
+                    return
+                index, prompt, model = item
+                try:
+                    await model.generate_response(session, prompt)
+                except (aiohttp.ClientError, OllamaStreamError) as error:
+                    # The prompt's battles with this model are never queued, so the prompt is not
+                    # completed or written; a resumed run retries it
+                    print(f"Skipping {model.name} for prompt: {prompt[:50]}... ({error})")
+                    continue
+                others = list(ready[index])
+                ready[index].add(model.name)
+                if listwise:
+                    for group in lists[index]:
+                        if model in group and all(member.name in ready[index] for member in group):
+                            await battle_queue.put((index, prompt, group))
+                    continue
+                # Pair the new response with every response already available for this prompt
+                for other_name in others:
+                    other = self.models[model_index[other_name]]
+                    first, second = (other, model) if model_index[other.name] < model_index[model.name] else (model, other)
+                    if matchmaker is not None and (model_index[first.name], model_index[second.name]) not in planned[index]:
+                        continue
+                    await battle_queue.put((index, prompt, (first, second)))
+
+        async def judge_worker():
+            nonlocal completed_prompts
+            while True:
+                item = await battle_queue.get()
+                if item is None:
+                    return
+                index, prompt, models = item
+                try:
+                    if listwise:
+                        await self.judge_list(session, prompt, models)
+                    else:
+                        model1, model2 = models
+                        score1, score2 = await self.battle(session, prompt, model1, model2)
+                        if matchmaker is not None:
+                            total = score1 + score2
+                            matchmaker.record(model_index[model1.name], model_index[model2.name],
+                                              score1 / total if total else 0.5)
+                    self._apply_new_battles()
+                except VerdictParseError as error:
+                    # The judge's retries are spent; drop this battle rather than the whole run
+                    print(f"Skipping battle for prompt: {prompt[:50]}... ({error})")
+                pending_battles[index] -= 1
+                if pending_battles[index] == 0:
+                    del pending_battles[index], ready[index]
+                    planned.pop(index, None)
+                    lists.pop(index, None)
+                    completed_prompts += 1
+                    if writer is not None:
+                        self._write_record(writer, prompt, record_battles)
+                        self._release_prompt(prompt)
+                        active.discard(prompt)
+                    if completed_prompts % batch_size == 0:
+                        self._record_elo_snapshot(completed_prompts, total_prompts)
+
+        async def run_generation():
+            await asyncio.gather(feed_generation(), *(generate_worker() for _ in range(generation_concurrency)))
+            for _ in range(judge_concurrency):
+                await battle_queue.put(None)
+
+        stages = [
+            asyncio.create_task(run_generation()),
+            *(asyncio.create_task(judge_worker()) for _ in range(judge_concurrency))
+        ]
+        try:
+            await asyncio.gather(*stages)
+        finally:
+            # A failure in one stage stops the rest instead of leaving workers blocked on the queues
+            for task in stages:
+                task.cancel()
+        if completed_prompts % batch_size:
+            self._record_elo_snapshot(completed_prompts, total_prompts)
+
+        if writer is not None:
+            writer.checkpoint()
+            return []
+        return self.generate_training_data()
+
+    def _write_record(self, writer: TrainingDataWriter, prompt: str, record_battles: bool = False) -> None:
+        # A prompt whose battles were all skipped is left out, so a resumed run retries it
+        battle_ids = self.battles.battles_for(prompt)
+        if not battle_ids:
+            return
+        record = {'prompt': prompt, 'ranked_models': self.battles.ranked_models(self.battles.intern_prompt(prompt))}
+        if record_battles:
+            store = self.battles
+            record['battles'] = [{
+                'model1': self.models[store.model1[i]].name,
+                'model2': self.models[store.model2[i]].name,
+                'score1': store.score1[i],
+                'score2': store.score2[i]
+            } for i in battle_ids]
+        writer.write(record)
+
+    def _release_prompt(self, prompt: str) -> None:
+        # Once on disk, a prompt's texts are dropped; Elo and Bradley-Terry only need the rating engine's columns
         for model in self.models:
-            self.elo_history[model.name].append(model.elo)
+            model.responses.pop(prompt, None)
+        self.battles.release(prompt)
 
-    def generate_training_data(self, prompts: List[str]) -> List[Dict]:
-        training_data = []
-        prompts = set(result[-1] for result in self.battle_results)  # Get unique prompts
+    def _record_elo_snapshot(self, completed: int, total: Optional[int]) -> None:
+        self.rating_engine.snapshot()
+        print(f"\nIntermediate ELO rankings after {completed}{'' if total is None else f'/{total}'} prompts:")
+        for model in self.models:
+            print(f"{model.name}: {model.elo:.2f}")
 
-        for prompt in prompts:
-            prompt_results = [result for result in self.battle_results if result[-1] == prompt]
-            model_scores = {model.name: {'scores': [], 'response': ''} for model in self.models}
-
-            for model1, model2, score1, score2, response1, response2, _, _ in prompt_results:
-                model_scores[model1.name]['scores'].append(score1)
-                model_scores[model1.name]['response'] = response1
-                model_scores[model2.name]['scores'].append(score2)
-                model_scores[model2.name]['response'] = response2
-
-            # Calculate average scores and prepare ranked list
-            ranked_models = []
-            for model_name, data in model_scores.items():
-                if data['scores']:
-                    avg_score = sum(data['scores']) / len(data['scores'])
-                    ranked_models.append({
-                        'model_name': model_name,
-                        'avg_score': avg_score,
-                        'response': data['response']
-                    })
-
-            # Sort models by average score in descending order
-            ranked_models.sort(key=lambda x: x['avg_score'], reverse=True)
-
-            # Add to training data
-            training_data.append({
-                'prompt': prompt,
-                'ranked_models': ranked_models
-            })
-        return training_data
-
-    async def run_arena(self, session: aiohttp.ClientSession, prompts: List[str], batch_size: int = 3) -> List[Dict]:
-        print("Running arena with batched processing...")
-        for i in range(0, len(prompts), batch_size):
-            prompt_batch = prompts[i:i+batch_size]
-            print(f"\nProcessing batch {i//batch_size + 1} (prompts {i+1}-{min(i+batch_size, len(prompts))})")
-            
-            print("Generating responses for current batch...")
-            await self.generate_batch_responses(session, prompt_batch)
-
-            print("Running battles for current batch...")
-            await self.run_battles_for_batch(session, prompt_batch)
-            
-            self.update_elo_ratings()
-            print("\nIntermediate ELO rankings after current batch:")
-            for model in self.models:
-                print(f"{model.name}: {model.elo:.2f}")
-
-        return self.generate_training_data(prompts)
-
-async def main():
+async def main(shard: Optional[int] = None, num_shards: int = 1):
     # Load configuration from YAML file
-    with open("arena_config.yaml", "r") as config_file:
+    with open(CONFIG_PATH, "r") as config_file:
         config = yaml.safe_load(config_file)
 
+    # A shard worker runs only its share of the prompts (see sharding.py); with several Ollama
+    # hosts configured, each shard uses one of them as its default endpoint
+    sharding_config = config.get("sharding") or {}
+    hosts = sharding_config.get("hosts") or []
+    default_url = config["default_endpoint"]["url"]
+    if shard is not None and hosts:
+        default_url = hosts[shard % len(hosts)]
     default_endpoint = Endpoint(
-        url=config["default_endpoint"]["url"],
+        url=default_url,
         api_key=config["default_endpoint"].get("api_key")
     )
 
@@ -234,7 +685,8 @@ async def main():
             )
         else:
             endpoint = default_endpoint
-        models.append(Model(model_config["name"], model_config["model_id"], endpoint))
+        models.append(Model(model_config["name"], model_config["model_id"], endpoint,
+                            options=model_config.get("options")))
 
     # Create judge model from configuration
     judge_config = config["judge_model"]
@@ -245,47 +697,151 @@ async def main():
         )
     else:
         judge_endpoint = default_endpoint
-    judge_model = JudgeModel(judge_config["name"], judge_config["model_id"], judge_endpoint)
-
-    # Load dataset from Hugging Face
-    prompts = []
-    for dataset_config in config["datasets"]:
-        ds = load_dataset(dataset_config["name"])
-        split = ds[dataset_config["split"]]
-        prompts.extend(split[dataset_config["field"]][:dataset_config["limit"]])
-
-    print(f"Total number of prompts: {len(prompts)}")
+    judge_model = JudgeModel(judge_config["name"], judge_config["model_id"], judge_endpoint,
+                             structured=judge_config.get("structured", False),
+                             max_retries=judge_config.get("max_retries", 2),
+                             num_predict=judge_config.get("num_predict", STRUCTURED_NUM_PREDICT))
+
+    # Prompts are streamed (Hugging Face datasets) or memory-mapped (local files) and deduplicated
+    # as the arena consumes them, instead of loading every dataset up front
+    sources = [PromptSource.from_config(dataset_config) for dataset_config in config["datasets"]]
+    for source in sources:
+        print(f"Prompt source: {source.label} ({source.field}, limit {source.limit})")
+    prompt_stream = iter_prompts(sources, dedupe=config.get("dedupe_prompts", True))
+
+    cache_config = config.get("cache") or {}
+    response_cache = None
+    verdict_cache = None
+    if cache_config.get("enabled", True):
+        response_cache = ResponseCache(
+            cache_config.get("path", "arena_cache.sqlite3"),
+            max_entries=cache_config.get("max_entries", 100_000),
+            timeout=cache_config.get("timeout", 30.0)
+        )
+    if cache_config.get("verdicts", True):
+        # Without a cache path the verdicts are only reused within this run
+        verdict_cache = VerdictCache(
+            cache_config.get("path", "arena_cache.sqlite3") if cache_config.get("enabled", True) else ":memory:",
+            max_entries=cache_config.get("max_verdicts", 100_000),
+            timeout=cache_config.get("timeout", 30.0)
+        )
 
-    arena = ArenaLearning(models, judge_model)
+    judging_config = config.get("judging") or {}
+    arena = ArenaLearning(models, judge_model, response_cache=response_cache, verdict_cache=verdict_cache,
+                          rating_mode=config.get("rating_mode", RATING_MODE_SEQUENTIAL),
+                          judge_mode=judging_config.get("mode", JUDGE_MODE_PAIRWISE),
+                          list_size=judging_config.get("list_size", 4),
+                          seed=judging_config.get("seed", 0))
 
     batch_size = 3  # Set the batch size to 3
-    async with aiohttp.ClientSession() as session:
-        training_data = await arena.run_arena(session, prompts, batch_size)
+
+    # "adaptive" judges only the most informative, still-unsettled pairs per prompt
+    matchmaking_config = config.get("matchmaking") or {}
+    matchmaker = None
+    if matchmaking_config.get("mode", "exhaustive") == "adaptive":
+        matchmaker = Matchmaker(len(models), pairs_per_prompt=matchmaking_config.get("pairs_per_prompt"),
+                                judge_budget=matchmaking_config.get("judge_budget"))
+
+    # Optionally drop near-duplicate prompts (MinHash/LSH). The filter needs the whole prompt list,
+    # so this materializes it instead of streaming
+    near_dedupe_config = config.get("near_dedupe") or {}
+    if near_dedupe_config.get("enabled", False):
+        near_filter = NearDuplicateFilter(threshold=near_dedupe_config.get("threshold", 0.8),
+                                          num_perm=near_dedupe_config.get("num_perm", 128),
+                                          shingle_size=near_dedupe_config.get("shingle_size", 5))
+        started = time.perf_counter()
+        prompt_list, dedupe_stats = near_filter.filter(list(prompt_stream))
+        savings = dedupe_stats.estimated_savings(len(models), arena.judge_calls_per_prompt(matchmaker))
+        print(f"Near-duplicate filter: kept {dedupe_stats.kept} of {dedupe_stats.prompts} prompts, "
+              f"dropped {dedupe_stats.dropped} in {dedupe_stats.clusters} clusters "
+              f"({time.perf_counter() - started:.2f}s)")
+        print(f"Estimated savings: {savings['generations']} generations, {savings['judge_calls']} judge calls")
+        prompt_stream = iter(prompt_list)
+    if shard is not None:
+        # Near-duplicates are dropped above, over all prompts, so every worker drops the same ones
+        prompt_stream = iter_shard(prompt_stream, shard, num_shards)
+        print(f"Shard {shard} of {num_shards} (default endpoint {default_url})")
+    prompts = aiter_prompts(prompt_stream)
+
+    # Training data is appended to a JSONL file as prompts complete; rerunning resumes from its manifest
+    output_config = config.get("output") or {}
+    output_path = output_config.get("path", "training_data.jsonl")
+    if shard is not None:
+        directory = sharding_config.get("directory", DEFAULT_SHARD_DIRECTORY)
+        os.makedirs(directory, exist_ok=True)
+        output_path = shard_path(directory, shard, num_shards, compress=output_path.endswith(".gz"))
+    writer = TrainingDataWriter(output_path,
+                                compress=output_config.get("compress"),
+                                checkpoint_every=output_config.get("checkpoint_every", 50),
+                                resume=output_config.get("resume", True))
+    missing_battles = 0
+    if writer.resumed_records:
+        print(f"Resuming: {writer.resumed_records} prompts already in {writer.path}")
+        missing_battles = arena.restore_battles(TrainingDataWriter.read_checkpointed(writer.path, writer.manifest_path))
+        print(f"Restored {arena.rating_engine.count} battles from the resumed prompts")
+    try:
+        async with aiohttp.ClientSession() as session:
+            await arena.run_arena(session, prompts, batch_size, matchmaker=matchmaker, writer=writer,
+                                  record_battles=True)
+    finally:
+        writer.close()
 
     print("\nELO rating progression:")
     for model in models:
-        print(f"{model.name}: {arena.elo_history[model.name]}")
-
-    # save training data to a file
-    with open("training_data.json", "w") as f:
-        json.dump(training_data, f, indent=4)
+        print(f"{model.name}: {np.round(arena.elo_history[model.name], 2).tolist()}")
 
     print("\nTraining data:")
-    for item in training_data:
-        print(f"Prompt: {item['prompt']}")
-        for rank, model_data in enumerate(item['ranked_models']):
-            print(f"  Rank {rank+1}: {model_data['model_name']}")
-            print(f"    Average Score: {model_data['avg_score']:.2f}")
-            print(f"    Response: {model_data['response'][:50]}...")  # Truncate response for brevity
-        print()
+    print(json.dumps(writer.get_stats(), indent=4))
 
     print("\nFinal ELO ratings:")
     for model in models:
         print(f"{model.name}: {model.elo:.2f}")
 
+    if matchmaker is not None:
+        print("\nMatchmaking stats:")
+        print(json.dumps(matchmaker.get_stats(), indent=4))
+
+    if shard is None and missing_battles:
+        # Records from before battles were written cannot be restored, so the results are partial
+        print(f"\nWarning: {missing_battles} resumed prompts in {writer.path} have no recorded battles; "
+              f"the rankings above leave them out and battles.npz was not written")
+    elif shard is None and arena.rating_engine.count == 0:
+        # Keep the previous battle file rather than overwriting it with an empty one
+        print("\nNo battles in this run; battles.npz and the Bradley-Terry ratings were left unchanged")
+    elif shard is None:
+        arena.save_battles("battles.npz")
+        bt_config = config.get("bradley_terry") or {}
+        print("\nBradley-Terry ratings (95% bootstrap CI):")
+        for entry in arena.bradley_terry_leaderboard(rounds=bt_config.get("bootstrap_rounds", 1000),
+                                                     workers=bt_config.get("workers")):
+            print(bradley_terry.format_entry(entry))
+    else:
+        # Ratings above cover only this shard; the merge recomputes them over every shard
+        print(f"\nShard results are in {writer.path}; merge them with: python sharding.py merge")
+
+    print("\nJudge stats:")
+    print(json.dumps(judge_model.stats.to_dict(), indent=4))
+
+    print("\nScheduler stats:")
+    print(json.dumps(arena.scheduler.get_stats(), indent=4))
+
+    if response_cache is not None:
+        print("\nResponse cache stats:")
+        print(json.dumps(response_cache.get_stats(), indent=4))
+        response_cache.close()
+
+    if verdict_cache is not None:
+        print("\nVerdict cache stats:")
+        print(json.dumps(verdict_cache.get_stats(), indent=4))
+        verdict_cache.close()
+
 if __name__ == "__main__":
+    # python llm_arena.py [shard num_shards]
     start_time = time.perf_counter()
-    asyncio.run(main())
+    if len(sys.argv) > 2:
+        asyncio.run(main(int(sys.argv[1]), int(sys.argv[2])))
+    else:
+        asyncio.run(main())
     end_time = time.perf_counter()
     execution_time = end_time - start_time
     print(f"Total execution time: {execution_time:.2f} seconds")
\ No newline at end of file
@@ -1,18 +1,45 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Dict, List, Optional
 import json
-import asyncio
+import os
 import aiohttp
-from datetime import datetime
+from contextlib import asynccontextmanager
+
+from debate_manager import DebateManager, DebateAgent, JudgeAgent
+from http_client import SharedHTTPClient
+from model_catalog import ModelCatalog, CatalogUnavailableError
+from ws_stream import StreamSender, StreamConfig
+from debate_broadcast import DebateHub, DebateBroadcast, Subscriber
+from history import OllamaSummarizer
+from model_residency import ModelResidency
+from request_scheduler import RequestScheduler
+
+# OllamaのベースURL（モックサーバー mock_ollama.py などに向ける場合は環境変数で指定）
+OLLAMA_URL = os.environ.get("LLM_ARENA_OLLAMA_URL", "http://localhost:11434").rstrip("/")
+OLLAMA_CHAT_URL = f"{OLLAMA_URL}/api/chat"
+
+# Ollama呼び出し全体で共有するHTTPクライアント（アプリのライフサイクルで管理）
+http_client = SharedHTTPClient()
+
+# すべての生成リクエストが通るスケジューラ（モデル・エンドポイントごとの同時実行枠と優先度）
+request_scheduler = RequestScheduler()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await http_client.start()
+    model_catalog.start()
+    try:
+        yield
+    finally:
+        await debate_hub.close()
+        await model_catalog.stop()
+        await http_client.close()
 
-from debate_manager import (
-    DebateManager, DebateAgent, JudgeAgent, AgentRole,
-    DebateMetrics, DebateTurn
-)
 
-app = FastAPI(title="LLLM Colosseum API", version="1.0.0")
+app = FastAPI(title="LLLM Colosseum API", version="1.0.0", lifespan=lifespan)
 
 # CORS設定
 app.add_middleware(
@@ -23,8 +50,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# アクティブなディベートセッションを管理
-active_debates: Dict[str, DebateManager] = {}
+# アクティブなディベートセッションを管理（ディベートIDごとに1つのプロデューサーと複数の観戦者）
+debate_hub = DebateHub()
 active_connections: List[WebSocket] = []
 
 
@@ -41,6 +68,13 @@ class StartDebateRequest(BaseModel):
     combatant_b: str
     judge: str
     personas: Optional[Dict[str, str]] = None
+    prompt_mode: Optional[str] = None
+    keep_alive: Optional[str] = None
+    options: Optional[Dict] = None
+    history_budget: Optional[int] = None
+    summarizer_model: Optional[str] = None
+    structured_verdict: Optional[bool] = None
+    warm_up: bool = True
 
 
 class OllamaModelResponse(BaseModel):
@@ -59,139 +93,278 @@ async def root():
         "endpoints": {
             "models": "/api/models",
             "websocket": "/ws/arena",
-            "health": "/health"
+            "health": "/health",
+            "http_pool": "/api/stats/http",
+            "catalog": "/api/stats/catalog",
+            "residency": "/api/stats/residency",
+            "scheduler": "/api/stats/scheduler"
         }
     }
 
 
+# 特定のモデルに対してわかりやすい表示名（完全一致）
+MODEL_DISPLAY_NAMES = {
+    "gpt-oss:120b": "GPT-OSS (120B)",
+    "qwen3:32B": "Qwen3 (32B)",
+    "gemma3:27b": "Gemma3 (27B)",
+    "gemma3:12b": "Gemma3 (12B)",
+    "gemma3:latest": "Gemma3 (Latest)",
+    "qwen3:latest": "Qwen3 (Latest)",
+    "gpt-oss:latest": "GPT-OSS (Latest)",
+    "llama3:latest": "Llama3 (Latest)",
+}
+
+# 推奨モデル（存在しない場合の仮想エントリ）
+RECOMMENDED_MODELS = [
+    ModelInfo(
+        name="Qwen 3 (32B)",
+        model_id="qwen3:32B",
+        description="Creative strategist persona - Recommended",
+        size="32B"
+    ),
+    ModelInfo(
+        name="GPT-OSS (120B)",
+        model_id="gpt-oss:120b",
+        description="Analytical persona - Recommended",
+        size="120b"
+    ),
+    ModelInfo(
+        name="Gemma 3 (27B)",
+        model_id="gemma3:27b",
+        description="Scholarly persona - Recommended",
+        size="27b"
+    )
+]
+
+
+def get_display_name(model_id: str) -> str:
+    if model_id in MODEL_DISPLAY_NAMES:
+        return MODEL_DISPLAY_NAMES[model_id]
+    if "Swallow-MS" in model_id:
+        return "Swallow-MS (7B)"
+    # デフォルトの処理
+    if ":" in model_id:
+        base_name, tag = model_id.split(":", 1)
+        return f"{base_name.replace('-', ' ').title()} ({tag})"
+    return model_id.replace("-", " ").title()
+
+
+def build_model_infos(data: dict) -> List[ModelInfo]:
+    # カタログ更新時に一度だけ実行され、結果はキャッシュされる
+    models = [
+        ModelInfo(
+            name=get_display_name(model["name"]),
+            model_id=model["name"],
+            description=f"Model: {model['name']}",
+            size=None
+        )
+        for model in data.get("models", [])
+    ]
+
+    # 実際に存在するモデルかチェックして追加
+    existing_ids = {m.model_id for m in models}
+    for rec_model in RECOMMENDED_MODELS:
+        if rec_model.model_id not in existing_ids:
+            models.insert(0, rec_model)
+
+    return models
+
+
+model_catalog = ModelCatalog(
+    http_client,
+    tags_url=f"{OLLAMA_URL}/api/tags",
+    transform=build_model_infos
+)
+
+# 常駐モデルの管理（メモリ予算はGB単位の環境変数で指定、未指定なら予算なし）
+_memory_budget_gb = os.environ.get("LLM_ARENA_MEMORY_BUDGET_GB")
+model_residency = ModelResidency(
+    http_client,
+    base_url=OLLAMA_URL,
+    memory_budget=int(float(_memory_budget_gb) * 1024 ** 3) if _memory_budget_gb else None,
+    scheduler=request_scheduler
+)
+
+
 @app.get("/health")
 async def health_check():
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get("http://localhost:11434/api/tags") as response:
-                if response.status == 200:
-                    return {"status": "healthy", "ollama": "connected"}
-                else:
-                    return {"status": "unhealthy", "ollama": "unreachable"}
-    except Exception as e:
+        snapshot = await model_catalog.get()
+    except CatalogUnavailableError as e:
+        if e.status is not None:
+            return {"status": "unhealthy", "ollama": "unreachable"}
         return {"status": "unhealthy", "ollama": "error", "message": str(e)}
 
+    if snapshot.stale:
+        return {
+            "status": "degraded",
+            "ollama": "stale",
+            "message": model_catalog.last_error,
+            "catalog_age": snapshot.age
+        }
+    return {"status": "healthy", "ollama": "connected", "catalog_age": snapshot.age}
+
 
 @app.get("/api/models", response_model=List[ModelInfo])
-async def get_available_models():
+async def get_available_models(response: Response):
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get("http://localhost:11434/api/tags") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    models = []
-                    for model in data.get("models", []):
-                        # モデル名とサイズ情報を含めた表示名を作成
-                        model_id = model["name"]
-                        
-                        # 特定のモデルに対してわかりやすい表示名を作成
-                        if model_id == "gpt-oss:120b":
-                            display_name = "GPT-OSS (120B)"
-                        elif model_id == "qwen3:32B":
-                            display_name = "Qwen3 (32B)"
-                        elif model_id == "gemma3:27b":
-                            display_name = "Gemma3 (27B)"
-                        elif model_id == "gemma3:12b":
-                            display_name = "Gemma3 (12B)"
-                        elif model_id == "gemma3:latest":
-                            display_name = "Gemma3 (Latest)"
-                        elif model_id == "qwen3:latest":
-                            display_name = "Qwen3 (Latest)"
-                        elif model_id == "gpt-oss:latest":
-                            display_name = "GPT-OSS (Latest)"
-                        elif model_id == "llama3:latest":
-                            display_name = "Llama3 (Latest)"
-                        elif "Swallow-MS" in model_id:
-                            display_name = "Swallow-MS (7B)"
-                        else:
-                            # デフォルトの処理
-                            if ":" in model_id:
-                                base_name, tag = model_id.split(":", 1)
-                                display_name = f"{base_name.replace('-', ' ').title()} ({tag})"
-                            else:
-                                display_name = model_id.replace("-", " ").title()
-                        
-                        models.append(ModelInfo(
-                            name=display_name,
-                            model_id=model_id,
-                            description=f"Model: {model_id}",
-                            size=None
-                        ))
-                    
-                    # 推奨モデルを追加（存在しない場合の仮想エントリ）
-                    recommended_models = [
-                        ModelInfo(
-                            name="Qwen 3 (32B)",
-                            model_id="qwen3:32B",
-                            description="Creative strategist persona - Recommended",
-                            size="32B"
-                        ),
-                        ModelInfo(
-                            name="GPT-OSS (120B)",
-                            model_id="gpt-oss:120b",
-                            description="Analytical persona - Recommended",
-                            size="120b"
-                        ),
-                        ModelInfo(
-                            name="Gemma 3 (27B)",
-                            model_id="gemma3:27b",
-                            description="Scholarly persona - Recommended",
-                            size="27b"
-                        )
-                    ]
-                    
-                    # 実際に存在するモデルかチェックして追加
-                    existing_ids = {m.model_id for m in models}
-                    for rec_model in recommended_models:
-                        if rec_model.model_id not in existing_ids:
-                            models.insert(0, rec_model)
-                    
-                    return models
-                else:
-                    raise HTTPException(status_code=500, detail="Failed to fetch models from Ollama")
-    except aiohttp.ClientError as e:
+        snapshot = await model_catalog.get()
+    except CatalogUnavailableError as e:
+        if e.status is not None:
+            raise HTTPException(status_code=500, detail="Failed to fetch models from Ollama")
         raise HTTPException(status_code=503, detail=f"Ollama service unavailable: {str(e)}")
 
+    # stale（最後に成功したカタログ）の場合はヘッダーで通知する
+    response.headers["X-Catalog-Stale"] = "true" if snapshot.stale else "false"
+    response.headers["X-Catalog-Age"] = f"{snapshot.age:.1f}"
+    return snapshot.models
+
+
+@app.get("/api/stats/catalog")
+async def get_catalog_stats():
+    return model_catalog.get_stats()
+
+
+@app.get("/api/stats/residency")
+async def get_residency_stats():
+    return model_residency.get_stats()
+
+
+@app.get("/api/stats/scheduler")
+async def get_scheduler_stats():
+    return request_scheduler.get_stats()
+
+
+@app.get("/api/stats/http")
+async def get_http_pool_stats():
+    return http_client.get_stats()
+
+
+def generation_options(message: dict) -> dict:
+    # 接続先と、Ollamaのプロンプトキャッシュ関連の設定（keep_alive, num_ctx/num_keep などのoptions）
+    kwargs = {"endpoint": OLLAMA_CHAT_URL}
+    if message.get("keep_alive") is not None:
+        kwargs["keep_alive"] = message["keep_alive"]
+    if message.get("options"):
+        kwargs["options"] = message["options"]
+    return kwargs
+
+
+def agent_options(message: dict, session: Optional[aiohttp.ClientSession] = None) -> dict:
+    # prompt_mode: "stable"（固定のsystem接頭辞＋差分のみ追加）または "legacy"（毎ターン全文）
+    kwargs = generation_options(message)
+    if message.get("prompt_mode"):
+        kwargs["prompt_mode"] = message["prompt_mode"]
+    # 履歴のトークン予算。超えた分は古いターンから要約（summarizer_model 指定時）または抽出的に圧縮する
+    if message.get("history_budget") is not None:
+        kwargs["history_budget"] = int(message["history_budget"])
+    if message.get("summarizer_model") and session is not None:
+        kwargs["summarizer"] = OllamaSummarizer(session, message["summarizer_model"], endpoint=OLLAMA_CHAT_URL,
+                                                keep_alive=message.get("keep_alive"),
+                                                scheduler=request_scheduler)
+    return kwargs
+
+
+def judge_options(message: dict) -> dict:
+    kwargs = generation_options(message)
+    if message.get("history_budget") is not None:
+        kwargs["token_budget"] = int(message["history_budget"])
+    if message.get("structured_verdict") is not None:
+        # スコアを読み取れなかった評価のあとに、JSONスキーマ制約の短い評決を求めるか
+        kwargs["structured_verdict"] = bool(message["structured_verdict"])
+    return kwargs
+
+
+def subscribe_options(message: dict) -> dict:
+    # 遅い観戦者への方針: "resync"（追いついたらスナップショット）または "drop"
+    options = message.get("stream") or {}
+    subscribe_kwargs = {}
+    if "slow_policy" in options:
+        subscribe_kwargs["policy"] = options["slow_policy"]
+    if "max_lag_chars" in options:
+        subscribe_kwargs["max_lag_chars"] = int(options["max_lag_chars"])
+    return subscribe_kwargs
+
+
+@app.get("/api/debates")
+async def list_debates():
+    return debate_hub.list_debates()
+
+
+@app.get("/api/debates/{debate_id}/timeline/{turn_index}")
+async def get_turn_timeline(debate_id: str, turn_index: int):
+    # ターン内のトークンのオフセットと受信時刻（リプレイ用）
+    broadcast = debate_hub.get(debate_id)
+    if broadcast is None:
+        raise HTTPException(status_code=404, detail="Debate not found")
+    try:
+        return broadcast.manager.get_turn_timeline(turn_index)
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Turn not found")
+
 
 @app.websocket("/ws/arena")
 async def websocket_arena(websocket: WebSocket):
     await websocket.accept()
     active_connections.append(websocket)
-    debate_manager = None
+    broadcast: Optional[DebateBroadcast] = None
+    subscriber: Optional[Subscriber] = None
+    # この接続が開始したディベートのみ stop_debate で停止できる
+    owns_debate = False
+    # 送信パイプライン（トークンのフレーム結合とバックプレッシャー）
+    sender = StreamSender(websocket)
+    sender.start()
+    
+    async def leave_debate():
+        nonlocal broadcast, subscriber, owns_debate
+        if broadcast and subscriber:
+            # 最後の観戦者が抜けると、進行中のOllamaストリームもキャンセルされる
+            await broadcast.unsubscribe(subscriber)
+        broadcast = None
+        subscriber = None
+        owns_debate = False
     
     try:
         while True:
-            # クライアントからのメッセージを受信
+            # クライアントからのメッセージを受信（ディベート実行中も処理される）
             data = await websocket.receive_text()
             message = json.loads(data)
             
             if message["action"] == "start_debate":
+                # 実行中のディベートがあれば先に抜ける
+                if owns_debate and broadcast:
+                    await broadcast.stop()
+                await leave_debate()
+                
                 # ディベートの開始
                 topic = message["topic"]
                 roles = message["roles"]
                 personas = message.get("personas", {})
+                sender.configure(StreamConfig.from_message(message))
                 
-                # エージェントの作成
+                # エージェントの作成（共有HTTPセッションを注入）
+                session = await http_client.start()
                 combatant_a = DebateAgent(
                     name="Agent A",
                     model_id=roles["combatant_a"],
-                    persona=personas.get("combatant_a", "You are a logical and analytical debater.")
+                    persona=personas.get("combatant_a", "You are a logical and analytical debater."),
+                    session=session,
+                    **agent_options(message, session)
                 )
                 
                 combatant_b = DebateAgent(
                     name="Agent B",
                     model_id=roles["combatant_b"],
-                    persona=personas.get("combatant_b", "You are a creative and persuasive debater.")
+                    persona=personas.get("combatant_b", "You are a creative and persuasive debater."),
+                    session=session,
+                    **agent_options(message, session)
                 )
                 
                 judge = JudgeAgent(
                     name="Judge",
-                    model_id=roles["judge"]
+                    model_id=roles["judge"],
+                    session=session,
+                    **judge_options(message)
                 )
                 
                 # ディベートマネージャーの作成
@@ -199,130 +372,124 @@ async def websocket_arena(websocket: WebSocket):
                     topic=topic,
                     combatant_a=combatant_a,
                     combatant_b=combatant_b,
-                    judge=judge
+                    judge=judge,
+                    session=session,
+                    # warm_up: false でプリロードを行わない
+                    residency=model_residency if message.get("warm_up", True) else None,
+                    scheduler=request_scheduler
                 )
                 
-                await debate_manager.start_debate()
-                
-                # ディベート開始の通知
-                await websocket.send_json({
-                    "type": "debate_started",
-                    "topic": topic,
-                    "agents": {
-                        "combatant_a": combatant_a.model_id,
-                        "combatant_b": combatant_b.model_id,
-                        "judge": judge.model_id
-                    }
-                })
-                
-                # ディベートフローの実行
-                debate_order = [
-                    AgentRole.COMBATANT_A,
-                    AgentRole.COMBATANT_B,
-                    AgentRole.COMBATANT_A,
-                    AgentRole.COMBATANT_B,
-                    AgentRole.COMBATANT_A,
-                    AgentRole.COMBATANT_B,
-                    AgentRole.JUDGE
-                ]
-                
-                for agent_role in debate_order:
-                    # ターン開始の通知
-                    agent_name = "judge" if agent_role == AgentRole.JUDGE else (
-                        "A" if agent_role == AgentRole.COMBATANT_A else "B"
-                    )
-                    
-                    await websocket.send_json({
-                        "type": "turn_start",
-                        "agent": agent_name
-                    })
-                    
-                    # ストリーミング応答の送信
-                    async for chunk in debate_manager.process_turn_stream(agent_role):
-                        await websocket.send_json(chunk)
-                    
-                    # ターン終了の通知
-                    await websocket.send_json({
-                        "type": "turn_end",
-                        "agent": agent_name
+                # ディベートはバックグラウンドで1回だけ生成され、購読者全員に配信される
+                broadcast = debate_hub.create(debate_manager)
+                subscriber = broadcast.subscribe(sender, **subscribe_options(message))
+                owns_debate = True
+            
+            elif message["action"] == "join_debate":
+                # 既存のディベートを観戦（完了済みターンのスナップショットから開始）
+                target = debate_hub.get(message.get("debate_id", ""))
+                if target is None:
+                    await sender.send({
+                        "type": "error",
+                        "message": f"Unknown debate: {message.get('debate_id')}"
                     })
-                
-                # ディベート終了の通知
-                summary = debate_manager.get_debate_summary()
-                await websocket.send_json({
-                    "type": "debate_ended",
-                    "summary": summary
-                })
+                    continue
+                if owns_debate and broadcast and broadcast is not target:
+                    await broadcast.stop()
+                await leave_debate()
+                sender.configure(StreamConfig.from_message(message))
+                broadcast = target
+                subscriber = broadcast.subscribe(sender, **subscribe_options(message))
+            
+            elif message["action"] == "leave_debate":
+                await leave_debate()
+                await sender.send({"type": "debate_left"})
                 
             elif message["action"] == "get_status":
                 # 現在の状態を返す
-                if debate_manager:
-                    summary = debate_manager.get_debate_summary()
-                    await websocket.send_json({
+                if broadcast:
+                    summary = broadcast.manager.get_debate_summary()
+                    summary["debate_id"] = broadcast.debate_id
+                    summary["spectators"] = len(broadcast.subscribers)
+                    await sender.send({
                         "type": "status",
                         "data": summary
                     })
                 else:
-                    await websocket.send_json({
+                    await sender.send({
                         "type": "status",
                         "data": {"state": "no_active_debate"}
                     })
             
             elif message["action"] == "stop_debate":
-                # ディベートの停止
-                if debate_manager:
-                    await debate_manager.__aexit__(None, None, None)
-                    debate_manager = None
-                    await websocket.send_json({
-                        "type": "debate_stopped"
-                    })
+                # ディベートの停止（進行中のOllamaストリームもキャンセル）
+                # 観戦者の場合は自分だけ抜ける
+                if broadcast:
+                    # 実行中なら debate_stopped は全観戦者に配信される
+                    notify = not (owns_debate and broadcast.running)
+                    if owns_debate:
+                        await broadcast.stop()
+                    await leave_debate()
+                    if notify:
+                        await sender.send({
+                            "type": "debate_stopped"
+                        })
     
     except WebSocketDisconnect:
         active_connections.remove(websocket)
-        if debate_manager:
-            await debate_manager.__aexit__(None, None, None)
+        await leave_debate()
     except Exception as e:
-        await websocket.send_json({
+        await sender.send({
             "type": "error",
             "message": str(e)
         })
-        if debate_manager:
-            await debate_manager.__aexit__(None, None, None)
+        await leave_debate()
+    finally:
+        await sender.close()
 
 
 @app.post("/api/debate/start")
 async def start_debate(request: StartDebateRequest):
-    # HTTPエンドポイント版（オプション）
-    debate_id = f"debate_{datetime.now().timestamp()}"
+    # HTTPエンドポイント版（オプション）: 開始したディベートは /ws/arena の join_debate で観戦する
+    session = await http_client.start()
     
     combatant_a = DebateAgent(
         name="Agent A",
         model_id=request.combatant_a,
-        persona=request.personas.get("combatant_a") if request.personas else None
+        persona=request.personas.get("combatant_a") if request.personas else None,
+        session=session,
+        **agent_options(request.model_dump(), session)
     )
     
     combatant_b = DebateAgent(
         name="Agent B",
         model_id=request.combatant_b,
-        persona=request.personas.get("combatant_b") if request.personas else None
+        persona=request.personas.get("combatant_b") if request.personas else None,
+        session=session,
+        **agent_options(request.model_dump(), session)
     )
     
     judge = JudgeAgent(
         name="Judge",
-        model_id=request.judge
+        model_id=request.judge,
+        session=session,
+        **judge_options(request.model_dump())
     )
     
     debate_manager = DebateManager(
         topic=request.topic,
         combatant_a=combatant_a,
         combatant_b=combatant_b,
-        judge=judge
+        judge=judge,
+        session=session,
+        residency=model_residency if request.warm_up else None,
+        scheduler=request_scheduler
     )
     
-    active_debates[debate_id] = debate_manager
+    # 観戦者がいなくても最後まで実行する
+    broadcast = debate_hub.create(debate_manager, stop_when_empty=False)
     
     return {
-        "debate_id": debate_id,
+        "debate_id": broadcast.debate_id,
         "status": "started",
         "topic": request.topic
     }
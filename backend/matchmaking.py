@@ -0,0 +1,118 @@
+import math
+from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class MatchmakingStats:
+    prompts: int = 0
+    judge_calls: int = 0  # 選ばれた（審判に回した）対戦数
+    exhaustive_calls: int = 0  # 全組み合わせを判定した場合の対戦数
+    settled_pairs: int = 0
+
+
+class Matchmaker:
+    """評価が不確かな組を優先して対戦を選ぶ（全組み合わせの代わり）
+
+    各組について勝ち分の平均と分散を持ち、順序が統計的に確定した組（平均と0.5の差が
+    z 標準誤差を超えた組）はそれ以上選ばない。残りの組は、順序の不確かさ（t統計量が小さい）ほど、
+    またその組の対戦数が少ないほど情報量が大きいとみなして選ぶ。
+    審判の勝ち分は0.5付近に縮みやすくEloの差がほとんど開かないため、レーティングの接近度ではなく
+    組ごとの観測から直接不確かさを測る。
+    pairs_per_prompt はプロンプトごと、judge_budget は実行全体の審判呼び出し数の上限。
+    """
+
+    def __init__(self, n_models: int, pairs_per_prompt: Optional[int] = None,
+                 judge_budget: Optional[int] = None, z: float = 1.96, min_battles: int = 3,
+                 min_variance: float = 0.01):
+        self.n_models = n_models
+        self.pairs_per_prompt = pairs_per_prompt or max(1, n_models - 1)
+        self.judge_budget = judge_budget
+        self.z = z
+        self.min_battles = min_battles
+        self.min_variance = min_variance
+        self.count = np.zeros((n_models, n_models))
+        self.share_sum = np.zeros((n_models, n_models))
+        self.share_sq = np.zeros((n_models, n_models))
+        self.settled = np.zeros((n_models, n_models), dtype=bool)
+        self.stats = MatchmakingStats()
+        self._upper = np.triu_indices(n_models, k=1)
+
+    @property
+    def exhausted(self) -> bool:
+        # 予算を使い切ったか、すべての組の順序が確定した
+        if self.judge_budget is not None and self.stats.judge_calls >= self.judge_budget:
+            return True
+        return bool(self.settled[self._upper].all())
+
+    def _variance(self, n, mean, sq):
+        # 不偏分散。毎回同じ勝ち分（分散0）でも数戦で確定しないよう下限を設ける
+        variance = np.maximum(sq / np.maximum(n, 1) - mean * mean, 0.0) * n / np.maximum(n - 1, 1)
+        return np.maximum(variance, self.min_variance)
+
+    def _informativeness(self) -> np.ndarray:
+        n = self.count
+        mean = np.divide(self.share_sum, n, out=np.full_like(n, 0.5), where=n > 0)
+        t_squared = (mean - 0.5) ** 2 / (self._variance(n, mean, self.share_sq) / np.maximum(n, 1))
+        return 1.0 / (1.0 + t_squared) / np.sqrt(1.0 + n)
+
+    def select_pairs(self) -> List[Tuple[int, int]]:
+        """次のプロンプトで判定する組 (i < j) を選び、その分の予算を確保する"""
+        limit = self.pairs_per_prompt
+        if self.judge_budget is not None:
+            limit = min(limit, self.judge_budget - self.stats.judge_calls)
+        if limit <= 0:
+            return []
+
+        rows, cols = self._upper
+        open_pairs = ~self.settled[rows, cols]
+        rows, cols = rows[open_pairs], cols[open_pairs]
+        if len(rows) == 0:
+            return []
+        score = self._informativeness()[rows, cols]
+
+        # 同じモデルばかり選ばないよう、選ばれたモデルを含む組は少し割り引いて順に選ぶ
+        usage = np.zeros(self.n_models)
+        chosen: List[Tuple[int, int]] = []
+        available = np.ones(len(rows), dtype=bool)
+        for _ in range(min(limit, len(rows))):
+            adjusted = np.where(available, score / (1.0 + 0.5 * (usage[rows] + usage[cols])), -np.inf)
+            best = int(np.argmax(adjusted))
+            available[best] = False
+            i, j = int(rows[best]), int(cols[best])
+            usage[i] += 1
+            usage[j] += 1
+            chosen.append((i, j))
+        self.stats.prompts += 1
+        self.stats.exhaustive_calls += self.n_models * (self.n_models - 1) // 2
+        self.stats.judge_calls += len(chosen)
+        return chosen
+
+    def record(self, model1: int, model2: int, share: float):
+        # share は model1 の勝ち分（0〜1）
+        i, j = (model1, model2) if model1 < model2 else (model2, model1)
+        if i != model1:
+            share = 1.0 - share
+        self.count[i, j] += 1
+        self.share_sum[i, j] += share
+        self.share_sq[i, j] += share * share
+        n = self.count[i, j]
+        if n >= self.min_battles and not self.settled[i, j]:
+            mean = self.share_sum[i, j] / n
+            variance = float(self._variance(n, mean, self.share_sq[i, j]))
+            if abs(mean - 0.5) > self.z * math.sqrt(variance / n):
+                self.settled[i, j] = True
+                self.stats.settled_pairs += 1
+
+    def get_stats(self) -> Dict:
+        stats = self.stats
+        return {
+            "prompts": stats.prompts,
+            "judge_calls": stats.judge_calls,
+            "exhaustive_calls": stats.exhaustive_calls,
+            "saved_calls": stats.exhaustive_calls - stats.judge_calls,
+            "settled_pairs": stats.settled_pairs,
+            "open_pairs": int((~self.settled[self._upper]).sum())
+        }
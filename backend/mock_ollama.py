@@ -0,0 +1,437 @@
+"""Mock Ollama server for load and latency testing without real models.
+
+Serves /api/chat (NDJSON streaming or a single JSON reply), /v1/chat/completions (SSE streaming or
+a single JSON reply), /api/tags, /api/ps and /api/version. It simulates time to first token,
+tokens per second, jitter, model load delays and injected errors. Replies are deterministic for a
+given model and conversation. Judge prompts get replies that the arena and debate parsers accept:
+`Label: [score]` placeholders are filled in and `format` / `response_format` JSON schemas are
+honoured. GET /mock/stats returns counters; POST /mock/settings changes the knobs while running.
+
+Usage: python mock_ollama.py [--port 11434] [--ttft 0.2] [--tps 50] [--jitter 0.1]
+                             [--error-rate 0] [--stream-error-rate 0] [--load-delay 1.0]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import asdict, dataclass, field
+
+from aiohttp import web
+
+DEFAULT_MODELS = ["llama3:latest", "gemma3:latest", "qwen3:latest", "mistral:latest", "openhermes:latest",
+                  "phi3:14b", "gpt-3.5-turbo"]
+MODEL_SIZE = 4 * 1024 ** 3
+
+_WORDS = ("the model argues that evidence supports a clear and careful answer while the other side "
+          "raises several points about cost risk context and long term effects which seem reasonable "
+          "but need more data so overall this response is coherent relevant and mostly accurate").split()
+
+# 審判のプロンプト中の「ラベル: [score]」「Winner: [Agent A/Agent B/Tie]」のような記入欄
+_PLACEHOLDER = re.compile(r"^[ \t\-*]*(?P<label>[^\n:：\[\]]+?)\s*[:：]\s*\[(?P<slot>[^\]\n]+)\]\s*$", re.M)
+_SCORE_SLOT = re.compile(r"^(?:score|(\d+)\s*[-〜~]\s*(\d+))$", re.I)
+_NUMBERED = re.compile(r"^(.*?)(\d+)$")
+_RESPONSE_ENTRY = re.compile(r"^Response (\d+):", re.M)
+
+
+@dataclass
+class MockSettings:
+    ttft: float = 0.2  # 最初のトークンまでの秒数（プロンプト評価の時間）
+    tokens_per_sec: float = 50.0
+    jitter: float = 0.1  # 待ち時間ごとに ±jitter の割合でばらつかせる
+    error_rate: float = 0.0  # 生成を始める前にHTTPエラーを返す割合
+    error_status: int = 500
+    stream_error_rate: float = 0.0  # ストリームの途中でエラーのフレームを返して終える割合
+    load_delay: float = 1.0  # ロードされていないモデルの最初のリクエストにかかる秒数
+    response_tokens: int = 64  # 通常の応答のトークン数（num_predict / max_tokens が小さければそこで切る）
+    models: List[str] = field(default_factory=lambda: list(DEFAULT_MODELS))
+    strict_models: bool = False  # True なら models にないモデルは404（Ollamaと同じ）
+    seed: int = 0
+
+
+@dataclass
+class MockStats:
+    requests: int = 0
+    errors: int = 0
+    stream_errors: int = 0
+    loads: int = 0
+    unloads: int = 0
+    tokens: int = 0
+    active: int = 0
+    max_active: int = 0
+
+
+def _is_zero_keep_alive(value: Any) -> bool:
+    return value in (0, "0", "0s", "0m")
+
+
+def sample_schema(schema: Dict[str, Any], rng: random.Random, filler: str) -> Any:
+    """JSONスキーマに合う値を作る（審判の評決スキーマで使う型と制約だけを扱う）"""
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    kind = schema.get("type", "object")
+    if kind == "object":
+        return {name: sample_schema(sub, rng, filler) for name, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        low = schema.get("minItems", 1)
+        size = rng.randint(low, schema.get("maxItems", max(low, 3)))
+        return [sample_schema(schema.get("items", {}), rng, filler) for _ in range(size)]
+    if kind == "integer":
+        return rng.randint(schema.get("minimum", 1), schema.get("maximum", 10))
+    if kind == "number":
+        return round(rng.uniform(schema.get("minimum", 0.0), schema.get("maximum", 1.0)), 3)
+    if kind == "boolean":
+        return rng.random() < 0.5
+    return filler[:schema.get("maxLength", len(filler))]
+
+
+class MockOllama:
+    def __init__(self, settings: Optional[MockSettings] = None):
+        self.settings = settings or MockSettings()
+        self.stats = MockStats()
+        self.loaded: Dict[str, float] = {}  # モデル -> ロードした時刻
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._rng = random.Random(self.settings.seed)  # タイミングとエラー注入用
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/api/tags", self.tags)
+        app.router.add_get("/api/ps", self.ps)
+        app.router.add_get("/api/version", self.version)
+        app.router.add_post("/api/chat", self.chat)
+        app.router.add_post("/v1/chat/completions", self.openai_chat)
+        app.router.add_get("/mock/stats", self.get_stats)
+        app.router.add_post("/mock/settings", self.update_settings)
+        return app
+
+    # --- 応答の中身 ---
+
+    def _reply_rng(self, model: str, messages: List[Dict[str, Any]]) -> random.Random:
+        # 同じモデル・同じ会話には同じ応答を返す（プロセスをまたいでも同じになるようにハッシュで種を作る）
+        digest = hashlib.sha256(json.dumps([self.settings.seed, model, messages], sort_keys=True).encode()).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    @staticmethod
+    def _filler(rng: random.Random, words: int) -> str:
+        return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+    def _fill_placeholders(self, prompt: str, rng: random.Random) -> Optional[str]:
+        slots = [(match.group("label").strip(), match.group("slot").strip()) for match in _PLACEHOLDER.finditer(prompt)]
+        if not slots:
+            return None
+        # 「Score-1」「Score-2」「...」のような番号付きの欄は、列挙された Response の数まで増やす
+        responses = [int(number) for number in _RESPONSE_ENTRY.findall(prompt)]
+        numbered = [_NUMBERED.match(label) for label, _ in slots]
+        if responses and any(numbered):
+            last = max(i for i, match in enumerate(numbered) if match)
+            prefix, slot = numbered[last].group(1), slots[last][1]
+            present = {label for label, _ in slots}
+            slots[last + 1:last + 1] = [(f"{prefix}{n}", slot) for n in range(1, max(responses) + 1)
+                                        if f"{prefix}{n}" not in present]
+
+        lines, scores = [], []
+        for label, slot in slots:
+            score_slot = _SCORE_SLOT.match(slot)
+            if score_slot:
+                low, high = (int(score_slot.group(1)), int(score_slot.group(2))) if score_slot.group(1) else (1, 10)
+                scores.append(rng.randint(low, high))
+                value = str(scores[-1])
+            elif "/" in slot:
+                options = [option.strip() for option in slot.split("/")]
+                if len(options) == 3 and len(scores) == 2:
+                    # 勝者の欄はスコアと食い違わないように選ぶ（A/B/引き分け）
+                    value = options[0] if scores[0] > scores[1] else options[1] if scores[1] > scores[0] else options[2]
+                else:
+                    value = rng.choice(options)
+            else:
+                value = self._filler(rng, 24) + "."
+            lines.append(f"{label}: {value}")
+        return "\n".join(lines)
+
+    def _reply(self, model: str, messages: List[Dict[str, Any]], schema: Any) -> str:
+        rng = self._reply_rng(model, messages)
+        if schema is not None:
+            filler = self._filler(rng, 12) + "."
+            if isinstance(schema, dict):
+                return json.dumps(sample_schema(schema, rng, filler))
+            return json.dumps({"response": filler})  # format: "json"
+        prompt = str(messages[-1].get("content", "")) if messages else ""
+        filled = self._fill_placeholders(prompt, rng)
+        if filled is not None:
+            return filled
+        return self._filler(rng, self.settings.response_tokens)
+
+    @staticmethod
+    def _tokenize(text: str) -> List[str]:
+        # 空白区切りの語（と後続の空白）を1トークンとする。JSONは4文字ずつ
+        if text.startswith("{"):
+            return [text[i:i + 4] for i in range(0, len(text), 4)]
+        return re.findall(r"\S+\s*", text) or [text]
+
+    # --- タイミング ---
+
+    def _jittered(self, seconds: float) -> float:
+        jitter = self.settings.jitter
+        return max(0.0, seconds * self._rng.uniform(1.0 - jitter, 1.0 + jitter)) if jitter else seconds
+
+    async def _ensure_loaded(self, model: str) -> float:
+        """モデルがロードされていなければロードを待ち、その秒数を返す（同時リクエストは同じロードを待つ）"""
+        if model in self.loaded:
+            return 0.0
+        loading = self._loading.get(model)
+        started = time.perf_counter()
+        if loading is None:
+            loading = self._loading[model] = asyncio.get_running_loop().create_future()
+            self.stats.loads += 1
+            try:
+                await asyncio.sleep(self._jittered(self.settings.load_delay))
+                self.loaded[model] = time.time()
+            finally:
+                del self._loading[model]
+                loading.set_result(None)
+        else:
+            await asyncio.shield(loading)
+        return time.perf_counter() - started
+
+    def _known(self, model: str) -> bool:
+        if model in self.settings.models:
+            return True
+        if self.settings.strict_models:
+            return False
+        self.settings.models.append(model)
+        return True
+
+    def _inject_error(self) -> bool:
+        if self.settings.error_rate and self._rng.random() < self.settings.error_rate:
+            self.stats.errors += 1
+            return True
+        return False
+
+    def _stream_error_at(self, count: int) -> Optional[int]:
+        # ストリームの途中で失敗させる位置（失敗させないなら None）
+        if count > 1 and self.settings.stream_error_rate and self._rng.random() < self.settings.stream_error_rate:
+            return self._rng.randrange(1, count)
+        return None
+
+    async def _generate(self, model: str, messages: List[Dict[str, Any]], schema: Any,
+                        max_tokens: Optional[int]):
+        """(トークン, None) を送出間隔どおりに返し、最後に (None, 統計) を返す
+
+        ストリームの途中で失敗させる場合は、統計の代わりに (None, None) を返して終える。
+        """
+        started = time.perf_counter()
+        load = await self._ensure_loaded(model)
+        reply = self._reply(model, messages, schema)
+        tokens = self._tokenize(reply)
+        done_reason = "stop"
+        if max_tokens is not None and len(tokens) > max_tokens:
+            tokens, done_reason = tokens[:max_tokens], "length"
+
+        await asyncio.sleep(self._jittered(self.settings.ttft))
+        first = time.perf_counter()
+        fail_at = self._stream_error_at(len(tokens))
+        interval = 1.0 / self.settings.tokens_per_sec if self.settings.tokens_per_sec > 0 else 0.0
+        deadline = first
+        for i, token in enumerate(tokens):
+            if i:
+                # 遅れを次のトークンに持ち越さないよう、予定時刻に合わせて待つ
+                deadline += self._jittered(interval)
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if i == fail_at:
+                self.stats.stream_errors += 1
+                yield None, None
+                return
+            self.stats.tokens += 1
+            yield token, None
+        finished = time.perf_counter()
+        prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in messages)
+        yield None, {
+            "done_reason": done_reason,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int((first - started - load) * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int((finished - first) * 1e9),
+            "load_duration": int(load * 1e9),
+            "total_duration": int((finished - started) * 1e9)
+        }
+
+    def _enter(self):
+        self.stats.requests += 1
+        self.stats.active += 1
+        self.stats.max_active = max(self.stats.max_active, self.stats.active)
+
+    # --- Ollama API ---
+
+    async def tags(self, request: web.Request) -> web.Response:
+        return web.json_response({"models": [{"name": model, "model": model, "size": MODEL_SIZE}
+                                             for model in self.settings.models]})
+
+    async def ps(self, request: web.Request) -> web.Response:
+        return web.json_response({"models": [{"name": model, "model": model, "size": MODEL_SIZE, "size_vram": MODEL_SIZE}
+                                             for model in self.loaded]})
+
+    async def version(self, request: web.Request) -> web.Response:
+        return web.json_response({"version": "0.0.0-mock"})
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        model = body.get("model", "")
+        messages = body.get("messages") or []
+        if not self._known(model):
+            return web.json_response({"error": f"model '{model}' not found"}, status=404)
+        if not messages:
+            # メッセージなしのリクエストはロード（keep_alive: 0 ならアンロード）
+            if _is_zero_keep_alive(body.get("keep_alive")):
+                if self.loaded.pop(model, None) is not None:
+                    self.stats.unloads += 1
+                return web.json_response({"model": model, "done": True, "done_reason": "unload"})
+            load = await self._ensure_loaded(model)
+            return web.json_response({"model": model, "done": True, "done_reason": "load",
+                                      "load_duration": int(load * 1e9)})
+
+        self._enter()
+        try:
+            if self._inject_error():
+                return web.json_response({"error": "mock: injected error"}, status=self.settings.error_status)
+            options = body.get("options") or {}
+            generation = self._generate(model, messages, body.get("format"), options.get("num_predict"))
+            if not body.get("stream", True):
+                content = []
+                async for token, final in generation:
+                    if token is None and final is None:
+                        return web.json_response({"error": "mock: injected error"}, status=self.settings.error_status)
+                    if token is None:
+                        return web.json_response({"model": model, "message": {"role": "assistant", "content": "".join(content)},
+                                                  "done": True, **final})
+                    content.append(token)
+
+            response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+            await response.prepare(request)
+            async for token, final in generation:
+                if token is not None:
+                    frame = {"model": model, "message": {"role": "assistant", "content": token}, "done": False}
+                elif final is not None:
+                    frame = {"model": model, "done": True, **final}
+                else:
+                    frame = {"error": "mock: injected stream error"}
+                await response.write((json.dumps(frame) + "\n").encode())
+            await response.write_eof()
+            return response
+        finally:
+            self.stats.active -= 1
+
+    # --- OpenAI互換API ---
+
+    async def openai_chat(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        model = body.get("model", "")
+        if not self._known(model):
+            return web.json_response({"error": {"message": f"model '{model}' not found", "type": "not_found"}}, status=404)
+        self._enter()
+        try:
+            if self._inject_error():
+                return web.json_response({"error": {"message": "mock: injected error", "type": "server_error"}},
+                                         status=self.settings.error_status)
+            response_format = body.get("response_format") or {}
+            schema = None
+            if response_format.get("type") == "json_schema":
+                schema = (response_format.get("json_schema") or {}).get("schema", {})
+            elif response_format.get("type") == "json_object":
+                schema = "json"
+            generation = self._generate(model, body.get("messages") or [], schema, body.get("max_tokens"))
+            created = int(time.time())
+
+            def usage(final: Dict[str, Any]) -> Dict[str, int]:
+                return {"prompt_tokens": final["prompt_eval_count"], "completion_tokens": final["eval_count"],
+                        "total_tokens": final["prompt_eval_count"] + final["eval_count"]}
+
+            if not body.get("stream", False):
+                content = []
+                async for token, final in generation:
+                    if token is None and final is None:
+                        return web.json_response({"error": {"message": "mock: injected error", "type": "server_error"}},
+                                                 status=self.settings.error_status)
+                    if token is None:
+                        return web.json_response({
+                            "object": "chat.completion", "created": created, "model": model,
+                            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(content)},
+                                         "finish_reason": final["done_reason"]}],
+                            "usage": usage(final)
+                        })
+                    content.append(token)
+
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+
+            async def send(data: Dict[str, Any]):
+                await response.write(f"data: {json.dumps(data)}\n\n".encode())
+
+            async for token, final in generation:
+                if token is not None:
+                    await send({"object": "chat.completion.chunk", "created": created, "model": model,
+                                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+                elif final is not None:
+                    await send({"object": "chat.completion.chunk", "created": created, "model": model,
+                                "choices": [{"index": 0, "delta": {}, "finish_reason": final["done_reason"]}],
+                                "usage": usage(final)})
+                    await response.write(b"data: [DONE]\n\n")
+                else:
+                    await send({"error": {"message": "mock: injected stream error", "type": "server_error"}})
+            await response.write_eof()
+            return response
+        finally:
+            self.stats.active -= 1
+
+    # --- 試験用 ---
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({**asdict(self.stats), "loaded": list(self.loaded), "settings": asdict(self.settings)})
+
+    async def update_settings(self, request: web.Request) -> web.Response:
+        changes = await request.json()
+        unknown = set(changes) - set(asdict(self.settings))
+        if unknown:
+            return web.json_response({"error": f"unknown settings: {sorted(unknown)}"}, status=400)
+        for name, value in changes.items():
+            setattr(self.settings, name, value)
+        return web.json_response(asdict(self.settings))
+
+
+def parse_args(argv: Optional[List[str]] = None) -> Tuple[str, int, MockSettings]:
+    parser = argparse.ArgumentParser(description="Mock Ollama server for load and latency testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--ttft", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tps", type=float, default=50.0, help="tokens per second")
+    parser.add_argument("--jitter", type=float, default=0.1, help="relative jitter of every delay (0-1)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with an HTTP error")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--stream-error-rate", type=float, default=0.0, help="share of streams failing midway")
+    parser.add_argument("--load-delay", type=float, default=1.0, help="seconds to load a cold model")
+    parser.add_argument("--response-tokens", type=int, default=64, help="reply length (cut at num_predict/max_tokens)")
+    parser.add_argument("--models", nargs="*", default=DEFAULT_MODELS)
+    parser.add_argument("--strict-models", action="store_true", help="404 for models not in --models")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    settings = MockSettings(ttft=args.ttft, tokens_per_sec=args.tps, jitter=args.jitter, error_rate=args.error_rate,
+                            error_status=args.error_status, stream_error_rate=args.stream_error_rate,
+                            load_delay=args.load_delay, response_tokens=args.response_tokens,
+                            models=list(args.models), strict_models=args.strict_models, seed=args.seed)
+    return args.host, args.port, settings
+
+
+def main():
+    host, port, settings = parse_args()
+    print(f"Mock Ollama on http://{host}:{port} (ttft {settings.ttft}s, {settings.tokens_per_sec} tok/s, "
+          f"jitter {settings.jitter}, errors {settings.error_rate}/{settings.stream_error_rate}, "
+          f"load {settings.load_delay}s)")
+    web.run_app(MockOllama(settings).app(), host=host, port=port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import asyncio
+import time
+import aiohttp
+from typing import Any, Callable, List, Optional
+from dataclasses import dataclass, field
+
+from http_client import SharedHTTPClient
+
+
+class CatalogUnavailableError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class CatalogSnapshot:
+    models: List[Any] = field(default_factory=list)
+    fetched_at: float = 0.0
+    stale: bool = False
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+
+class ModelCatalog:
+    """Ollamaの /api/tags をTTLキャッシュし、同時ミスを1回の上流呼び出しにまとめる"""
+
+    def __init__(self, client: SharedHTTPClient, tags_url: str = "http://localhost:11434/api/tags",
+                 transform: Optional[Callable[[dict], List[Any]]] = None,
+                 ttl: float = 30.0, refresh_interval: float = 15.0, upstream_timeout: float = 2.0):
+        self.client = client
+        self.tags_url = tags_url
+        self.transform = transform or (lambda data: data.get("models", []))
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        # 最後に成功したカタログがある場合、この時間を超えたら待たずにstaleを返す
+        self.upstream_timeout = upstream_timeout
+        self.last_error: Optional[str] = None
+        self.last_status: Optional[int] = None
+        self.upstream_calls = 0
+        self.hits = 0
+        self.misses = 0
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._inflight: Optional[asyncio.Task] = None
+        self._refresher: Optional[asyncio.Task] = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.last_error is None and self.last_status == 200
+
+    async def _fetch(self) -> CatalogSnapshot:
+        self.upstream_calls += 1
+        try:
+            session = await self.client.start()
+            async with session.get(self.tags_url) as response:
+                self.last_status = response.status
+                if response.status != 200:
+                    raise CatalogUnavailableError(
+                        f"Ollama returned status {response.status}", status=response.status
+                    )
+                data = await response.json()
+            models = self.transform(data)
+        except CatalogUnavailableError as e:
+            self.last_error = str(e)
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.last_status = None
+            self.last_error = str(e) or type(e).__name__
+            raise CatalogUnavailableError(self.last_error) from e
+        except (ValueError, KeyError, TypeError) as e:
+            # 200でも本文がJSONとして読めない・想定した形でない場合は上流の障害として扱う
+            self.last_error = f"Invalid catalog response: {type(e).__name__}: {e}"
+            raise CatalogUnavailableError(self.last_error) from e
+
+        self.last_error = None
+        self._snapshot = CatalogSnapshot(models=models, fetched_at=time.monotonic())
+        return self._snapshot
+
+    def refresh(self) -> "asyncio.Task[CatalogSnapshot]":
+        # single-flight: 実行中の取得があればそれに相乗りする
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._fetch())
+            # 誰もawaitしなかった場合の "exception was never retrieved" を防ぐ
+            self._inflight.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return self._inflight
+
+    async def get(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.age < self.ttl:
+            self.hits += 1
+            return snapshot
+
+        self.misses += 1
+        task = self.refresh()
+        if snapshot is None:
+            return await asyncio.shield(task)
+
+        # 最後に成功したカタログを持っている場合は上流の遅延・障害をstaleで吸収する
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.upstream_timeout)
+        except (asyncio.TimeoutError, CatalogUnavailableError):
+            return CatalogSnapshot(models=snapshot.models, fetched_at=snapshot.fetched_at, stale=True)
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await asyncio.shield(self.refresh())
+            except CatalogUnavailableError:
+                pass
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        for task in (self._refresher, self._inflight):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, CatalogUnavailableError):
+                    pass
+        self._refresher = None
+        self._inflight = None
+
+    def get_stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "upstream_calls": self.upstream_calls,
+            "age": self._snapshot.age if self._snapshot else None,
+            "ttl": self.ttl,
+            "last_status": self.last_status,
+            "last_error": self.last_error,
+        }
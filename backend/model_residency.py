@@ -0,0 +1,275 @@
+import asyncio
+import time
+import aiohttp
+from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field
+
+from http_client import SharedHTTPClient
+from ollama_stream import ChatStream, GenerationStats, OllamaStreamError
+from request_scheduler import PRIORITY_INTERACTIVE, RequestScheduler
+
+
+# load_duration がこれを超えたターンはモデルのロード（コールドスタート）を含んでいたとみなす
+COLD_LOAD_THRESHOLD = 0.5
+# ロード・アンロード要求のスケジューラ上のフロー名（ディベートのフローとは別に公平に扱われる）
+RESIDENCY_FLOW = "residency"
+
+
+@dataclass
+class ResidentModel:
+    model_id: str
+    size: int = 0  # バイト数（/api/ps の値、未取得なら /api/tags のディスクサイズ）
+    loaded_at: float = 0.0
+    last_used: float = 0.0
+
+
+@dataclass
+class WarmupResult:
+    model_id: str
+    wall_time: float = 0.0  # リクエスト開始から完了までの実測
+    load_duration: Optional[float] = None  # Ollamaが報告したロード時間
+    error: Optional[str] = None
+
+
+@dataclass
+class TurnPlan:
+    model_id: str
+    load: bool = False  # このターンの前にロードが必要
+    evict: List[str] = field(default_factory=list)  # ターン開始前にアンロードするモデル
+    prefetch: Optional[str] = None  # このターンの生成中に裏でロードしておくモデル
+    prefetch_evict: List[str] = field(default_factory=list)  # 先読みのために空けるモデル
+
+
+@dataclass
+class ResidencyStats:
+    warmups: int = 0
+    warmup_errors: int = 0
+    cold_loads: int = 0
+    prefetches: int = 0
+    unloads: int = 0
+    total_load_time: float = 0.0
+
+
+class ModelResidency:
+    """Ollama上に常駐しているモデルをメモリ予算に対して管理する
+
+    ディベート開始時に最初のターンのモデルをプリロードし、以降のモデルは前のターンの生成中に先読みする。
+    予算に収まらない場合はターン順から「次に使われるのが最も遅いモデル」を追い出す計画を立てて
+    入れ替えを最小化する。
+    scheduler を渡すと、ロード・アンロードの要求も対話用の優先度で実行枠を確保してから送る。
+    """
+
+    def __init__(self, client: SharedHTTPClient, base_url: str = "http://localhost:11434",
+                 memory_budget: Optional[int] = None, keep_alive: Optional[str] = "30m",
+                 scheduler: Optional[RequestScheduler] = None):
+        self.client = client
+        self.base_url = base_url.rstrip("/")
+        self.scheduler = scheduler
+        # None の場合は予算なし（すべて常駐できる前提）
+        self.memory_budget = memory_budget
+        self.keep_alive = keep_alive
+        self.resident: Dict[str, ResidentModel] = {}
+        self.sizes: Dict[str, int] = {}
+        self.load_times: Dict[str, float] = {}
+        self.stats = ResidencyStats()
+
+    def _stream(self, session: aiohttp.ClientSession, payload: Dict[str, Any]) -> ChatStream:
+        return ChatStream(session, f"{self.base_url}/api/chat", payload, scheduler=self.scheduler,
+                          priority=PRIORITY_INTERACTIVE, flow=RESIDENCY_FLOW)
+
+    def _size(self, model_id: str) -> int:
+        return self.sizes.get(model_id, 0)
+
+    def _fits(self, model_ids: List[str]) -> bool:
+        if self.memory_budget is None:
+            return True
+        return sum(self._size(model_id) for model_id in set(model_ids)) <= self.memory_budget
+
+    async def refresh_sizes(self):
+        # ディスク上のサイズを既定値にし、ロード済みモデルは /api/ps の実サイズで上書きする
+        session = await self.client.start()
+        try:
+            async with session.get(f"{self.base_url}/api/tags") as response:
+                if response.status == 200:
+                    for model in (await response.json()).get("models", []):
+                        if model.get("size"):
+                            self.sizes.setdefault(model["name"], model["size"])
+        except aiohttp.ClientError:
+            pass
+        await self.sync()
+
+    async def sync(self):
+        # Ollama側の実際の常駐状態に合わせる（/api/ps が無い場合は手元の記録を使い続ける）
+        session = await self.client.start()
+        try:
+            async with session.get(f"{self.base_url}/api/ps") as response:
+                if response.status != 200:
+                    return
+                models = (await response.json()).get("models", [])
+        except aiohttp.ClientError:
+            return
+
+        now = time.monotonic()
+        resident = {}
+        for model in models:
+            model_id = model["name"]
+            size = model.get("size_vram") or model.get("size") or self._size(model_id)
+            self.sizes[model_id] = size
+            previous = self.resident.get(model_id)
+            resident[model_id] = previous or ResidentModel(model_id, size, loaded_at=now, last_used=now)
+            resident[model_id].size = size
+        self.resident = resident
+
+    def plan(self, sequence: List[str]) -> List[TurnPlan]:
+        """ターン順（モデルIDの列）に対する追い出し・先読み計画を作る
+
+        追い出しは「次の使用が最も遅い（または二度と使わない）モデル」を選ぶ（Beladyの方針）。
+        予算に余裕があれば、次のターンのモデルを現在のターン中に先読みする。
+        """
+        resident = list(self.resident)
+        plans: List[TurnPlan] = []
+
+        def next_use(model_id: str, after: int) -> int:
+            for index in range(after + 1, len(sequence)):
+                if sequence[index] == model_id:
+                    return index
+            return len(sequence)
+
+        def make_room(model_id: str, keep: List[str], after: int, before: int) -> Optional[List[str]]:
+            # model_id を載せるための追い出し候補。before より前に使うモデルは追い出さない
+            candidates = [m for m in resident if m not in keep and m != model_id]
+            candidates.sort(key=lambda m: next_use(m, after), reverse=True)
+            evicted: List[str] = []
+            while not self._fits([m for m in resident if m not in evicted] + [model_id]):
+                if not candidates or next_use(candidates[0], after) < before:
+                    return None
+                evicted.append(candidates.pop(0))
+            return evicted
+
+        for index, model_id in enumerate(sequence):
+            plan = TurnPlan(model_id)
+            if model_id not in resident:
+                plan.load = True
+                # 単体で予算を超えるモデルでも、他をすべて追い出してロードはする
+                plan.evict = make_room(model_id, [], index, index) or [m for m in resident if m != model_id]
+                resident = [m for m in resident if m not in plan.evict] + [model_id]
+
+            following = next((m for m in sequence[index + 1:] if m != model_id), None)
+            if following is not None and following not in resident:
+                upcoming = sequence.index(following, index + 1)
+                evict = make_room(following, [model_id], index, upcoming)
+                if evict is not None:
+                    plan.prefetch = following
+                    plan.prefetch_evict = evict
+                    resident = [m for m in resident if m not in evict] + [following]
+            plans.append(plan)
+        return plans
+
+    def warmup_set(self, sequence: List[str]) -> List[str]:
+        # 最初に使われる順に、予算に収まる分だけをプリロード対象にする
+        selected: List[str] = []
+        for model_id in dict.fromkeys(sequence):
+            if self._fits(list(self.resident) + selected + [model_id]):
+                selected.append(model_id)
+            elif not selected:
+                selected.append(model_id)
+        return selected
+
+    async def _load(self, model_id: str) -> WarmupResult:
+        # 空のメッセージ列＋keep_alive でモデルだけをロードさせる
+        payload: Dict[str, Any] = {"model": model_id, "messages": [], "stream": True}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        result = WarmupResult(model_id)
+        session = await self.client.start()
+        stream = self._stream(session, payload)
+        started = time.perf_counter()
+        try:
+            await stream.collect()
+        except (aiohttp.ClientError, OllamaStreamError, asyncio.TimeoutError) as e:
+            self.stats.warmup_errors += 1
+            result.error = str(e) or type(e).__name__
+            return result
+        result.wall_time = time.perf_counter() - started
+        result.load_duration = stream.stats.load_duration if stream.stats else None
+        self.mark_loaded(model_id, result.load_duration)
+        return result
+
+    async def warm_up(self, sequence: List[str]) -> Dict[str, WarmupResult]:
+        """ターン順に使うモデルを並列にプリロードする（失敗してもディベートは続行できる）"""
+        await self.refresh_sizes()
+        targets = [model_id for model_id in self.warmup_set(sequence) if model_id not in self.resident]
+        results = await asyncio.gather(*(self._load(model_id) for model_id in targets))
+        self.stats.warmups += len(targets)
+        warmed = {result.model_id: result for result in results}
+        for model_id in dict.fromkeys(sequence):
+            if model_id in self.resident and model_id not in warmed:
+                warmed[model_id] = WarmupResult(model_id, load_duration=0.0)
+        return warmed
+
+    async def unload(self, model_id: str):
+        payload = {"model": model_id, "messages": [], "stream": True, "keep_alive": 0}
+        session = await self.client.start()
+        try:
+            await self._stream(session, payload).collect()
+        except (aiohttp.ClientError, OllamaStreamError):
+            return
+        self.resident.pop(model_id, None)
+        self.stats.unloads += 1
+
+    async def prepare_turn(self, plan: TurnPlan) -> Optional[asyncio.Task]:
+        # ターン前の追い出しを行い、先読みがあればバックグラウンドで開始してタスクを返す
+        if plan.evict:
+            await asyncio.gather(*(self.unload(model_id) for model_id in plan.evict))
+        if plan.prefetch is None:
+            return None
+
+        async def prefetch():
+            if plan.prefetch_evict:
+                await asyncio.gather(*(self.unload(model_id) for model_id in plan.prefetch_evict))
+            self.stats.prefetches += 1
+            await self._load(plan.prefetch)
+
+        return asyncio.create_task(prefetch())
+
+    def mark_loaded(self, model_id: str, load_duration: Optional[float] = None):
+        now = time.monotonic()
+        if load_duration is not None:
+            self.load_times[model_id] = load_duration
+            self.stats.total_load_time += load_duration
+        entry = self.resident.get(model_id)
+        if entry is None:
+            entry = self.resident[model_id] = ResidentModel(model_id, self._size(model_id), loaded_at=now)
+        entry.last_used = now
+
+    def record_turn(self, model_id: str, stats: Optional[GenerationStats]) -> bool:
+        """ターン完了時に呼ぶ。そのターンがコールドロードを含んでいたかを返す"""
+        load_duration = stats.load_duration if stats else None
+        cold = load_duration is not None and load_duration > COLD_LOAD_THRESHOLD
+        if cold:
+            self.stats.cold_loads += 1
+        self.mark_loaded(model_id, load_duration if cold else None)
+        # Ollamaは空きが無いと最も古いモデルを追い出すので、手元の記録も予算内に揃える
+        while not self._fits(list(self.resident)) and len(self.resident) > 1:
+            oldest = min((m for m in self.resident.values() if m.model_id != model_id),
+                         key=lambda m: m.last_used)
+            self.resident.pop(oldest.model_id)
+        return cold
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.stats
+        return {
+            "memory_budget": self.memory_budget,
+            "resident": [
+                {"model": m.model_id, "size": m.size, "idle": time.monotonic() - m.last_used}
+                for m in self.resident.values()
+            ],
+            "resident_bytes": sum(m.size for m in self.resident.values()),
+            "warmups": stats.warmups,
+            "warmup_errors": stats.warmup_errors,
+            "cold_loads": stats.cold_loads,
+            "prefetches": stats.prefetches,
+            "unloads": stats.unloads,
+            "total_load_time": stats.total_load_time,
+            "load_times": dict(self.load_times)
+        }
@@ -0,0 +1,141 @@
+from typing import Dict, List, Sequence, Tuple
+from dataclasses import dataclass
+
+import numpy as np
+
+_trapezoid = getattr(np, "trapezoid", None) or np.trapz  # NumPy 2.0 で trapz から改名
+
+# MinHash/LSH によるほぼ重複したプロンプトの除去
+# シングルは正規化した文字列の文字 k-gram（空白で区切らない日本語でも同じように働く）
+
+
+@dataclass
+class DedupeStats:
+    prompts: int = 0
+    kept: int = 0
+    dropped: int = 0
+    clusters: int = 0  # 2件以上のプロンプトがまとめられたグループ数
+
+    def estimated_savings(self, generations_per_prompt: int, judge_calls_per_prompt: int) -> Dict[str, int]:
+        return {
+            "generations": self.dropped * generations_per_prompt,
+            "judge_calls": self.dropped * judge_calls_per_prompt
+        }
+
+
+def lsh_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """閾値での偽陽性と偽陰性の面積の和が最小になる (バンド数, 行数) を選ぶ"""
+    similarity = np.linspace(0.0, 1.0, 201)
+    best, best_error = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        candidate = 1.0 - (1.0 - similarity ** rows) ** bands
+        below = similarity <= threshold
+        error = (_trapezoid(candidate[below], similarity[below])
+                 + _trapezoid(1.0 - candidate[~below], similarity[~below]))
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.replace("\x00", " ").lower().split())
+
+
+class NearDuplicateFilter:
+    """Jaccard類似度（の推定値）が threshold 以上のプロンプトを、最初に現れたものだけ残して除く
+
+    署名は全プロンプトをまとめてNumPyで計算する（連結した文字コード列の k-gram ハッシュを
+    置換ごとに変換し、プロンプトごとの最小値を reduceat で取る）。LSHの各バンドで同じバケットに
+    入った組は、バケットの代表と署名の一致率で確かめてからまとめる。
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 5,
+                 seed: int = 0, chunk_chars: int = 1 << 16):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.chunk_chars = chunk_chars
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        rng = np.random.default_rng(seed)
+        # 置換は 2^32 を法とする h(x) = a * x + b（a が奇数なら全単射）。32ビットで計算するので速い
+        self._a = rng.integers(0, 2 ** 32, num_perm, dtype=np.uint32) | np.uint32(1)
+        self._b = rng.integers(0, 2 ** 32, num_perm, dtype=np.uint32)
+        self._powers = np.uint64(1000003) ** np.arange(shingle_size - 1, -1, -1, dtype=np.uint64)
+
+    def _shingle_hashes(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        # (シングルのハッシュ, 各プロンプトの最初のシングルの位置) を返す
+        k = self.shingle_size
+        padded = [text.ljust(k, "\x01") for text in texts]  # k文字未満でもシングルが1つはできる
+        codes = np.frombuffer("\x00".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        windows = np.lib.stride_tricks.sliding_window_view(codes, k)
+        with np.errstate(over="ignore"):
+            hashes = windows @ self._powers
+        hashes = (hashes >> np.uint64(32)).astype(np.uint32) ^ hashes.astype(np.uint32)
+        separators = np.concatenate([[0], np.cumsum(codes == 0)])
+        valid = separators[k:] == separators[:-k]  # 区切り文字を含まない窓
+        segment = separators[:-k][valid]
+        starts = np.searchsorted(segment, np.arange(len(texts)))
+        return hashes[valid], starts
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        texts = [normalize(text) for text in texts]
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        start = 0
+        while start < len(texts):
+            end, chars = start, 0
+            while end < len(texts) and (end == start or chars + len(texts[end]) <= self.chunk_chars):
+                chars += len(texts[end]) + 1
+                end += 1
+            hashes, starts = self._shingle_hashes(texts[start:end])
+            # 置換ごとに1次元の配列で計算する（作業領域がキャッシュに収まる）
+            values = np.empty_like(hashes)
+            for i in range(self.num_perm):
+                np.multiply(hashes, self._a[i], out=values)
+                np.add(values, self._b[i], out=values)
+                signatures[start:end, i] = np.minimum.reduceat(values, starts)
+            start = end
+        return signatures
+
+    def representatives(self, texts: Sequence[str]) -> np.ndarray:
+        """各プロンプトが属するグループの代表（最初に現れたプロンプト）の番号"""
+        n = len(texts)
+        parent = np.arange(n)
+        if n < 2:
+            return parent
+        signatures = self.signatures(texts)
+
+        def root(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        band_powers = np.uint64(0x100000001B3) ** np.arange(self.rows, dtype=np.uint64)
+        for band in range(self.bands):
+            rows = signatures[:, band * self.rows:(band + 1) * self.rows].astype(np.uint64)
+            with np.errstate(over="ignore"):
+                keys = rows @ band_powers
+            order = np.argsort(keys, kind="stable")
+            sorted_keys = keys[order]
+            group_start = np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]])
+            first = order[np.maximum.accumulate(np.where(group_start, np.arange(n), 0))]
+            members = order[first != order]
+            if len(members) == 0:
+                continue
+            leaders = first[first != order]
+            similarity = (signatures[members] == signatures[leaders]).mean(axis=1)
+            for member, leader in zip(members[similarity >= self.threshold].tolist(),
+                                      leaders[similarity >= self.threshold].tolist()):
+                a, b = root(member), root(leader)
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+        return np.array([root(i) for i in range(n)])
+
+    def filter(self, texts: Sequence[str]) -> Tuple[List[str], DedupeStats]:
+        representatives = self.representatives(texts)
+        keep = representatives == np.arange(len(texts))
+        grouped = np.bincount(representatives, minlength=len(texts)) if len(texts) else np.zeros(0, dtype=int)
+        stats = DedupeStats(prompts=len(texts), kept=int(keep.sum()), dropped=int((~keep).sum()),
+                            clusters=int((grouped > 1).sum()))
+        return [text for text, kept in zip(texts, keep.tolist()) if kept], stats
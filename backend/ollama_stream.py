@@ -0,0 +1,196 @@
+import asyncio
+import time
+import aiohttp
+from typing import Any, AsyncIterator, Dict, List, Optional
+from dataclasses import dataclass
+
+from request_scheduler import PRIORITY_INTERACTIVE, RequestScheduler
+
+try:
+    import orjson
+
+    def _loads(data: bytes) -> Any:
+        return orjson.loads(data)
+
+    JSONDecodeError = orjson.JSONDecodeError
+except ImportError:  # orjson is optional; the stdlib decoder also accepts bytes
+    import json
+
+    def _loads(data: bytes) -> Any:
+        return json.loads(data)
+
+    JSONDecodeError = json.JSONDecodeError
+
+
+class OllamaStreamError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class StreamMetrics:
+    ttft: Optional[float] = None  # Time to first token
+    tps: float = 0.0  # Tokens per second
+    total_tokens: int = 0
+    start_time: Optional[float] = None
+    end_time: Optional[float] = None
+
+
+@dataclass
+class GenerationStats:
+    """Ollamaの最終フレーム（done: true）に含まれる統計。時間は秒単位"""
+    done_reason: Optional[str] = None
+    prompt_eval_count: Optional[int] = None
+    prompt_eval_duration: Optional[float] = None
+    eval_count: Optional[int] = None
+    eval_duration: Optional[float] = None
+    load_duration: Optional[float] = None
+    total_duration: Optional[float] = None
+
+    @classmethod
+    def from_frame(cls, frame: Dict[str, Any]) -> "GenerationStats":
+        def seconds(key: str) -> Optional[float]:
+            value = frame.get(key)
+            return value / 1e9 if value is not None else None
+
+        # OpenAI互換エンドポイントは usage のみを返す
+        usage = frame.get("usage") or {}
+        return cls(
+            done_reason=frame.get("done_reason"),
+            prompt_eval_count=frame.get("prompt_eval_count", usage.get("prompt_tokens")),
+            prompt_eval_duration=seconds("prompt_eval_duration"),
+            eval_count=frame.get("eval_count", usage.get("completion_tokens")),
+            eval_duration=seconds("eval_duration"),
+            load_duration=seconds("load_duration"),
+            total_duration=seconds("total_duration"),
+        )
+
+
+class ChatStream:
+    """チャット応答のストリーミングクライアント（Ollama NDJSON / OpenAI互換SSEの両対応）
+
+    async for token in ChatStream(...) でトークンを受け取り、metrics はその場で更新される。
+    ストリーム終了後は final（最終フレーム）と stats を参照できる。
+    scheduler を渡すと、リクエスト前にそのモデル・エンドポイントの実行枠を確保する（待ち時間は queue_wait）。
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, url: str, payload: Dict[str, Any],
+                 headers: Optional[Dict[str, str]] = None, metrics: Any = None,
+                 scheduler: Optional[RequestScheduler] = None, priority: int = PRIORITY_INTERACTIVE,
+                 flow: str = "default"):
+        self.session = session
+        self.url = url
+        self.payload = payload
+        self.headers = headers
+        self.metrics = metrics if metrics is not None else StreamMetrics()
+        self.final: Optional[Dict[str, Any]] = None
+        self.stats: Optional[GenerationStats] = None
+        self.decode_errors = 0
+        self.scheduler = scheduler
+        self.priority = priority
+        self.flow = flow
+        self.queue_wait = 0.0
+
+    def _token_from(self, data: Dict[str, Any]) -> Optional[str]:
+        if data.get("done"):
+            self.final = data
+            return None
+        error = data.get("error")
+        if error:
+            raise OllamaStreamError(error if isinstance(error, str) else str(error))
+        message = data.get("message")
+        if message is not None:
+            return message.get("content")
+        choices = data.get("choices")
+        if choices:
+            choice = choices[0]
+            delta = choice.get("delta") or choice.get("message") or {}
+            if choice.get("finish_reason") is not None:
+                self.final = data
+            return delta.get("content")
+        return None
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        scheduler = self.scheduler
+        model_id = self.payload.get("model", "")
+        if scheduler is not None:
+            # 枠待ちの時間はTTFTに含めない（start_time は枠を確保してから記録する）
+            self.queue_wait = await scheduler.acquire(model_id, self.url, self.priority, self.flow)
+        stream = self._stream()
+        try:
+            async for token in stream:
+                yield token
+        finally:
+            # 途中で打ち切られた場合も内側のストリームを閉じて接続を解放してから枠を返す
+            await stream.aclose()
+            if scheduler is not None:
+                scheduler.release(model_id, self.url)
+
+    async def _stream(self) -> AsyncIterator[str]:
+        metrics = self.metrics
+        perf_counter = time.perf_counter
+        metrics.start_time = perf_counter()
+
+        async with self.session.post(url=self.url, headers=self.headers, json=self.payload) as response:
+            if response.status != 200:
+                body = await response.text()
+                raise OllamaStreamError(f"HTTP {response.status}: {body[:200]}", status=response.status)
+
+            buffer = b""
+            try:
+                # チャンク境界で分断された行は次のチャンクと結合してから解析する
+                async for chunk in response.content.iter_any():
+                    if buffer:
+                        chunk = buffer + chunk
+                    lines = chunk.split(b"\n")
+                    buffer = lines.pop()
+                    for line in lines:
+                        token = self._parse_line(line)
+                        if token:
+                            self._count_token(perf_counter())
+                            yield token
+                if buffer:
+                    token = self._parse_line(buffer)
+                    if token:
+                        self._count_token(perf_counter())
+                        yield token
+            except (asyncio.CancelledError, GeneratorExit):
+                # 停止時は接続ごと閉じ、Ollama側の生成も打ち切らせる
+                response.close()
+                raise
+
+        metrics.end_time = perf_counter()
+        if self.final is not None:
+            self.stats = GenerationStats.from_frame(self.final)
+
+    def _count_token(self, now: float):
+        metrics = self.metrics
+        if metrics.ttft is None:
+            metrics.ttft = now - metrics.start_time
+        metrics.total_tokens += 1
+        elapsed = now - metrics.start_time
+        if elapsed > 0:
+            metrics.tps = metrics.total_tokens / elapsed
+
+    def _parse_line(self, line: bytes) -> Optional[str]:
+        line = line.strip()
+        if not line:
+            return None
+        # OpenAI互換エンドポイントのSSE形式
+        if line.startswith(b"data:"):
+            line = line[5:].lstrip()
+            if line == b"[DONE]":
+                return None
+        try:
+            data = _loads(line)
+        except JSONDecodeError:
+            self.decode_errors += 1
+            return None
+        return self._token_from(data)
+
+    async def collect(self) -> str:
+        parts: List[str] = []
+        async for token in self:
+            parts.append(token)
+        return "".join(parts)
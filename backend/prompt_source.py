@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Set
+
+
+# arena_config.yaml の datasets の各項目から、プロンプトを1件ずつ遅延して読み出す
+# Hugging Face のデータセットはストリーミングで、ローカルファイル（JSONL / Parquet / CSV）は
+# メモリマップして読むので、データセット全体をダウンロード・展開しない
+
+LOCAL_FORMATS = {".jsonl": "jsonl", ".json": "jsonl", ".parquet": "parquet", ".csv": "csv"}
+
+
+def prompt_digest(prompt: str) -> bytes:
+    # 重複判定用。プロンプト本体ではなく16バイトのダイジェストだけを覚える
+    return hashlib.sha256(prompt.encode("utf-8")).digest()[:16]
+
+
+def _iter_jsonl(path: str, field: str) -> Iterator[Any]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for line in iter(mapped.readline, b""):
+                if line.strip():
+                    yield json.loads(line).get(field)
+
+
+def _iter_parquet(path: str, field: str, batch_size: int) -> Iterator[Any]:
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path, memory_map=True)
+    for batch in parquet.iter_batches(batch_size=batch_size, columns=[field]):
+        yield from batch.column(0).to_pylist()
+
+
+def _iter_csv(path: str, field: str) -> Iterator[Any]:
+    import pyarrow as pa
+    import pyarrow.csv as pv
+
+    with pa.memory_map(path) as source:
+        reader = pv.open_csv(source, convert_options=pv.ConvertOptions(include_columns=[field]))
+        for batch in reader:
+            yield from batch.column(0).to_pylist()
+
+
+class PromptSource:
+    """1つのデータセット（HFのデータセット名、またはローカルファイルのパス）のプロンプト列"""
+
+    def __init__(self, name: Optional[str] = None, path: Optional[str] = None, split: str = "train",
+                 field: str = "prompt", limit: Optional[int] = None, subset: Optional[str] = None,
+                 file_format: Optional[str] = None, batch_size: int = 1024):
+        if (name is None) == (path is None):
+            raise ValueError("A prompt source needs either a dataset name or a local path")
+        self.name = name
+        self.path = path
+        self.split = split
+        self.field = field
+        self.limit = limit
+        self.subset = subset
+        self.file_format = file_format
+        self.batch_size = batch_size
+
+    @classmethod
+    def from_config(cls, entry: Dict[str, Any]) -> "PromptSource":
+        return cls(name=entry.get("name") if "path" not in entry else None, path=entry.get("path"),
+                   split=entry.get("split", "train"), field=entry.get("field", "prompt"),
+                   limit=entry.get("limit"), subset=entry.get("subset"), file_format=entry.get("format"))
+
+    @property
+    def label(self) -> str:
+        return self.path or self.name
+
+    def _local_format(self) -> str:
+        if self.file_format:
+            return self.file_format
+        extension = os.path.splitext(self.path)[1].lower()
+        if extension not in LOCAL_FORMATS:
+            raise ValueError(f"Unknown prompt file format: {self.path}")
+        return LOCAL_FORMATS[extension]
+
+    def iter_values(self) -> Iterator[Any]:
+        if self.path is not None:
+            file_format = self._local_format()
+            if file_format == "parquet":
+                return _iter_parquet(self.path, self.field, self.batch_size)
+            if file_format == "csv":
+                return _iter_csv(self.path, self.field)
+            return _iter_jsonl(self.path, self.field)
+
+        from datasets import load_dataset
+
+        dataset = load_dataset(self.name, self.subset, split=self.split, streaming=True)
+        return (row.get(self.field) for row in dataset)
+
+    def __iter__(self) -> Iterator[str]:
+        for value in self.iter_values():
+            if isinstance(value, str) and value.strip():
+                yield value
+
+
+def iter_prompts(sources: Iterable[PromptSource], dedupe: bool = True,
+                 seen: Optional[Set[bytes]] = None) -> Iterator[str]:
+    """各ソースのプロンプトを順に返す。limit は重複を除いたあとの件数に適用する"""
+    seen = set() if seen is None else seen
+    for source in sources:
+        taken = 0
+        if source.limit is not None and source.limit <= 0:
+            continue
+        for prompt in source:
+            if dedupe:
+                digest = prompt_digest(prompt)
+                if digest in seen:
+                    continue
+                seen.add(digest)
+            yield prompt
+            taken += 1
+            if source.limit is not None and taken >= source.limit:
+                break
+
+
+def _take(iterator: Iterator[str], count: int) -> List[str]:
+    chunk = []
+    for item in iterator:
+        chunk.append(item)
+        if len(chunk) >= count:
+            break
+    return chunk
+
+
+async def aiter_prompts(prompts: Iterable[str], chunk_size: int = 64) -> AsyncIterator[str]:
+    """同期のイテレータをスレッドで少しずつ読み進め、イベントループを止めずに返す"""
+    iterator = iter(prompts)
+    while True:
+        chunk = await asyncio.to_thread(_take, iterator, chunk_size)
+        if not chunk:
+            return
+        for prompt in chunk:
+            yield prompt
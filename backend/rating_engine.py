@@ -0,0 +1,124 @@
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+RATING_MODE_SEQUENTIAL = "sequential"  # 通常のElo: 各対戦は直前の対戦で更新されたレーティングを使う
+RATING_MODE_BATCH = "batch"  # 新しい対戦をすべて同じレーティングで評価し、まとめて反映する
+
+
+class EloEngine:
+    """NumPy配列に対戦結果を保持するインクリメンタルなEloエンジン
+
+    対戦は（モデル番号の組, スコア）として事前確保した配列に追記する（足りなければ倍に拡張）。
+    update() は前回以降に追加された対戦だけを反映するので、コストは新しい対戦数に比例する。
+    履歴は（スナップショット数 x モデル数）の事前確保した配列の行として記録する。
+    """
+
+    def __init__(self, model_names: Sequence[str], k_factor: float = 32.0, initial_rating: float = 1000.0,
+                 capacity: int = 1024, history_capacity: int = 64,
+                 initial_ratings: Optional[Sequence[float]] = None):
+        self.model_names = list(model_names)
+        self.index = {name: i for i, name in enumerate(self.model_names)}
+        self.k_factor = k_factor
+        self.ratings = np.full(len(self.model_names), initial_rating, dtype=np.float64)
+        if initial_ratings is not None:
+            self.ratings[:] = initial_ratings
+
+        self.model1 = np.empty(capacity, dtype=np.int32)
+        self.model2 = np.empty(capacity, dtype=np.int32)
+        self.score1 = np.empty(capacity, dtype=np.float32)
+        self.score2 = np.empty(capacity, dtype=np.float32)
+        self.count = 0
+        self.applied = 0
+
+        self._history = np.empty((history_capacity, len(self.model_names)), dtype=np.float64)
+        self._history_len = 0
+        self.snapshot()
+
+    def _reserve(self, needed: int):
+        capacity = len(self.model1)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("model1", "model2", "score1", "score2"):
+            old = getattr(self, name)
+            grown = np.empty(capacity, dtype=old.dtype)
+            grown[:self.count] = old[:self.count]
+            setattr(self, name, grown)
+
+    def add_battle(self, model1: int, model2: int, score1: float, score2: float):
+        self._reserve(self.count + 1)
+        n = self.count
+        self.model1[n] = model1
+        self.model2[n] = model2
+        self.score1[n] = score1
+        self.score2[n] = score2
+        self.count = n + 1
+
+    def add_battles(self, model1: np.ndarray, model2: np.ndarray, score1: np.ndarray, score2: np.ndarray):
+        size = len(model1)
+        self._reserve(self.count + size)
+        end = self.count + size
+        self.model1[self.count:end] = model1
+        self.model2[self.count:end] = model2
+        self.score1[self.count:end] = score1
+        self.score2[self.count:end] = score2
+        self.count = end
+
+    def _actual_scores(self, start: int, end: int) -> np.ndarray:
+        # 審判のスコアを model1 の勝ち分に換算する（両方0点なら引き分け）
+        score1 = self.score1[start:end].astype(np.float64)
+        total = score1 + self.score2[start:end]
+        return np.divide(score1, total, out=np.full_like(score1, 0.5), where=total > 0)
+
+    def update(self, mode: str = RATING_MODE_SEQUENTIAL) -> int:
+        """前回以降に追加された対戦を反映し、反映した件数を返す"""
+        start, end = self.applied, self.count
+        if start == end:
+            return 0
+        actual = self._actual_scores(start, end)
+        model1 = self.model1[start:end]
+        model2 = self.model2[start:end]
+
+        if mode == RATING_MODE_BATCH:
+            expected = 1.0 / (1.0 + 10.0 ** ((self.ratings[model2] - self.ratings[model1]) / 400.0))
+            delta = self.k_factor * (actual - expected)
+            size = len(self.ratings)
+            self.ratings += np.bincount(model1, weights=delta, minlength=size)
+            self.ratings -= np.bincount(model2, weights=delta, minlength=size)
+        else:
+            # 順序に依存するので逐次処理（Pythonのfloatで回した方が速い）
+            ratings = self.ratings.tolist()
+            k = self.k_factor
+            for i, j, s in zip(model1.tolist(), model2.tolist(), actual.tolist()):
+                expected = 1.0 / (1.0 + 10.0 ** ((ratings[j] - ratings[i]) / 400.0))
+                delta = k * (s - expected)
+                ratings[i] += delta
+                ratings[j] -= delta
+            self.ratings[:] = ratings
+
+        self.applied = end
+        return end - start
+
+    def snapshot(self):
+        if self._history_len == len(self._history):
+            grown = np.empty((len(self._history) * 2, len(self.model_names)), dtype=np.float64)
+            grown[:self._history_len] = self._history[:self._history_len]
+            self._history = grown
+        self._history[self._history_len] = self.ratings
+        self._history_len += 1
+
+    @property
+    def history(self) -> np.ndarray:
+        return self._history[:self._history_len]
+
+    def history_by_model(self) -> Dict[str, np.ndarray]:
+        history = self.history
+        return {name: history[:, i] for i, name in enumerate(self.model_names)}
+
+    def rating(self, name: str) -> float:
+        return float(self.ratings[self.index[name]])
+
+    def leaderboard(self) -> List[Dict]:
+        order = np.argsort(-self.ratings)
+        return [{"model_name": self.model_names[i], "elo": float(self.ratings[i])} for i in order]
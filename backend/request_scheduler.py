@@ -0,0 +1,212 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+
+PRIORITY_INTERACTIVE = 0  # ライブのディベート（WebSocket）
+PRIORITY_BATCH = 1  # オフラインのアリーナ実行など
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch"}
+
+
+def endpoint_key(url: str) -> str:
+    # 同じサーバーの /api/chat と /v1/chat/completions は同じ枠を共有する
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}" if parts.netloc else url
+
+
+@dataclass
+class _Waiter:
+    model_id: str
+    endpoint: str
+    priority: int
+    flow: str
+    enqueued_at: float
+    future: asyncio.Future
+
+
+@dataclass
+class WaitStats:
+    granted: int = 0
+    queued: int = 0  # 即座に枠が取れず待たされた回数
+    cancelled: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    def record(self, wait: float):
+        self.granted += 1
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+
+@dataclass
+class SchedulerStats:
+    by_priority: Dict[int, WaitStats] = field(default_factory=dict)
+
+    def for_priority(self, priority: int) -> WaitStats:
+        stats = self.by_priority.get(priority)
+        if stats is None:
+            stats = self.by_priority[priority] = WaitStats()
+        return stats
+
+
+class RequestScheduler:
+    """LLM生成リクエストの全体スケジューラ
+
+    モデルごと・エンドポイントごとの同時実行枠を持ち、空いた枠は優先度の高いクラス
+    （interactive > batch）から割り当てる。同じ優先度の中ではフロー（ディベートやバッチ実行）
+    ごとのキューをラウンドロビンで回し、1つのフローが枠を独占しないようにする。
+    """
+
+    def __init__(self, per_model: int = 2, per_endpoint: int = 4,
+                 model_limits: Optional[Dict[str, int]] = None,
+                 endpoint_limits: Optional[Dict[str, int]] = None):
+        self.per_model = per_model
+        self.per_endpoint = per_endpoint
+        self.model_limits = dict(model_limits or {})
+        self.endpoint_limits = {endpoint_key(url): limit for url, limit in (endpoint_limits or {}).items()}
+        self.model_active: Dict[str, int] = {}
+        self.endpoint_active: Dict[str, int] = {}
+        # 優先度 -> フロー -> 待機キュー（フローの並び順がラウンドロビンの順番）
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Waiter]]"] = {}
+        self.stats = SchedulerStats()
+
+    def _has_capacity(self, model_id: str, endpoint: str) -> bool:
+        return (self.model_active.get(model_id, 0) < self.model_limits.get(model_id, self.per_model)
+                and self.endpoint_active.get(endpoint, 0) < self.endpoint_limits.get(endpoint, self.per_endpoint))
+
+    def _take(self, model_id: str, endpoint: str):
+        self.model_active[model_id] = self.model_active.get(model_id, 0) + 1
+        self.endpoint_active[endpoint] = self.endpoint_active.get(endpoint, 0) + 1
+
+    def _release(self, model_id: str, endpoint: str):
+        self.model_active[model_id] -= 1
+        self.endpoint_active[endpoint] -= 1
+        self._dispatch()
+
+    def _grant(self, waiter: _Waiter):
+        self._take(waiter.model_id, waiter.endpoint)
+        self.stats.for_priority(waiter.priority).record(time.monotonic() - waiter.enqueued_at)
+        waiter.future.set_result(None)
+
+    def _dispatch(self):
+        # 優先度の高い順に、フローを1件ずつ巡回して枠の取れる待機者を起こす
+        blocked_endpoints = set()  # 高い優先度の待機者が残っているエンドポイント
+        for priority in sorted(self._queues):
+            flows = self._queues[priority]
+            progressed = True
+            while flows and progressed:
+                progressed = False
+                for flow in list(flows):
+                    queue = flows[flow]
+                    # キャンセル済み（future が完了済み）の待機者は、自身の acquire() が取り除くので飛ばす
+                    waiter = next((w for w in queue if not w.future.done() and w.endpoint not in blocked_endpoints
+                                   and self._has_capacity(w.model_id, w.endpoint)), None)
+                    if waiter is None:
+                        continue
+                    queue.remove(waiter)
+                    self._grant(waiter)
+                    progressed = True
+                    # 枠を得たフローは順番の最後に回す
+                    flows.move_to_end(flow)
+                    if not queue:
+                        del flows[flow]
+            if not flows:
+                del self._queues[priority]
+            else:
+                blocked_endpoints.update(w.endpoint for queue in flows.values() for w in queue)
+
+    def _queued_ahead(self, priority: int, endpoint: str) -> bool:
+        # 待機者はすべて枠待ちの状態にある（空きがあれば _dispatch で起こされている）ので、
+        # 追い越しを禁じるのは同じエンドポイントの枠を待つ、より高い優先度の待機者だけでよい
+        for queued_priority, flows in self._queues.items():
+            if queued_priority >= priority:
+                continue
+            for queue in flows.values():
+                if any(w.endpoint == endpoint for w in queue):
+                    return True
+        return False
+
+    async def acquire(self, model_id: str, url: str, priority: int = PRIORITY_INTERACTIVE,
+                      flow: str = "default") -> float:
+        """枠を確保するまで待つ。待ち時間（秒）を返す"""
+        endpoint = endpoint_key(url)
+        if self._has_capacity(model_id, endpoint) and not self._queued_ahead(priority, endpoint):
+            self._take(model_id, endpoint)
+            self.stats.for_priority(priority).record(0.0)
+            return 0.0
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(model_id, endpoint, priority, flow, time.monotonic(), loop.create_future())
+        self._queues.setdefault(priority, OrderedDict()).setdefault(flow, deque()).append(waiter)
+        self.stats.for_priority(priority).queued += 1
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 枠を受け取った直後にキャンセルされた場合は返却する
+                self._release(model_id, endpoint)
+            else:
+                self._discard(waiter)
+            self.stats.for_priority(priority).cancelled += 1
+            raise
+        return time.monotonic() - waiter.enqueued_at
+
+    def _discard(self, waiter: _Waiter):
+        flows = self._queues.get(waiter.priority)
+        if not flows or waiter.flow not in flows:
+            return
+        queue = flows[waiter.flow]
+        if waiter in queue:
+            queue.remove(waiter)
+        if not queue:
+            del flows[waiter.flow]
+        if not flows:
+            del self._queues[waiter.priority]
+
+    def release(self, model_id: str, url: str):
+        self._release(model_id, endpoint_key(url))
+
+    @asynccontextmanager
+    async def slot(self, model_id: str, url: str, priority: int = PRIORITY_INTERACTIVE,
+                   flow: str = "default") -> AsyncIterator[float]:
+        wait = await self.acquire(model_id, url, priority, flow)
+        try:
+            yield wait
+        finally:
+            self.release(model_id, url)
+
+    def queue_depth(self) -> Dict[str, int]:
+        return {
+            PRIORITY_NAMES.get(priority, str(priority)): sum(len(queue) for queue in flows.values())
+            for priority, flows in self._queues.items()
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        depth = self.queue_depth()
+        priorities: Dict[str, Any] = {}
+        for priority, stats in sorted(self.stats.by_priority.items()):
+            name = PRIORITY_NAMES.get(priority, str(priority))
+            priorities[name] = {
+                "queue_depth": depth.get(name, 0),
+                "granted": stats.granted,
+                "queued": stats.queued,
+                "cancelled": stats.cancelled,
+                "avg_wait": stats.total_wait / stats.granted if stats.granted else 0.0,
+                "max_wait": stats.max_wait
+            }
+        flows: List[str] = [flow for queues in self._queues.values() for flow in queues]
+        return {
+            "limits": {"per_model": self.per_model, "per_endpoint": self.per_endpoint,
+                       "models": dict(self.model_limits), "endpoints": dict(self.endpoint_limits)},
+            "active": {
+                "models": {k: v for k, v in self.model_active.items() if v},
+                "endpoints": {k: v for k, v in self.endpoint_active.items() if v}
+            },
+            "waiting_flows": len(set(flows)),
+            "priorities": priorities
+        }
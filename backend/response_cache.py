@@ -0,0 +1,214 @@
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from dataclasses import dataclass
+
+
+def content_hash(*parts: Any) -> str:
+    # 順序と型を保ったままJSONに直してハッシュする（dictはキー順を正規化）
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def response_key(endpoint: str, model_id: str, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+    return content_hash("response", endpoint, model_id, prompt, options or {})
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+    errors: int = 0  # ロック待ちのタイムアウトなどで読み書きを諦めた回数
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class SQLiteLRUCache:
+    """SQLiteに保存するキー・値キャッシュ。max_entries を超えたら最後に使われたのが古い順に追い出す
+
+    path に ":memory:" を渡すとプロセス内だけのキャッシュになる。
+    同じファイルを複数のプロセス（シャードのワーカーなど）で共有できる。ロックは timeout 秒まで待ち、
+    ヒット時の last_used の更新は touch_batch 件ずつまとめて書く。それでもロックが取れない場合は
+    キャッシュなしと同じ扱い（読みはミス、書きは捨てる）にして、呼び出し側の処理は止めない。
+    """
+
+    def __init__(self, path: str = ":memory:", table: str = "cache", max_entries: Optional[int] = 100_000,
+                 timeout: float = 30.0, touch_batch: int = 256):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self.stats = CacheStats()
+        self._touched: Dict[str, float] = {}  # まだ書いていない last_used の更新
+        self._conn = sqlite3.connect(path, timeout=timeout)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, tag TEXT, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_used ON {table} (last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _failed(self, error: sqlite3.OperationalError):
+        self._conn.rollback()
+        self.stats.errors += 1
+        print(f"Cache {self.path} ({self.table}) unavailable: {error}")
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            row = self._conn.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        except sqlite3.OperationalError as error:
+            self._failed(error)
+            row = None
+        if row is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        self._touched[key] = time.time()
+        if len(self._touched) >= self.touch_batch:
+            self.flush()
+        return row[0]
+
+    def flush(self):
+        # 溜めた last_used の更新を1回のトランザクションで書く
+        if not self._touched:
+            return
+        touched = [(last_used, key) for key, last_used in self._touched.items()]
+        self._touched.clear()
+        try:
+            self._conn.executemany(f"UPDATE {self.table} SET last_used = ? WHERE key = ?", touched)
+            self._conn.commit()
+        except sqlite3.OperationalError as error:
+            self._failed(error)
+
+    def put(self, key: str, value: str, tag: Optional[str] = None):
+        try:
+            self._put(key, value, tag)
+        except sqlite3.OperationalError as error:
+            self._failed(error)
+
+    def _put(self, key: str, value: str, tag: Optional[str]):
+        self.flush()
+        exists = self._conn.execute(f"SELECT 1 FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, tag, last_used) VALUES (?, ?, ?, ?)",
+            (key, value, tag, time.time())
+        )
+        self.stats.writes += 1
+        if exists is None:
+            self._count += 1
+        if self.max_entries is not None and self._count > self.max_entries:
+            excess = self._count - self.max_entries
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+            self.stats.evictions += excess
+            self._count -= excess
+        self._conn.commit()
+
+    def clear(self):
+        self._touched.clear()
+        self._conn.execute(f"DELETE FROM {self.table}")
+        self._conn.commit()
+        self._count = 0
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "entries": self._count,
+            "max_entries": self.max_entries,
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "hit_rate": self.stats.hit_rate,
+            "writes": self.stats.writes,
+            "evictions": self.stats.evictions,
+            "errors": self.stats.errors
+        }
+
+
+class ResponseCache(SQLiteLRUCache):
+    """アリーナのモデル応答キャッシュ。キーはエンドポイント・モデル・プロンプト・生成オプションのハッシュ"""
+
+    def __init__(self, path: str = ":memory:", max_entries: Optional[int] = 100_000, timeout: float = 30.0):
+        super().__init__(path, table="responses", max_entries=max_entries, timeout=timeout)
+
+    def get_response(self, endpoint: str, model_id: str, prompt: str,
+                     options: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        return self.get(response_key(endpoint, model_id, prompt, options))
+
+    def put_response(self, endpoint: str, model_id: str, prompt: str, response: str,
+                     options: Optional[Dict[str, Any]] = None):
+        self.put(response_key(endpoint, model_id, prompt, options), response, tag=model_id)
+
+
+def verdict_key(judge_model_id: str, prompt: str, response1: str, response2: str,
+                rubric: str = "") -> Tuple[str, bool]:
+    """(キー, 入れ替えたか) を返す。応答のハッシュ順に並べるので (A,B) と (B,A) は同じキーになる"""
+    hash1, hash2 = content_hash(response1), content_hash(response2)
+    swapped = hash1 > hash2
+    if swapped:
+        hash1, hash2 = hash2, hash1
+    return content_hash("verdict", judge_model_id, rubric, content_hash(prompt), hash1, hash2), swapped
+
+
+def list_verdict_key(judge_model_id: str, prompt: str, responses: Sequence[str], rubric: str = "") -> str:
+    # 一覧評価は提示順も評決の一部（位置バイアスがある）なので、順序は正規化しない
+    return content_hash("list-verdict", judge_model_id, rubric, content_hash(prompt),
+                        [content_hash(response) for response in responses])
+
+
+class VerdictCache(SQLiteLRUCache):
+    """審判の評決キャッシュ。正規化した順序で保存し、逆順で引いた場合はスコアを入れ替えて返す
+
+    rubric には審判プロンプトの版などを渡し、評価基準を変えたら別のエントリになるようにする。
+    """
+
+    def __init__(self, path: str = ":memory:", max_entries: Optional[int] = 100_000, timeout: float = 30.0):
+        super().__init__(path, table="verdicts", max_entries=max_entries, timeout=timeout)
+
+    def get_verdict(self, judge_model_id: str, prompt: str, response1: str, response2: str,
+                    rubric: str = "") -> Optional[Tuple[int, int, str]]:
+        key, swapped = verdict_key(judge_model_id, prompt, response1, response2, rubric)
+        value = self.get(key)
+        if value is None:
+            return None
+        score1, score2, explanation = json.loads(value)
+        return (score2, score1, explanation) if swapped else (score1, score2, explanation)
+
+    def put_verdict(self, judge_model_id: str, prompt: str, response1: str, response2: str,
+                    score1: int, score2: int, explanation: str, rubric: str = ""):
+        key, swapped = verdict_key(judge_model_id, prompt, response1, response2, rubric)
+        if swapped:
+            score1, score2 = score2, score1
+        self.put(key, json.dumps([score1, score2, explanation], ensure_ascii=False), tag=judge_model_id)
+
+    def get_list_verdict(self, judge_model_id: str, prompt: str, responses: Sequence[str],
+                         rubric: str = "") -> Optional[Tuple[List[int], str]]:
+        value = self.get(list_verdict_key(judge_model_id, prompt, responses, rubric))
+        if value is None:
+            return None
+        scores, explanation = json.loads(value)
+        return scores, explanation
+
+    def put_list_verdict(self, judge_model_id: str, prompt: str, responses: Sequence[str],
+                         scores: Sequence[int], explanation: str, rubric: str = ""):
+        self.put(list_verdict_key(judge_model_id, prompt, responses, rubric),
+                 json.dumps([list(scores), explanation], ensure_ascii=False), tag=judge_model_id)
@@ -0,0 +1,165 @@
+"""Sharded arena runs: partition prompts across workers and merge their results.
+
+Each worker is `python llm_arena.py <shard> <num_shards>`. It takes the prompts whose hash falls in
+its shard and writes a resumable shard file into sharding.directory (a shared directory when the
+workers run on several machines). The merge reads every shard up to its last checkpoint and
+recomputes Elo ratings, the battle file for bradley_terry.py and the training data (written to
+sharding.output, by default merged.jsonl in the shard directory, not to output.path).
+
+Usage: python sharding.py run <num_shards>   # start the workers locally, then merge
+       python sharding.py merge [directory]
+"""
+import glob
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import yaml
+
+import bradley_terry
+from prompt_source import prompt_digest
+from rating_engine import RATING_MODE_SEQUENTIAL, EloEngine
+from training_writer import TrainingDataWriter
+
+DEFAULT_SHARD_DIRECTORY = "shards"
+MERGED_FILENAME = "merged.jsonl"
+CONFIG_PATH = os.environ.get("LLM_ARENA_CONFIG", "arena_config.yaml")
+
+
+def shard_of(prompt: str, num_shards: int) -> int:
+    # プロンプトのハッシュで決めるので、どのマシンのどのワーカーでも同じ割り当てになる
+    return int.from_bytes(prompt_digest(prompt)[:8], "big") % num_shards
+
+
+def iter_shard(prompts: Iterable[str], shard: int, num_shards: int) -> Iterator[str]:
+    if not 0 <= shard < num_shards:
+        raise ValueError(f"Shard {shard} is out of range for {num_shards} shards")
+    return (prompt for prompt in prompts if shard_of(prompt, num_shards) == shard)
+
+
+def shard_path(directory: str, shard: int, num_shards: int, compress: bool = False) -> str:
+    return os.path.join(directory, f"shard-{shard:03d}-of-{num_shards:03d}.jsonl" + (".gz" if compress else ""))
+
+
+def find_shards(directory: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, "shard-*.jsonl")) + glob.glob(os.path.join(directory, "shard-*.jsonl.gz")))
+
+
+def merge_shards(paths: Sequence[str], model_names: Sequence[str], output_path: Optional[str] = None,
+                 battles_path: Optional[str] = None, rating_mode: str = RATING_MODE_SEQUENTIAL,
+                 k_factor: float = 32.0) -> Tuple[EloEngine, Dict[str, Any]]:
+    """シャードの結果をまとめ、Eloを計算し直したエンジンと集計を返す
+
+    プロンプトはハッシュ順に並べ、各プロンプトの対戦はモデル番号の組の順に反映する。
+    順序がシャードの数や各ワーカーの完了順によらないので、同じ結果からは常に同じレーティングになる。
+    同じプロンプトが複数のシャードにある場合（シャード数を変えて実行し直したなど）は最初のものを使う。
+    """
+    index = {name: i for i, name in enumerate(model_names)}
+    records: Dict[bytes, Dict[str, Any]] = {}
+    duplicates = 0
+    for path in paths:
+        for record in TrainingDataWriter.read_checkpointed(path):
+            key = prompt_digest(record["prompt"])
+            if key in records:
+                duplicates += 1
+                continue
+            records[key] = record
+
+    engine = EloEngine(model_names, k_factor=k_factor, capacity=max(1024, len(records)))
+    writer = TrainingDataWriter(output_path, resume=False) if output_path is not None else None
+    try:
+        for key in sorted(records):
+            record = records[key]
+            battles = []
+            for battle in record.pop("battles", []):
+                if battle["model1"] not in index or battle["model2"] not in index:
+                    raise ValueError(f"Shard battle between unknown models: {battle['model1']}, {battle['model2']}")
+                battles.append((index[battle["model1"]], index[battle["model2"]], battle["score1"], battle["score2"]))
+            battles.sort()
+            if battles:
+                model1, model2, score1, score2 = zip(*battles)
+                engine.add_battles(np.array(model1), np.array(model2), np.array(score1), np.array(score2))
+            if writer is not None:
+                writer.write(record)
+    finally:
+        if writer is not None:
+            writer.close()
+    engine.update(rating_mode)
+    engine.snapshot()
+
+    if battles_path is not None:
+        n = engine.count
+        bradley_terry.save_battles(battles_path, model_names, engine.model1[:n], engine.model2[:n],
+                                   engine.score1[:n], engine.score2[:n])
+    stats = {
+        "shards": len(paths),
+        "prompts": len(records),
+        "battles": engine.count,
+        "duplicate_prompts": duplicates
+    }
+    return engine, stats
+
+
+def launch(num_shards: int, script: Optional[str] = None) -> List[int]:
+    """このマシンでシャードごとにワーカープロセスを起動し、終了コードを返す"""
+    script = script or os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_arena.py")
+    workers = [subprocess.Popen([sys.executable, script, str(shard), str(num_shards)])
+               for shard in range(num_shards)]
+    return [worker.wait() for worker in workers]
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("run", "merge"):
+        print(__doc__)
+        sys.exit(2)
+    with open(CONFIG_PATH, "r") as config_file:
+        config = yaml.safe_load(config_file)
+    sharding_config = config.get("sharding") or {}
+    directory = sharding_config.get("directory", DEFAULT_SHARD_DIRECTORY)
+
+    if sys.argv[1] == "run":
+        num_shards = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+        codes = launch(num_shards)
+        failed = [shard for shard, code in enumerate(codes) if code != 0]
+        if failed:
+            # 完了した分はチェックポイントに残っているので、失敗したシャードだけ実行し直せば再開できる
+            print(f"Shards {failed} failed; rerun them with: python llm_arena.py <shard> {num_shards}")
+            sys.exit(1)
+    elif len(sys.argv) > 2:
+        directory = sys.argv[2]
+
+    paths = find_shards(directory)
+    if not paths:
+        print(f"No shard files in {directory}")
+        sys.exit(1)
+    model_names = [model_config["name"] for model_config in config["models"]]
+    # output.path belongs to single-process runs (which resume from it), so the merge writes its own file
+    compress = (config.get("output") or {}).get("path", "").endswith(".gz")
+    output_path = sharding_config.get("output") or os.path.join(directory, MERGED_FILENAME + (".gz" if compress else ""))
+    started = time.perf_counter()
+    engine, stats = merge_shards(paths, model_names,
+                                 output_path=output_path,
+                                 battles_path="battles.npz",
+                                 rating_mode=config.get("rating_mode", RATING_MODE_SEQUENTIAL))
+    print(f"Merged {stats['prompts']} prompts, {stats['battles']} battles from {stats['shards']} shards "
+          f"({stats['duplicate_prompts']} duplicate prompts, {time.perf_counter() - started:.2f}s) into {output_path}")
+
+    print("\nFinal ELO ratings:")
+    for entry in engine.leaderboard():
+        print(f"{entry['model_name']}: {entry['elo']:.2f}")
+
+    bt_config = config.get("bradley_terry") or {}
+    n = engine.count
+    print("\nBradley-Terry ratings (95% bootstrap CI):")
+    for entry in bradley_terry.leaderboard(model_names, engine.model1[:n], engine.model2[:n],
+                                           engine.score1[:n], engine.score2[:n],
+                                           rounds=bt_config.get("bootstrap_rounds", 1000),
+                                           workers=bt_config.get("workers")):
+        print(bradley_terry.format_entry(entry))
+
+
+if __name__ == "__main__":
+    main()
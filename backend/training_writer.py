@@ -0,0 +1,147 @@
+import gzip
+import io
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, Optional, Set
+
+from response_cache import content_hash
+
+
+class _Prefix(io.RawIOBase):
+    # ファイルの先頭 limit バイトだけを読ませる（チェックポイントより後ろの書きかけを無視する）
+    def __init__(self, raw, limit: int):
+        self.raw = raw
+        self.remaining = limit
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.raw.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+
+class TrainingDataWriter:
+    """アリーナの学習データをプロンプト単位でJSONL（任意でgzip）に追記するライター
+
+    checkpoint_every 件ごとにファイルを fsync し、その時点のバイト位置と件数をマニフェストに
+    原子的に書き出す。再開時はファイルを最後のチェックポイント位置まで切り詰め（途中まで
+    書かれた行を捨てる）、そこまでのレコードから完了済みプロンプトの集合を作り直す。
+    gzip の場合はチェックポイントごとに別のメンバーとして書く（連結したgzipはそのまま読める）。
+    """
+
+    def __init__(self, path: str, compress: Optional[bool] = None, checkpoint_every: int = 50,
+                 resume: bool = True, manifest_path: Optional[str] = None):
+        self.path = path
+        self.compress = path.endswith(".gz") if compress is None else compress
+        self.checkpoint_every = checkpoint_every
+        self.manifest_path = manifest_path or f"{path}.manifest.json"
+        self.completed: Set[str] = set()  # 完了したプロンプトのハッシュ
+        self.records = 0
+        self.resumed_records = 0
+        self._offset = 0
+        self._pending = 0
+        self._member: Optional[gzip.GzipFile] = None
+
+        if resume and os.path.exists(self.manifest_path) and os.path.exists(path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("compress", False) != self.compress:
+                raise ValueError(f"{path} was written with compress={manifest.get('compress')}")
+            self._offset = manifest["offset"]
+            self._file = open(path, "r+b")
+            self._file.truncate(self._offset)
+            self._file.seek(self._offset)
+            for record in self.read(path, self.compress):
+                self.completed.add(content_hash(record["prompt"]))
+                self.records += 1
+            self.resumed_records = self.records
+        else:
+            self._file = open(path, "wb")
+            self._write_manifest()
+
+    @staticmethod
+    def read(path: str, compress: Optional[bool] = None, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        compress = path.endswith(".gz") if compress is None else compress
+        with open(path, "rb") as raw:
+            if limit is not None:
+                raw = io.BufferedReader(_Prefix(raw, limit))
+            stream = gzip.GzipFile(fileobj=raw, mode="rb") if compress else raw
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+
+    @classmethod
+    def read_checkpointed(cls, path: str, manifest_path: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """マニフェストの最後のチェックポイントまでのレコードだけを読む（書き込み中のファイルでもよい）"""
+        with open(manifest_path or f"{path}.manifest.json", "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return cls.read(path, manifest.get("compress", False), limit=manifest["offset"])
+
+    def is_completed(self, prompt: str) -> bool:
+        return content_hash(prompt) in self.completed
+
+    def write(self, record: Dict[str, Any]):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        if self.compress:
+            if self._member is None:
+                self._member = gzip.GzipFile(fileobj=self._file, mode="wb")
+            self._member.write(line)
+        else:
+            self._file.write(line)
+        self.completed.add(content_hash(record["prompt"]))
+        self.records += 1
+        self._pending += 1
+        if self._pending >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        if self._member is not None:
+            # メンバーを閉じるとgzipの末尾が書かれる（下のファイルは閉じない）
+            self._member.close()
+            self._member = None
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._offset = self._file.tell()
+        self._pending = 0
+        self._write_manifest()
+
+    def _write_manifest(self):
+        manifest = {
+            "path": os.path.basename(self.path),
+            "compress": self.compress,
+            "records": self.records,
+            "offset": self._offset,
+            "updated": time.time()
+        }
+        temporary = f"{self.manifest_path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.manifest_path)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.checkpoint()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "compress": self.compress,
+            "records": self.records,
+            "resumed_records": self.resumed_records,
+            "checkpoint_offset": self._offset
+        }
+
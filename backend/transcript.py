@@ -0,0 +1,79 @@
+import asyncio
+import time
+from array import array
+from typing import AsyncGenerator, Iterator, List, Optional, Tuple
+
+
+class TranscriptBuffer:
+    """1ターン分のトークン列。チャンクを一度だけ保持し、文字列は必要になった時に結合する
+
+    各チャンクの開始オフセット（文字数）と受信時刻（バッファ開始からの秒数）を記録するので、
+    結合後もチャンク単位のタイムラインを再生できる。
+    """
+
+    __slots__ = ("_parts", "offsets", "timestamps", "start_time", "_length", "_text")
+
+    def __init__(self, start_time: Optional[float] = None):
+        self._parts: List[str] = []
+        self.offsets = array("q")
+        self.timestamps = array("d")
+        self.start_time = start_time if start_time is not None else time.perf_counter()
+        self._length = 0
+        self._text: Optional[str] = None
+
+    def append(self, chunk: str, timestamp: Optional[float] = None):
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        self._parts.append(chunk)
+        self.offsets.append(self._length)
+        self.timestamps.append(timestamp - self.start_time)
+        self._length += len(chunk)
+        self._text = None
+
+    @property
+    def text(self) -> str:
+        # 結合は1回だけ行い、以後は結合済みの文字列1つだけを保持する
+        if self._text is None:
+            self._text = "".join(self._parts)
+            self._parts = [self._text]
+        return self._text
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        return self.text
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self.offsets)
+
+    @property
+    def duration(self) -> float:
+        return self.timestamps[-1] if self.timestamps else 0.0
+
+    def timeline(self) -> Iterator[Tuple[int, float, str]]:
+        # (オフセット, 経過秒, チャンク) を受信順に返す。チャンクはオフセットから切り出す
+        text = self.text
+        offsets = self.offsets
+        count = len(offsets)
+        for i in range(count):
+            end = offsets[i + 1] if i + 1 < count else self._length
+            yield offsets[i], self.timestamps[i], text[offsets[i]:end]
+
+    def to_dict(self) -> dict:
+        return {
+            "offsets": self.offsets.tolist(),
+            "timestamps": self.timestamps.tolist(),
+        }
+
+    async def replay(self, speed: float = 1.0) -> AsyncGenerator[str, None]:
+        # 元の受信間隔（speed倍速）でチャンクを再生する。speed <= 0 なら待たずに流す
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _, timestamp, chunk in self.timeline():
+            if speed > 0:
+                delay = timestamp / speed - (loop.time() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield chunk
@@ -0,0 +1,136 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+
+# 構造化出力（JSONスキーマ制約）による審判の評決
+# スコアを理由より先に置くので、num_predict で途中で切れてもスコアは取り出せる
+
+MIN_SCORE = 1
+MAX_SCORE = 10
+REASON_MAX_LENGTH = 300
+
+_SCORE = {"type": "integer", "minimum": MIN_SCORE, "maximum": MAX_SCORE}
+_REASON = {"type": "string", "maxLength": REASON_MAX_LENGTH}
+
+PAIRWISE_VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {"score_a": _SCORE, "score_b": _SCORE, "reason": _REASON},
+    "required": ["score_a", "score_b", "reason"]
+}
+
+DEBATE_VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score_a": _SCORE,
+        "score_b": _SCORE,
+        "winner": {"type": "string", "enum": ["A", "B", "tie"]},
+        "reason": _REASON
+    },
+    "required": ["score_a", "score_b", "winner", "reason"]
+}
+
+
+def list_verdict_schema(size: int) -> Dict[str, Any]:
+    return {
+        "type": "object",
+        "properties": {
+            "scores": {"type": "array", "items": _SCORE, "minItems": size, "maxItems": size},
+            "reason": _REASON
+        },
+        "required": ["scores", "reason"]
+    }
+
+
+@dataclass
+class JudgeStats:
+    calls: int = 0  # 審判モデルへのリクエスト数（再試行を含む）
+    verdicts: int = 0  # 解析できた評決
+    cached: int = 0
+    parse_failures: int = 0  # 解析できなかった応答（再試行の対象）
+    request_errors: int = 0  # HTTPエラーやストリームの途中の失敗（これも再試行の対象）
+    retries: int = 0
+    failed: int = 0  # 再試行を使い切っても評決が得られなかった判定
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "verdicts": self.verdicts,
+            "cached": self.cached,
+            "parse_failures": self.parse_failures,
+            "request_errors": self.request_errors,
+            "retries": self.retries,
+            "failed": self.failed
+        }
+
+
+class VerdictParseError(ValueError):
+    pass
+
+
+def _load(text: str) -> Optional[Dict[str, Any]]:
+    # コードブロックや前後の文字が付いていても最初のJSONオブジェクトを読む
+    start = text.find("{")
+    if start < 0:
+        return None
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text[start:])
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def _valid_score(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and MIN_SCORE <= value <= MAX_SCORE
+
+
+def _field_score(text: str, data: Optional[Dict[str, Any]], name: str) -> Optional[int]:
+    if data is not None:
+        value = data.get(name)
+    else:
+        # 途中で切れたJSON
+        match = re.search(rf'"{name}"\s*:\s*(\d+)', text)
+        value = int(match.group(1)) if match else None
+    return value if _valid_score(value) else None
+
+
+def _reason(data: Optional[Dict[str, Any]]) -> str:
+    reason = str(data.get("reason") or "").strip() if data is not None else ""
+    return reason or "No detailed explanation provided."
+
+
+def parse_pairwise_verdict(text: str) -> Optional[Tuple[int, int, str]]:
+    data = _load(text)
+    score_a = _field_score(text, data, "score_a")
+    score_b = _field_score(text, data, "score_b")
+    if score_a is None or score_b is None:
+        return None
+    return score_a, score_b, _reason(data)
+
+
+def parse_list_verdict(text: str, size: int) -> Optional[Tuple[List[int], str]]:
+    data = _load(text)
+    if data is not None:
+        scores = data.get("scores")
+    else:
+        match = re.search(r'"scores"\s*:\s*\[([\d,\s]*)\]', text)
+        scores = [int(value) for value in re.findall(r"\d+", match.group(1))] if match else None
+    if not isinstance(scores, list) or len(scores) != size or not all(_valid_score(score) for score in scores):
+        return None
+    return scores, _reason(data)
+
+
+def parse_debate_verdict(text: str) -> Optional[Dict[str, Any]]:
+    data = _load(text)
+    score_a = _field_score(text, data, "score_a")
+    score_b = _field_score(text, data, "score_b")
+    if score_a is None or score_b is None:
+        return None
+    winner = (data or {}).get("winner")
+    if winner not in ("A", "B", "tie"):
+        winner = "A" if score_a > score_b else "B" if score_b > score_a else "tie"
+    return {
+        "agent_a_score": score_a,
+        "agent_b_score": score_b,
+        "winner": {"A": "agent_a", "B": "agent_b", "tie": "tie"}[winner]
+    }
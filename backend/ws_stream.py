@@ -0,0 +1,264 @@
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from dataclasses import dataclass, asdict
+
+from fastapi import WebSocket
+
+
+STREAM_MODE_COALESCE = "coalesce"
+STREAM_MODE_TOKEN = "token"
+
+
+@dataclass
+class StreamConfig:
+    mode: str = STREAM_MODE_COALESCE
+    flush_interval: float = 0.05  # seconds a token may wait before its frame is sent
+    max_batch_chars: int = 512
+    metrics_interval: float = 0.5  # minimum seconds between metrics updates
+    max_queued_frames: int = 64
+
+    @classmethod
+    def from_message(cls, message: Dict[str, Any]) -> "StreamConfig":
+        # クライアントは start_debate で "stream": {"mode": "token", ...} を指定できる
+        options = message.get("stream") or {}
+        mode = options.get("mode", message.get("stream_mode", STREAM_MODE_COALESCE))
+        if mode == STREAM_MODE_TOKEN:
+            # 従来の1トークン1フレーム配信（メトリクスも毎フレーム）
+            config = cls(mode=STREAM_MODE_TOKEN, flush_interval=0.0, max_batch_chars=0, metrics_interval=0.0)
+        else:
+            config = cls()
+        if "flush_ms" in options:
+            config.flush_interval = max(0.0, float(options["flush_ms"]) / 1000)
+        if "max_batch_chars" in options:
+            config.max_batch_chars = max(0, int(options["max_batch_chars"]))
+        if "metrics_ms" in options:
+            config.metrics_interval = max(0.0, float(options["metrics_ms"]) / 1000)
+        if "max_queued_frames" in options:
+            config.max_queued_frames = max(1, int(options["max_queued_frames"]))
+        return config
+
+
+@dataclass
+class StreamStats:
+    tokens_in: int = 0
+    token_frames: int = 0
+    control_frames: int = 0
+    metrics_frames: int = 0
+    merged_frames: int = 0  # token frames folded together because the client fell behind
+    dropped_tokens: int = 0
+
+
+class _TokenFrame:
+    __slots__ = ("agent", "parts", "chars", "count", "started", "metrics")
+
+    def __init__(self, agent: str, started: float):
+        self.agent = agent
+        self.parts: List[str] = []
+        self.chars = 0
+        self.count = 0
+        self.started = started
+        self.metrics: Optional[Dict[str, Any]] = None
+
+    def to_message(self) -> Dict[str, Any]:
+        message = {
+            "type": "token_stream",
+            "agent": self.agent,
+            "token": "".join(self.parts),
+            "tokens": self.count,
+        }
+        if self.metrics is not None:
+            message["metrics"] = self.metrics
+        return message
+
+
+class StreamSender:
+    """WebSocket送信パイプライン: トークンをフレームにまとめ、遅いクライアントでもモデル側を止めない"""
+
+    def __init__(self, websocket: WebSocket, config: Optional[StreamConfig] = None):
+        self.websocket = websocket
+        self.config = config or StreamConfig()
+        self.stats = StreamStats()
+        self._frames: Deque[Any] = deque()
+        self._pending: Optional[_TokenFrame] = None
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._writer: Optional[asyncio.Task] = None
+        self._last_metrics: Optional[Dict[str, Any]] = None
+        self._last_metrics_at = 0.0
+        self._latest_metrics: Dict[str, Dict[str, Any]] = {}
+        self._queued_chars = 0
+        self.error: Optional[BaseException] = None
+
+    def configure(self, config: StreamConfig):
+        self._flush_pending()
+        self.config = config
+
+    def start(self):
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_loop())
+
+    @property
+    def closed(self) -> bool:
+        return self.error is not None
+
+    @property
+    def backlog_chars(self) -> int:
+        # 未送信のトークン文字数（保留中のフレームを含む）
+        return self._queued_chars + (self._pending.chars if self._pending else 0)
+
+    @property
+    def queued_frames(self) -> int:
+        return len(self._frames)
+
+    def discard_tokens(self) -> int:
+        # 遅いクライアント向け: 未送信のトークンフレームを捨てる（制御メッセージは残す）
+        dropped = self._pending.count if self._pending else 0
+        self._pending = None
+        kept: Deque[Any] = deque()
+        for frame in self._frames:
+            if isinstance(frame, _TokenFrame):
+                dropped += frame.count
+            else:
+                kept.append(frame)
+        self._frames = kept
+        self._queued_chars = 0
+        self.stats.dropped_tokens += dropped
+        if not kept:
+            self._idle.set()
+        return dropped
+
+    def push_token(self, agent: str, token: str, metrics: Optional[Dict[str, Any]] = None):
+        # 同期メソッド: モデルのストリームを決してブロックしない
+        if self.error is not None:
+            return
+        now = time.perf_counter()
+        pending = self._pending
+        if pending is not None and pending.agent != agent:
+            self._flush_pending()
+            pending = None
+        if pending is None:
+            pending = self._pending = _TokenFrame(agent, now)
+            # 書き込みループに時間窓のタイマーを張り直させる
+            self._wakeup.set()
+        pending.parts.append(token)
+        pending.chars += len(token)
+        pending.count += 1
+        self.stats.tokens_in += 1
+        if metrics is not None:
+            self._latest_metrics[agent] = metrics
+
+        if (pending.chars >= self.config.max_batch_chars
+                or now - pending.started >= self.config.flush_interval):
+            self._flush_pending()
+
+    def push(self, message: Dict[str, Any]):
+        if self.error is not None:
+            return
+        if message.get("type") == "token_stream":
+            self.push_token(message["agent"], message.get("token", ""), message.get("metrics"))
+            return
+        # 制御メッセージの前に保留中のトークンを確定させ、順序を保つ
+        self._flush_pending(final=True)
+        self._frames.append(message)
+        self.stats.control_frames += 1
+        self._signal()
+
+    async def send(self, message: Dict[str, Any]):
+        self.push(message)
+        await self.drain()
+
+    async def drain(self):
+        self._flush_pending(final=True)
+        if self._writer is None or self._writer.done():
+            return
+        await self._idle.wait()
+
+    async def close(self):
+        try:
+            await self.drain()
+        finally:
+            if self._writer and not self._writer.done():
+                self._writer.cancel()
+                try:
+                    await self._writer
+                except asyncio.CancelledError:
+                    pass
+
+    def _attach_metrics(self, frame: _TokenFrame, final: bool):
+        metrics = self._latest_metrics.get(frame.agent)
+        if metrics is None or metrics == self._last_metrics:
+            return
+        now = time.perf_counter()
+        if final or now - self._last_metrics_at >= self.config.metrics_interval:
+            frame.metrics = metrics
+            self._last_metrics = metrics
+            self._last_metrics_at = now
+            self.stats.metrics_frames += 1
+
+    def _flush_pending(self, final: bool = False):
+        frame = self._pending
+        if frame is None:
+            return
+        self._pending = None
+        self._attach_metrics(frame, final)
+
+        tail = self._frames[-1] if self._frames else None
+        if (len(self._frames) >= self.config.max_queued_frames
+                and isinstance(tail, _TokenFrame) and tail.agent == frame.agent):
+            # バックプレッシャー: キューが溢れている間は末尾のフレームに結合する（トークンは失わない）
+            tail.parts.extend(frame.parts)
+            tail.chars += frame.chars
+            tail.count += frame.count
+            if frame.metrics is not None:
+                tail.metrics = frame.metrics
+            self.stats.merged_frames += 1
+        else:
+            self._frames.append(frame)
+            self.stats.token_frames += 1
+        self._queued_chars += frame.chars
+        self._signal()
+
+    def _signal(self):
+        self._idle.clear()
+        self._wakeup.set()
+
+    async def _write_loop(self):
+        try:
+            while True:
+                if not self._frames:
+                    self._idle.set()
+                    timeout = self.config.flush_interval if self._pending is not None else None
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        # 時間窓が過ぎた保留トークンを送信する
+                        self._flush_pending()
+                    self._wakeup.clear()
+                    continue
+
+                frame = self._frames.popleft()
+                if isinstance(frame, _TokenFrame):
+                    self._queued_chars -= frame.chars
+                    message = frame.to_message()
+                else:
+                    message = frame
+                await self.websocket.send_text(json.dumps(message, ensure_ascii=False))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 切断などで送信できなくなった場合は以降のフレームを破棄する
+            self.error = e
+            self._frames.clear()
+            self._pending = None
+            self._queued_chars = 0
+            self._idle.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        data = asdict(self.stats)
+        data["mode"] = self.config.mode
+        data["queued_frames"] = len(self._frames)
+        return data
@@ -6,6 +6,7 @@ import { ArenaView } from './components/ArenaView';
 import { useWebSocket } from './hooks/useWebSocket';
 import { useArenaStore } from './stores/arenaStore';
 import { Swords } from 'lucide-react';
+import { AgentType } from './types/arena';
 
 export default function Home() {
   const {
@@ -49,6 +50,24 @@ export default function Home() {
         startDebate();
       }
       
+      // debate_snapshot メッセージの処理（途中参加・遅延時の再同期）
+      else if (message.type === 'debate_snapshot') {
+        const labels: Record<string, AgentType> = { combatant_a: 'A', combatant_b: 'B', judge: 'judge' };
+        if (message.summary.state === 'in_progress') {
+          startDebate();
+        }
+        for (const turn of message.summary.history) {
+          const agent = labels[turn.agent];
+          clearAgentOutput(agent);
+          appendAgentOutput(agent, turn.content);
+        }
+        if (message.current) {
+          setCurrentSpeaker(message.current.agent);
+          clearAgentOutput(message.current.agent);
+          appendAgentOutput(message.current.agent, message.current.content);
+        }
+      }
+      
       // debate_end メッセージの処理
       else if (message.type === 'debate_end') {
         endDebate();
@@ -17,6 +17,8 @@ export interface TokenStreamMessage {
   type: 'token_stream';
   agent: AgentType;
   token: string;
+  // Number of model tokens coalesced into this frame
+  tokens?: number;
   metrics?: DebateMetrics;
 }
 
@@ -32,6 +34,7 @@ export interface TurnEndMessage {
 
 export interface DebateStartedMessage {
   type: 'debate_started';
+  debate_id?: string;
   topic: string;
   agents: {
     combatant_a: string;
@@ -45,6 +48,20 @@ export interface DebateEndedMessage {
   summary: DebateSummary;
 }
 
+export interface DebateSnapshotMessage {
+  type: 'debate_snapshot';
+  debate_id: string;
+  topic: string;
+  agents: {
+    combatant_a: string;
+    combatant_b: string;
+    judge: string;
+  };
+  summary: DebateSummary;
+  current: { agent: AgentType; content: string } | null;
+  spectators: number;
+}
+
 export interface ErrorMessage {
   type: 'error';
   message: string;
@@ -56,6 +73,7 @@ export type WebSocketMessage =
   | TurnEndMessage
   | DebateStartedMessage
   | DebateEndedMessage
+  | DebateSnapshotMessage
   | ErrorMessage;
 
 export interface StartDebateMessage {
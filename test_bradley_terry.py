@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Bradley-Terry leaderboard on runs with and without battles."""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import bradley_terry
+
+MODELS = ["a", "b", "c"]
+
+
+def test_leaderboard_without_battles():
+    empty = np.zeros(0, dtype=np.int64)
+    no_scores = np.zeros(0, dtype=np.float64)
+    board = bradley_terry.leaderboard(MODELS, empty, empty, no_scores, no_scores, rounds=100, workers=1)
+
+    assert [entry["model_name"] for entry in board] == MODELS
+    for entry in board:
+        assert entry["rating"] == bradley_terry.BASE_RATING
+        assert entry["battles"] == 0
+        assert "ci_lower" not in entry
+    assert bradley_terry.format_entry(board[0]) == "a: 1000.00"
+
+
+def test_leaderboard_with_battles():
+    model1 = np.array([0, 0, 1, 0, 2])
+    model2 = np.array([1, 2, 2, 1, 1])
+    score1 = np.array([1.0, 1.0, 0.5, 1.0, 0.0])
+    score2 = 1.0 - score1
+    board = bradley_terry.leaderboard(MODELS, model1, model2, score1, score2, rounds=50, workers=1)
+
+    assert board[0]["model_name"] == "a"
+    for entry in board:
+        assert entry["ci_lower"] <= entry["rating"] <= entry["ci_upper"]
+
+
+if __name__ == "__main__":
+    test_leaderboard_without_battles()
+    test_leaderboard_with_battles()
+    print("ok")
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""Listwise judge lists never leave a model alone in a list."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from llm_arena import ArenaLearning, Endpoint, JudgeModel, Model
+
+ENDPOINT = Endpoint("http://localhost:11434/v1/chat/completions")
+
+
+def make_arena(n_models: int, list_size: int) -> ArenaLearning:
+    models = [Model(str(i), f"model-{i}", ENDPOINT) for i in range(n_models)]
+    return ArenaLearning(models, JudgeModel("judge", "judge", ENDPOINT), judge_mode="listwise", list_size=list_size)
+
+
+def test_odd_model_count_with_pairs():
+    for n_models in (3, 5, 7):
+        arena = make_arena(n_models, list_size=2)
+        for prompt in ("a", "b", "c"):
+            lists = arena.judge_lists(prompt, arena.models)
+            assert all(len(group) == 2 for group in lists)
+            assert {model.name for group in lists for model in group} == {str(i) for i in range(n_models)}
+            assert len(lists) == arena.judge_calls_per_prompt()
+
+
+def test_lists_respect_list_size():
+    for n_models in range(2, 12):
+        for list_size in (3, 4, 5):
+            arena = make_arena(n_models, list_size)
+            lists = arena.judge_lists("prompt", arena.models)
+            assert all(2 <= len(group) <= list_size for group in lists)
+            assert sum(len(group) for group in lists) == n_models
+
+
+if __name__ == "__main__":
+    test_odd_model_count_with_pairs()
+    test_lists_respect_list_size()
+    print("ok")
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Compare per-turn prompt-eval time between legacy and stable prompt modes."""
+
+import asyncio
+import json
+import websockets
+
+ROLES = {
+    "combatant_a": "gemma3:latest",
+    "combatant_b": "qwen3:latest",
+    "judge": "llama3:latest"
+}
+
+
+async def run_debate(prompt_mode: str):
+    uri = "ws://localhost:8000/ws/arena"
+    turns = []
+
+    async with websockets.connect(uri, max_size=None) as websocket:
+        await websocket.send(json.dumps({
+            "action": "start_debate",
+            "topic": "Should AI replace human teachers?",
+            "roles": ROLES,
+            "prompt_mode": prompt_mode
+        }))
+
+        while True:
+            data = json.loads(await asyncio.wait_for(websocket.recv(), timeout=300.0))
+            if data.get("type") == "turn_end":
+                turns.append((data.get("agent"), data.get("prompt_eval") or {}))
+            elif data.get("type") in ("debate_ended", "error", "debate_stopped"):
+                break
+
+    return turns
+
+
+async def compare_prompt_modes():
+    results = {}
+    for prompt_mode in ("legacy", "stable"):
+        print(f"Running debate with prompt_mode={prompt_mode}...")
+        results[prompt_mode] = await run_debate(prompt_mode)
+
+    print(f"\n{'turn':>4} {'agent':>6} | {'legacy tokens':>13} {'legacy s':>9} | {'stable tokens':>13} {'stable s':>9}")
+    for i, (legacy, stable) in enumerate(zip(results["legacy"], results["stable"])):
+        agent, legacy_eval = legacy
+        _, stable_eval = stable
+        print(f"{i + 1:>4} {agent:>6} | "
+              f"{legacy_eval.get('prompt_eval_count') or 0:>13} {legacy_eval.get('prompt_eval_duration') or 0:>9.3f} | "
+              f"{stable_eval.get('prompt_eval_count') or 0:>13} {stable_eval.get('prompt_eval_duration') or 0:>9.3f}")
+
+if __name__ == "__main__":
+    asyncio.run(compare_prompt_modes())